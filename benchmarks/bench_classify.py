@@ -0,0 +1,69 @@
+# benchmarks/bench_classify.py
+"""
+Micro-benchmark: legacy per-keyword substring scan vs compiled RuleMatcher.
+Each rate is the best of REPEATS runs, so a noisy machine shows less spread.
+
+Usage: python -m benchmarks.bench_classify [iterations]
+"""
+import sys
+import timeit
+from core.config_manager import DEFAULT_CONFIG
+from core.processing import VERY_IMPORTANT, IMPORTANT, DISCARD
+
+SAMPLES = [
+    ("GET", "/static/app.js"),
+    ("GET", "/blog/2024/10/some-long-article-title?utm_source=feed"),
+    ("POST", "/api/v1/Account/Settings"),
+    ("POST", "/wp-login.php"),
+    ("GET", "/index.html"),
+    ("HEAD", "/"),
+    ("PUT", "/user/42/profile"),
+    ("POST", "/auth/forgot-password"),
+]
+# Long URIs (tracking query strings, encoded payloads) stress the scan itself
+LONG_SAMPLES = [
+    ("GET", "/blog/2024/10/" + "some-long-article-title-" * 12 + "?utm_source=feed&ref=" + "x" * 200),
+    ("POST", "/api/v1/events?payload=" + "%7B%22a%22%3A1%7D" * 25),
+]
+REPEATS = 7
+
+
+def legacy_classify(config, method, uri):
+    """The old CaddyLog.is_very_important / is_important properties."""
+    if method in config.very_important_methods:
+        for path in config.very_important_paths:
+            if path in uri.lower():
+                return VERY_IMPORTANT
+    if method in config.important_methods:
+        for path in config.important_paths:
+            if path in uri.lower():
+                return IMPORTANT
+    return DISCARD
+
+
+def bench(label, fn, samples, iterations):
+    def run():
+        for method, uri in samples:
+            fn(method, uri)
+
+    best = min(timeit.repeat(run, number=iterations, repeat=REPEATS))
+    rate = iterations * len(samples) / best
+    print(f"{label:<15} {rate:>14,.0f} lines/sec")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    matcher = DEFAULT_CONFIG.matcher
+
+    for method, uri in SAMPLES + LONG_SAMPLES:
+        assert matcher.classify(method, uri) == legacy_classify(
+            DEFAULT_CONFIG, method, uri
+        ), (method, uri)
+
+    for label, samples, n in (("", SAMPLES, iterations), ("long ", LONG_SAMPLES, iterations // 10)):
+        bench(f"{label}legacy", lambda m, u: legacy_classify(DEFAULT_CONFIG, m, u), samples, n)
+        bench(f"{label}compiled", matcher.classify, samples, n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# benchmarks/bench_db_writes.py
+"""
+Compares DBWorker write throughput: commit-per-row vs batched transactions,
+under the "safe" (rollback journal, synchronous=FULL) and "fast" (WAL,
+synchronous=NORMAL) SQLite profiles.
+
+Usage: python -m benchmarks.bench_db_writes [rows]
+"""
+import sys
+import tempfile
+import time
+from core.database import DBWorker
+from core.ingest_queue import LogBatch
+from core.processing import LogRecord
+
+SITES = ["a.example.com", "b.example.com", "c.example.com"]
+
+
+def make_record(i):
+    site = SITES[i % len(SITES)]
+    return LogRecord(
+        site,
+        f"10.0.{i % 256}.{i % 97}",
+        "POST",
+        f"/login?attempt={i}",
+        401,
+        '{"User-Agent": ["bench"]}',
+        "{}",
+        "",
+        '{"Server": ["Caddy"]}',
+        0.0012,
+        site,
+        False,
+        None,
+    )
+
+
+def run(rows, batch_size, profile):
+    with tempfile.TemporaryDirectory() as tmp:
+        # queue_size=0: unbounded, the whole backlog is queued up front
+        worker = DBWorker(
+            db_folder=tmp,
+            rotate_limit=rows + 1,
+            batch_size=batch_size,
+            queue_size=0,
+            sqlite_profile=profile,
+        )
+        for i in range(rows):
+            worker.input_queue.put(LogBatch([make_record(i)]))
+        # Stop marker goes behind the backlog so every row gets written
+        worker.input_queue.put_control(None)
+
+        start = time.perf_counter()
+        worker.start()
+        worker.join()
+        return rows / (time.perf_counter() - start)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    for profile in ("safe", "fast"):
+        for batch_size in (1, 50, 500):
+            rate = run(rows, batch_size, profile)
+            print(f"{profile:<5} batch_size={batch_size:<4} {rate:>12,.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    main()
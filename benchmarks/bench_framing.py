@@ -0,0 +1,57 @@
+# benchmarks/bench_framing.py
+"""
+Feeds multi-megabyte bursts through the old split() framing and LineReader.
+
+Usage: python -m benchmarks.bench_framing [burst_mb] [--single]
+
+--single delivers the whole burst as one chunk (worst case for split()).
+"""
+import sys
+import time
+from core.framing import LineReader
+
+LINE = (
+    b'{"level":"info","logger":"http.log.access","request":{"remote_ip":"10.0.0.1",'
+    b'"method":"GET","host":"example.com","uri":"/index.html","headers":'
+    b'{"User-Agent":["bench"]}},"status":200,"duration":0.001}\n'
+)
+CHUNK_SIZE = 64 * 1024
+
+
+def legacy_frame(chunks):
+    count = 0
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            if line:
+                count += 1
+    return count
+
+
+def reader_frame(chunks):
+    count = 0
+    reader = LineReader()
+    for chunk in chunks:
+        count += len(reader.feed(chunk))
+    return count
+
+
+def main():
+    burst_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    data = LINE * int(burst_mb * 1024 * 1024 / len(LINE))
+    # One big burst, as if the socket had a lot buffered at once
+    chunks = [data[i : i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+    chunks = [b"".join(chunks)] if "--single" in sys.argv else chunks
+
+    for label, fn in (("legacy", legacy_frame), ("LineReader", reader_frame)):
+        start = time.perf_counter()
+        lines = fn(chunks)
+        elapsed = time.perf_counter() - start
+        mb_sec = len(data) / elapsed / 1024 / 1024
+        print(f"{label:<10} {lines:>8} lines {elapsed:>8.3f}s {mb_sec:>10.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
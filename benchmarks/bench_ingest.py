@@ -0,0 +1,210 @@
+# benchmarks/bench_ingest.py
+"""
+End-to-end ingest benchmark: TCP server -> parse -> queue -> SQLite commit ->
+rotation/export -> (fake) Telegram upload, all offline.
+
+A blaster process replays a synthetic corpus over several connections; this
+process runs the real start_server / DBWorkerPool / file_sender_loop. Reports
+lines/sec, p50/p99 ingest-to-commit latency, bytes on the wire and peak RSS.
+
+Usage: python -m benchmarks.bench_ingest [--lines N] [--connections N] [--rate N]
+           [--parse-workers N] [--processes N] [--writers N] [--bulk none|gzip|zstd]
+           [--spool-mb N]
+           [--json out.json] [--baseline old.json]
+With --baseline, exits non-zero if throughput dropped or p99 grew by more
+than --tolerance (default 10%).
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import socket
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+import anyio
+import utils.logger
+from benchmarks import blaster, fake_bot
+
+# Give up waiting for the writers after this many seconds of no progress
+DRAIN_TIMEOUT = 30
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_for_port(port):
+    for _ in range(100):
+        try:
+            stream = await anyio.connect_tcp("127.0.0.1", port)
+        except OSError:
+            await anyio.sleep(0.05)
+            continue
+        await stream.aclose()
+        return
+    raise RuntimeError(f"Server did not come up on port {port}")
+
+
+async def run(args, folder: Path):
+    fake = fake_bot.install(latency=args.telegram_latency)
+
+    # Import after install(): core.bot needs a config module
+    from core.bot import file_sender_loop, setup_bot
+    from core.db_pool import DBWorkerPool
+    from core.outbox import Outbox
+    from core.server import start_server
+    from core.cluster import IngestCluster
+    from core.aggregates import traffic_stats
+    from core.metrics import INGEST_TO_COMMIT_SECONDS, metrics
+
+    metrics.enabled = True
+    pool = DBWorkerPool(
+        writers=args.writers,
+        db_folder=str(folder),
+        rotate_limit=args.rotate_limit,
+        export_compression="gzip",
+        spool_segment_size=args.spool_mb * 1024 * 1024,
+    )
+    outbox = Outbox(str(folder / "outbox.db"))
+    setup_bot(pool, outbox)
+    pool.start()
+
+    port = _free_port()
+    bulk_port = _free_port() if args.bulk else 0
+    executor = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        async with anyio.create_task_group() as tg:
+            if args.processes > 1:
+                cluster = IngestCluster(
+                    args.processes, host="127.0.0.1", port=port, bulk_port=bulk_port
+                )
+                tg.start_soon(cluster.run, pool)
+            else:
+                tg.start_soon(
+                    partial(
+                        start_server,
+                        pool,
+                        host="127.0.0.1",
+                        port=port,
+                        parse_workers=args.parse_workers,
+                        bulk_port=bulk_port,
+                    )
+                )
+            tg.start_soon(file_sender_loop, 1000.0, 1000, 4)
+            await _wait_for_port(bulk_port or port)
+
+            started = time.perf_counter()
+            future = executor.submit(
+                blaster.run,
+                "127.0.0.1",
+                bulk_port or port,
+                args.lines,
+                args.connections,
+                args.rate,
+                args.corpus,
+                args.bulk,
+                hosts=args.hosts,
+                paths=args.paths,
+            )
+            blasted = await anyio.to_thread.run_sync(future.result)
+            sent = blasted["sent"]
+
+            # Done when every line is read and every kept line is committed
+            last_progress, last_rows = time.perf_counter(), -1
+            while True:
+                # Ingest processes report to traffic_stats here, not to their own metrics
+                traffic = traffic_stats.summary("1h").values()
+                received = sum(t["received"] for t in traffic)
+                accepted = sum(t["accepted"] for t in traffic)
+                rows = pool.get_queue_stats()["rows_written"]
+                if received >= sent and rows >= accepted:
+                    break
+                if rows != last_rows:
+                    last_progress, last_rows = time.perf_counter(), rows
+                elif time.perf_counter() - last_progress > DRAIN_TIMEOUT:
+                    raise RuntimeError(f"Stalled: {received}/{sent} read, {rows}/{accepted} rows")
+                await anyio.sleep(0.01)
+            elapsed = time.perf_counter() - started
+            tg.cancel_scope.cancel()
+    finally:
+        executor.shutdown()
+        pool.stop()
+        pool.join()
+        outbox.close()
+
+    return {
+        "lines": sent,
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "lines_per_sec": round(sent / elapsed),
+        "wire_bytes_per_line": round(blasted["bytes"] / sent, 1),
+        "commit_p50_ms": round(INGEST_TO_COMMIT_SECONDS.quantile(0.50) * 1000, 2),
+        "commit_p99_ms": round(INGEST_TO_COMMIT_SECONDS.quantile(0.99) * 1000, 2),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "telegram_messages": fake.messages,
+        "telegram_documents": fake.documents,
+    }
+
+
+def compare(result, baseline, tolerance):
+    """Returns a list of regressions against a previous --json result."""
+    problems = []
+    if result["lines_per_sec"] < baseline["lines_per_sec"] * (1 - tolerance):
+        problems.append(
+            f"throughput {result['lines_per_sec']:,} < baseline {baseline['lines_per_sec']:,}"
+        )
+    if result["commit_p99_ms"] > baseline["commit_p99_ms"] * (1 + tolerance):
+        problems.append(
+            f"p99 {result['commit_p99_ms']}ms > baseline {baseline['commit_p99_ms']}ms"
+        )
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0, help="lines/sec, 0 = max")
+    parser.add_argument("--corpus", help="replay this file instead of generating")
+    parser.add_argument("--hosts", type=int, default=10)
+    parser.add_argument("--paths", type=int, default=1000)
+    parser.add_argument("--parse-workers", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=1, help="ingest processes")
+    parser.add_argument("--writers", type=int, default=1)
+    parser.add_argument("--bulk", choices=("none", "gzip", "zstd"), help="send bulk frames")
+    parser.add_argument("--rotate-limit", type=int, default=10000)
+    parser.add_argument("--spool-mb", type=int, default=0, help="spool segment size, 0 = off")
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--json", help="write the result here")
+    parser.add_argument("--baseline", help="compare with a previous --json result")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    # Keep per-line VIP/IMP logging out of the measurement
+    utils.logger.DEBUG_MODE = False
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = anyio.run(run, args, Path(tmp))
+
+    for key, value in result.items():
+        print(f"{key:<20} {value:>12,}" if isinstance(value, int) else f"{key:<20} {value:>12}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2))
+
+    if args.baseline:
+        problems = compare(result, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
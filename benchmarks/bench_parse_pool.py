@@ -0,0 +1,53 @@
+# benchmarks/bench_parse_pool.py
+"""
+Parse/classify throughput inline vs. a process pool at 1, 2, 4 and 8 workers
+(the same parse_batch entry point ParsePool submits to).
+
+Usage: python -m benchmarks.bench_parse_pool [lines]
+"""
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from core.pipeline import parse_batch
+from benchmarks.corpus import generate
+import utils.logger
+
+BATCH = 256
+
+
+def _quiet():
+    # Keep per-line VIP/IMP logging out of the measurement
+    utils.logger.DEBUG_MODE = False
+
+
+def run_pool(workers, batches):
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_quiet) as pool:
+        # Warm up so process start-up is not measured
+        list(pool.map(parse_batch, batches[:workers]))
+        start = time.perf_counter()
+        for _ in pool.map(parse_batch, batches):
+            pass
+        return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    _quiet()
+
+    lines = generate(count)
+    batches = [lines[i : i + BATCH] for i in range(0, len(lines), BATCH)]
+
+    start = time.perf_counter()
+    for batch in batches:
+        parse_batch(batch)
+    print(f"inline     {count / (time.perf_counter() - start):>12,.0f} lines/sec")
+
+    for workers in (1, 2, 4, 8):
+        elapsed = run_pool(workers, batches)
+        print(f"workers={workers:<2} {count / elapsed:>12,.0f} lines/sec")
+
+
+if __name__ == "__main__":
+    main()
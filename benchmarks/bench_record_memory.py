@@ -0,0 +1,114 @@
+# benchmarks/bench_record_memory.py
+"""
+Memory held per queued log record and allocations made per parsed line,
+measured with tracemalloc over parse_batch output. The "legacy" rows rebuild
+the representation LogRecord replaced: a dict task per line wrapping a row
+tuple whose headers, body and resp_headers were re-encoded with json.dumps.
+
+Usage: python -m benchmarks.bench_record_memory [lines]
+"""
+import gc
+import json
+import sys
+import tracemalloc
+import utils.logger
+from core.config_manager import config_manager
+from core.pipeline import parse_batch, site_name
+from core.processing import DISCARD, VERY_IMPORTANT, format_preview, loads
+from benchmarks.corpus import generate
+
+
+def legacy_task(line: bytes):
+    """One line as the old CaddyLog.to_tuple() task dict, or None if discarded."""
+    data = loads(line)
+    req = data.get("request", {})
+    host = site_name(req.get("host", "unknown"))
+    method = req.get("method", "")
+    uri = req.get("uri", "")
+    level = config_manager.get_config(host).matcher.classify(method, uri)
+    if level == DISCARD:
+        return None
+    status = data.get("status", 0)
+    cookies = req.get("headers", {}).get("Cookie", [])
+    if isinstance(cookies, list):
+        cookies = "; ".join(cookies)
+    vip = level == VERY_IMPORTANT
+    return {
+        "type": "log",
+        "site": host,
+        "data": (
+            req.get("host", "unknown"),
+            req.get("remote_ip", ""),
+            method,
+            uri,
+            status,
+            json.dumps(req.get("headers", {})),
+            json.dumps(data.get("request_body", {})),
+            cookies,
+            json.dumps(data.get("resp_headers", {})),
+            data.get("duration", 0),
+        ),
+        "vip": vip,
+        "preview": format_preview(status, method, uri, req.get("remote_ip", "")) if vip else None,
+    }
+
+
+def legacy_batch(lines):
+    tasks = []
+    for line in lines:
+        task = legacy_task(line)
+        if task is not None:
+            tasks.append(task)
+    return tasks
+
+
+def current_batch(lines):
+    return parse_batch(lines)[0]
+
+
+def measure(label, parse, lines):
+    parse(lines[:100])  # Warm caches (regexes, configs, shared strings) outside the trace
+    gc.collect()
+
+    # Retained: what the parsed records keep alive while they sit in the queue
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    records = parse(lines)
+    after = tracemalloc.take_snapshot()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n = len(records)
+    live_blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    del records, before, after
+    gc.collect()
+
+    # Transient: median peak footprint of parsing one line, above what was
+    # already allocated before it
+    peaks = []
+    tracemalloc.start()
+    for line in lines[:2000]:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        parse([line])
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    peak = sorted(peaks)[len(peaks) // 2]
+
+    print(
+        f"{label:<8} {n:>8,} records  {retained / n:>7,.0f} B/record  "
+        f"{live_blocks / n:>5.1f} blocks/record  {peak:>7,} peak B/line"
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    utils.logger.DEBUG_MODE = False
+
+    # Everything important so every line becomes a record
+    lines = generate(count, hosts=3, important_ratio=0.99)
+    measure("legacy", legacy_batch, lines)
+    measure("current", current_batch, lines)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# benchmarks/bench_snapshot.py
+"""
+Write latency while a snapshot of a large site DB is being taken.
+
+Fills one site DB, then keeps writing batches while /getdb-style snapshots
+run on the export thread, and reports per-transaction write latency.
+
+Usage: python -m benchmarks.bench_snapshot [rows]
+"""
+import sys
+import tempfile
+import time
+from core.database import DBWorker
+from core.ingest_queue import LogBatch
+from benchmarks.bench_db_writes import make_record
+
+SITE = "a.example.com"
+
+
+def site_batch(start, n):
+    # make_record cycles through three sites; multiples of 3 all land on SITE
+    return LogBatch([make_record(i * 3) for i in range(start, start + n)])
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    with tempfile.TemporaryDirectory() as tmp:
+        worker = DBWorker(db_folder=tmp, rotate_limit=rows * 10, queue_size=0)
+        for i in range(0, rows, 500):
+            worker.input_queue.put(site_batch(i, min(500, rows - i)))
+        worker.start()
+        while worker.input_queue.records:
+            time.sleep(0.1)
+        time.sleep(0.2)
+
+        baseline = worker.get_queue_stats()
+        worker.write_latency_max = 0.0
+        worker.request_snapshot(SITE)
+
+        # Trickle writes while the snapshot copies
+        started = time.perf_counter()
+        while worker.notification_queue.empty():
+            worker.input_queue.put(site_batch(0, 50))
+            time.sleep(0.01)
+        snapshot_secs = time.perf_counter() - started
+
+        stats = worker.get_queue_stats()
+        worker.stop()
+        worker.join()
+
+    print(f"rows in DB:            {rows:,}")
+    print(f"snapshot duration:     {snapshot_secs:.2f}s")
+    print(f"write ms avg (before): {baseline['write_ms_avg']}")
+    print(f"write ms max (during): {stats['write_ms_max']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# benchmarks/bench_storage.py
+"""
+On-disk size and insert throughput: plain vs compact storage format.
+
+Usage: python -m benchmarks.bench_storage [lines]
+"""
+import os
+import sys
+import tempfile
+import time
+import utils.logger
+from core.database import DBWorker
+from core.ingest_queue import LogBatch
+from core.pipeline import parse_batch
+from benchmarks.corpus import generate
+
+
+def run(records, storage_format):
+    with tempfile.TemporaryDirectory() as tmp:
+        worker = DBWorker(
+            db_folder=tmp,
+            rotate_limit=len(records) + 1,
+            queue_size=0,
+            storage_format=storage_format,
+        )
+        worker.input_queue.put(LogBatch(records))
+        worker.input_queue.put_control(None)
+
+        start = time.perf_counter()
+        worker.start()
+        worker.join()
+        elapsed = time.perf_counter() - start
+
+        size = sum(
+            os.path.getsize(os.path.join(tmp, name))
+            for name in os.listdir(tmp)
+            if name.endswith(".db")
+        )
+        return len(records) / elapsed, size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    utils.logger.DEBUG_MODE = False
+
+    # Everything important so most lines become rows
+    records, _, _ = parse_batch(generate(count, hosts=3, important_ratio=0.9))
+    print(f"{len(records)} rows")
+    for storage_format in ("plain", "compact"):
+        rate, size = run(records, storage_format)
+        print(
+            f"{storage_format:<8} {rate:>10,.0f} rows/sec "
+            f"{size / 1024 / 1024:>8.2f} MiB ({size / len(records):,.0f} B/row)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# benchmarks/blaster.py
+"""
+Multi-connection TCP load generator for the log ingest port.
+
+Replays a corpus as fast as possible (rate 0) or at a fixed total rate in
+lines/sec, spread over several connections. With a codec ("none", "gzip",
+"zstd") it sends bulk frames of FRAME_LINES lines to a BULK_PORT instead.
+
+Usage: python -m benchmarks.blaster [host] [port] [lines] [connections] [rate] [corpus.log] [codec]
+"""
+import sys
+import time
+import anyio
+from core.framing import CODECS, encode_frame
+from benchmarks.corpus import generate, read_corpus
+
+# Lines per socket write
+CHUNK_LINES = 64
+# Lines per bulk frame
+FRAME_LINES = 2000
+# Rate-limited senders wake up this often
+TICK = 0.01
+
+
+def _chunks(lines, codec):
+    """(payload, line count) pairs, encoded before the clock starts."""
+    if codec is None:
+        return [
+            (b"\n".join(lines[i : i + CHUNK_LINES]) + b"\n", len(lines[i : i + CHUNK_LINES]))
+            for i in range(0, len(lines), CHUNK_LINES)
+        ]
+    return [
+        (encode_frame(lines[i : i + FRAME_LINES], CODECS[codec]), len(lines[i : i + FRAME_LINES]))
+        for i in range(0, len(lines), FRAME_LINES)
+    ]
+
+
+async def _send(host, port, lines, rate, stats, codec=None):
+    chunks = _chunks(lines, codec)
+    async with await anyio.connect_tcp(host, port) as stream:
+        started = time.perf_counter()
+        sent = 0
+        for chunk, count in chunks:
+            if rate:
+                # Sleep until this chunk is due at `rate` lines/sec
+                due = started + sent / rate
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await anyio.sleep(max(delay, TICK))
+            await stream.send(chunk)
+            sent += count
+            stats["bytes"] += len(chunk)
+        if codec is not None:
+            # Closing with acks unread would reset the connection and lose frames
+            acks = 0
+            while acks < len(chunks):
+                acks += len(await stream.receive())
+    stats["sent"] += sent
+
+
+async def blast(host, port, lines, connections=4, rate=0, codec=None):
+    """Sends `lines` split round-robin over `connections`. Returns stats."""
+    stats = {"sent": 0, "bytes": 0}
+    per_conn_rate = rate / connections if rate else 0
+    started = time.perf_counter()
+    async with anyio.create_task_group() as tg:
+        for n in range(connections):
+            tg.start_soon(_send, host, port, lines[n::connections], per_conn_rate, stats, codec)
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def run(
+    host, port, count=100000, connections=4, rate=0, corpus=None, codec=None, **generate_kwargs
+):
+    """Process entry point: builds (or loads) the corpus, then blasts it."""
+    lines = read_corpus(corpus) if corpus else generate(count, **generate_kwargs)
+    return anyio.run(blast, host, port, lines, connections, rate, codec)
+
+
+def main():
+    args = sys.argv[1:]
+    host = args[0] if len(args) > 0 else "127.0.0.1"
+    port = int(args[1]) if len(args) > 1 else 9000
+    count = int(args[2]) if len(args) > 2 else 100000
+    connections = int(args[3]) if len(args) > 3 else 4
+    rate = float(args[4]) if len(args) > 4 else 0
+    corpus = args[5] if len(args) > 5 and args[5] != "-" else None
+    codec = args[6] if len(args) > 6 else None
+
+    stats = run(host, port, count, connections, rate, corpus, codec)
+    print(
+        f"Sent {stats['sent']:,} lines ({stats['bytes']:,} bytes) over {connections} "
+        f"connection(s) in {stats['seconds']:.2f}s "
+        f"({stats['sent'] / stats['seconds']:,.0f} lines/sec)"
+    )
+
+
+if __name__ == "__main__":
+    main()
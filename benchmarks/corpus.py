@@ -0,0 +1,139 @@
+# benchmarks/corpus.py
+"""
+Synthetic Caddy JSON access log lines for benchmarks.
+
+Write a replayable corpus file (one line per log):
+    python -m benchmarks.corpus out.log [lines] [hosts]
+"""
+import itertools
+import json
+import random
+import sys
+
+IMPORTANT_URIS = ["/admin", "/dashboard", "/user/42/settings", "/checkout", "/index"]
+VIP_URIS = ["/login", "/wp-login.php", "/auth/sign-in", "/account/reset"]
+BORING_URIS = [
+    "/",
+    "/blog/2024/10/an-article",
+    "/static/app.js",
+    "/images/logo.png",
+    "/feed.xml",
+    "/about",
+]
+STATUSES = [200, 200, 200, 301, 304, 401, 403, 404, 500]
+
+
+def zipf_weights(n, skew):
+    """Cumulative weights for rng.choices: rank k gets 1/k**skew (0 = uniform)."""
+    return list(itertools.accumulate(1 / (k**skew) for k in range(1, n + 1)))
+
+
+def make_line(
+    rng: random.Random,
+    host: str,
+    vip_ratio=0.01,
+    important_ratio=0.1,
+    boring_uris=BORING_URIS,
+    boring_weights=None,
+) -> bytes:
+    roll = rng.random()
+    if roll < vip_ratio:
+        method, uri = "POST", rng.choice(VIP_URIS)
+    elif roll < vip_ratio + important_ratio:
+        method, uri = rng.choice(["GET", "POST"]), rng.choice(IMPORTANT_URIS)
+    else:
+        method = "GET"
+        uri = rng.choices(boring_uris, cum_weights=boring_weights)[0]
+
+    ip = f"203.0.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+    record = {
+        "level": "info",
+        "ts": 1700000000.0 + rng.random() * 86400,
+        "logger": "http.log.access.log0",
+        "msg": "handled request",
+        "request": {
+            "remote_ip": ip,
+            "remote_port": str(rng.randrange(1024, 65535)),
+            "client_ip": ip,
+            "proto": "HTTP/2.0",
+            "method": method,
+            "host": host,
+            "uri": uri + (f"?q={rng.randrange(10**6)}" if rng.random() < 0.3 else ""),
+            "headers": {
+                "User-Agent": [
+                    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+                    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+                ],
+                "Accept": ["text/html,application/xhtml+xml,*/*;q=0.8"],
+                "Accept-Encoding": ["gzip, deflate, br"],
+                "Accept-Language": ["en-US,en;q=0.9"],
+                "Cookie": [f"session={rng.getrandbits(64):x}"],
+            },
+            "tls": {"resumed": False, "version": 772, "server_name": host},
+        },
+        "bytes_read": 0,
+        "user_id": "",
+        "duration": rng.random() / 10,
+        "size": rng.randrange(100, 50000),
+        "status": rng.choice(STATUSES),
+        "resp_headers": {
+            "Server": ["Caddy"],
+            "Content-Type": ["text/html; charset=utf-8"],
+        },
+    }
+    if method == "POST":
+        record["request_body"] = f"username=user{rng.randrange(1000)}&password=x"
+    # Caddy emits compact JSON
+    return json.dumps(record, separators=(",", ":")).encode()
+
+
+def generate(
+    count,
+    hosts=10,
+    vip_ratio=0.01,
+    important_ratio=0.1,
+    seed=1,
+    host_skew=0.0,
+    paths=0,
+    path_skew=1.0,
+):
+    """
+    Returns a list of `count` raw log lines (without trailing newlines).
+    host_skew / path_skew are Zipf exponents (0 = uniform); paths > 0 adds
+    that many distinct boring pages on top of BORING_URIS.
+    """
+    rng = random.Random(seed)
+    host_names = [f"site{i}.example.com" for i in range(hosts)]
+    host_weights = zipf_weights(hosts, host_skew)
+    boring = BORING_URIS + [f"/page/{i}" for i in range(paths)]
+    boring_weights = zipf_weights(len(boring), path_skew) if paths else None
+    return [
+        make_line(
+            rng,
+            rng.choices(host_names, cum_weights=host_weights)[0],
+            vip_ratio,
+            important_ratio,
+            boring,
+            boring_weights,
+        )
+        for _ in range(count)
+    ]
+
+
+def write_corpus(path, lines):
+    with open(path, "wb") as f:
+        for line in lines:
+            f.write(line + b"\n")
+
+
+def read_corpus(path):
+    with open(path, "rb") as f:
+        return [line.rstrip(b"\n") for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    out = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    hosts = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    write_corpus(out, generate(count, hosts=hosts, paths=1000))
+    print(f"Wrote {count} lines for {hosts} hosts to {out}")
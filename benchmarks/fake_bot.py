@@ -0,0 +1,45 @@
+# benchmarks/fake_bot.py
+"""Offline stand-in for the Telegram bot, so core.bot runs without network."""
+import os
+import sys
+import types
+import anyio
+
+
+class FakeBot:
+    """Accepts the aiogram calls core.bot makes and records them."""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.messages = 0
+        self.documents = 0
+        self.document_bytes = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await anyio.sleep(self.latency)
+        self.messages += 1
+
+    async def send_document(self, chat_id, document, caption=None, **kwargs):
+        await anyio.sleep(self.latency)
+        self.documents += 1
+        self.document_bytes += os.path.getsize(document.path)
+
+
+def install(latency=0.05) -> FakeBot:
+    """
+    Makes core.bot importable without a config.py and swaps its Bot for a
+    FakeBot. Call before anything imports core.bot.
+    """
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        config = types.ModuleType("config")
+        config.BOT_TOKEN = "123456:offline-benchmark-token"
+        config.ADMIN_ID = 1
+        sys.modules["config"] = config
+
+    import core.bot
+
+    fake = FakeBot(latency)
+    core.bot.bot = fake
+    return fake
@@ -0,0 +1,256 @@
+# core/aggregates.py
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+from core.processing import LogRecord
+
+# Rings of time slots, as (slot seconds, slots); each line updates one slot per ring
+RINGS = {
+    "fine": (10, 6),
+    "coarse": (60, 60),
+}
+
+# Window name -> (ring, most recent slots it covers)
+WINDOWS = {
+    "1m": ("fine", 6),
+    "5m": ("coarse", 5),
+    "1h": ("coarse", 60),
+}
+
+# Tracked keys per slot for top IPs / paths
+TOP_CAPACITY = 64
+
+# Latency histogram: log-scale bins from 0.1 ms, each 25% wider than the last
+_LATENCY_MIN = 0.0001
+_LATENCY_GROWTH = math.log(1.25)
+_LATENCY_BINS = 80
+
+COUNTERS = ("received", "accepted", "discarded", "vip")
+
+# Host headers are client-controlled; sites beyond this share one entry
+MAX_SITES = 1000
+OTHER_SITE = "(other)"
+
+
+def _latency_bin(seconds: float) -> int:
+    if seconds <= _LATENCY_MIN:
+        return 0
+    return min(int(math.log(seconds / _LATENCY_MIN) / _LATENCY_GROWTH) + 1, _LATENCY_BINS - 1)
+
+
+def _bin_upper(index: int) -> float:
+    return _LATENCY_MIN * math.exp(index * _LATENCY_GROWTH)
+
+
+class SpaceSaving:
+    """
+    Space-saving top-k counter (Metwally et al.) on a stream-summary layout:
+    counts map to insertion-ordered buckets of keys, so increments and
+    evictions are O(1). Counts overestimate by at most the evicted minimum.
+    """
+
+    __slots__ = ("capacity", "counts", "buckets", "min_count")
+
+    def __init__(self, capacity=TOP_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.buckets: Dict[int, Dict[str, None]] = {}
+        self.min_count = 0
+
+    def add(self, key):
+        counts = self.counts
+        count = counts.get(key)
+        if count is not None:
+            bucket = self.buckets[count]
+            del bucket[key]
+            if not bucket:
+                del self.buckets[count]
+                if count == self.min_count:
+                    self.min_count = count + 1
+        elif len(counts) < self.capacity:
+            count = 0
+            self.min_count = 1
+        else:
+            # Replace the oldest key with the smallest count; the newcomer inherits it
+            count = self.min_count
+            bucket = self.buckets[count]
+            evicted = next(iter(bucket))
+            del bucket[evicted]
+            del counts[evicted]
+            if not bucket:
+                del self.buckets[count]
+                self.min_count = count + 1
+
+        count += 1
+        counts[key] = count
+        self.buckets.setdefault(count, {})[key] = None
+
+
+class _Slot:
+    __slots__ = ("epoch", "counters", "statuses", "latency", "ips", "paths")
+
+    def __init__(self):
+        self.reset(-1)
+
+    def reset(self, epoch):
+        self.epoch = epoch
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.statuses: Dict[int, int] = {}
+        self.latency = [0] * _LATENCY_BINS
+        self.ips = SpaceSaving()
+        self.paths = SpaceSaving()
+
+
+class _Ring:
+    __slots__ = ("slot_seconds", "slots")
+
+    def __init__(self, slot_seconds, size):
+        self.slot_seconds = slot_seconds
+        self.slots = [_Slot() for _ in range(size)]
+
+    def current(self, now) -> _Slot:
+        epoch = int(now // self.slot_seconds)
+        slot = self.slots[epoch % len(self.slots)]
+        if slot.epoch != epoch:
+            slot.reset(epoch)
+        return slot
+
+    def live(self, now, count) -> List[_Slot]:
+        oldest = int(now // self.slot_seconds) - count + 1
+        return [slot for slot in self.slots if slot.epoch >= oldest]
+
+
+class SiteAggregates:
+    """Rolling 1m / 5m / 1h windows for one site."""
+
+    __slots__ = ("rings",)
+
+    def __init__(self):
+        self.rings = {name: _Ring(seconds, size) for name, (seconds, size) in RINGS.items()}
+
+    def count(self, now, counter, n=1):
+        for ring in self.rings.values():
+            ring.current(now).counters[counter] += n
+
+    def record(self, now, remote_ip, uri, status, duration, vip):
+        """One accepted log line. O(1): one slot update per ring."""
+        path = uri.split("?", 1)[0]
+        # None when the line had no usable duration: counted, but not timed
+        latency_bin = _latency_bin(duration) if duration is not None else None
+        for ring in self.rings.values():
+            slot = ring.current(now)
+            counters = slot.counters
+            counters["received"] += 1
+            counters["accepted"] += 1
+            if vip:
+                counters["vip"] += 1
+            slot.statuses[status] = slot.statuses.get(status, 0) + 1
+            if latency_bin is not None:
+                slot.latency[latency_bin] += 1
+            slot.ips.add(remote_ip)
+            slot.paths.add(path)
+
+    def summary(self, window: str, now: float, top: int = 5) -> dict:
+        ring, count = WINDOWS[window]
+        slots = self.rings[ring].live(now, count)
+        counters = dict.fromkeys(COUNTERS, 0)
+        statuses: Dict[int, int] = {}
+        latency = [0] * _LATENCY_BINS
+        ips: Dict[str, int] = {}
+        paths: Dict[str, int] = {}
+        for slot in slots:
+            for key, value in slot.counters.items():
+                counters[key] += value
+            for status, value in slot.statuses.items():
+                statuses[status] = statuses.get(status, 0) + value
+            for i, value in enumerate(slot.latency):
+                latency[i] += value
+            for key, value in slot.ips.counts.items():
+                ips[key] = ips.get(key, 0) + value
+            for key, value in slot.paths.counts.items():
+                paths[key] = paths.get(key, 0) + value
+
+        return {
+            **counters,
+            "statuses": dict(sorted(statuses.items())),
+            "latency": {
+                "p50": _percentile(latency, 0.50),
+                "p90": _percentile(latency, 0.90),
+                "p99": _percentile(latency, 0.99),
+            },
+            "top_ips": _top(ips, top),
+            "top_paths": _top(paths, top),
+        }
+
+
+def _percentile(histogram: List[int], q: float) -> Optional[float]:
+    """Upper bound of the bin holding the q-quantile, in seconds."""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, value in enumerate(histogram):
+        seen += value
+        if seen >= rank:
+            return _bin_upper(i)
+    return _bin_upper(len(histogram) - 1)
+
+
+def _top(counts: Dict[str, int], n: int) -> List[Tuple[str, int]]:
+    return sorted(counts.items(), key=lambda item: item[1], reverse=True)[:n]
+
+
+class TrafficStats:
+    """
+    Per-site rolling traffic aggregates, fed from the ingest path.
+
+    Updates come only from the event loop thread (inline parsing and pool
+    results both land there), so there is a single writer and no lock. The
+    bot commands run on the same loop and summary() never awaits, so every
+    summary is a consistent snapshot.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.sites: Dict[str, SiteAggregates] = {}
+
+    def _site(self, site) -> SiteAggregates:
+        aggregates = self.sites.get(site)
+        if aggregates is None:
+            if len(self.sites) >= MAX_SITES and site != OTHER_SITE:
+                return self._site(OTHER_SITE)
+            aggregates = self.sites[site] = SiteAggregates()
+        return aggregates
+
+    def record(self, record: LogRecord, now: Optional[float] = None):
+        """
+        An accepted log, as built by core.pipeline.parse_line. Batch callers
+        pass one `now` for the whole batch instead of a clock call per record.
+        """
+        self._site(record.site).record(
+            self.clock() if now is None else now,
+            record.remote_ip,
+            record.uri,
+            record.status,
+            record.duration,
+            record.vip,
+        )
+
+    def record_discarded(self, site: str, n: int = 1, now: Optional[float] = None):
+        aggregates = self._site(site)
+        if now is None:
+            now = self.clock()
+        aggregates.count(now, "received", n)
+        aggregates.count(now, "discarded", n)
+
+    def summary(self, window="5m", top=5) -> Dict[str, dict]:
+        now = self.clock()
+        return {
+            site: aggregates.summary(window, now, top)
+            for site, aggregates in list(self.sites.items())
+        }
+
+
+# Fed by core.server, read by core.bot
+traffic_stats = TrafficStats()
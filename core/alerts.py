@@ -0,0 +1,322 @@
+# core/alerts.py
+"""
+Burst detection between ingestion and the notification queue.
+
+Very important hits are counted in sliding windows per (site, IP, rule),
+where the rule is the very_important_paths keyword that matched. Once a key
+reaches its site's threshold, its further hits are still stored but no
+longer notified one by one; the burst is reported as a single aggregated
+alert when it has been quiet for a window (and periodically while it lasts).
+Optionally, a site's 5xx responses are counted the same way and alerted on
+when they cross a threshold; that includes lines the rules discard, which
+core.pipeline counts per site and status without building records.
+"""
+import html
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+import anyio
+from core.processing import LogRecord
+
+# Each window is tracked as this many slots; it slides one slot at a time
+WINDOW_SLOTS = 12
+# Tracked (site, IP, rule) keys; the least recently hit one is evicted first
+MAX_KEYS = 10000
+# Sites with 5xx counters (hosts are client-controlled)
+MAX_SITES = 1000
+
+
+class AlertPolicy:
+    """
+    Alerting limits for one site. A threshold of 0 turns that alert off.
+      burst_threshold: hits per (IP, rule) within burst_window seconds
+                       that make a burst
+      report_interval: seconds between progress alerts of a burst that lasts
+      error_threshold: 5xx responses within error_window seconds that
+                       trigger a spike alert (at most one per window)
+    """
+
+    __slots__ = (
+        "burst_threshold",
+        "burst_window",
+        "report_interval",
+        "error_threshold",
+        "error_window",
+    )
+
+    def __init__(
+        self,
+        burst_threshold=20,
+        burst_window=60,
+        report_interval=600,
+        error_threshold=0,
+        error_window=60,
+    ):
+        self.burst_threshold = burst_threshold
+        self.burst_window = burst_window
+        self.report_interval = report_interval
+        self.error_threshold = error_threshold
+        self.error_window = error_window
+
+    @classmethod
+    def from_dict(cls, rules: dict) -> "AlertPolicy":
+        """Builds a policy from a rules.json "alerts" block; omitted keys keep defaults."""
+        default = DEFAULT_ALERTS
+        return cls(
+            **{name: rules.get(name, getattr(default, name)) for name in cls.__slots__}
+        )
+
+
+DEFAULT_ALERTS = AlertPolicy()
+
+
+class _Window:
+    """Hits in the last `seconds`, as sparse [epoch, count, statuses, first hit] slots."""
+
+    __slots__ = ("slot_seconds", "slots", "total")
+
+    def __init__(self, seconds):
+        self.slot_seconds = max(seconds, 1) / WINDOW_SLOTS
+        self.slots = deque()
+        self.total = 0
+
+    def add(self, now, status, n=1):
+        epoch = int(now // self.slot_seconds)
+        slots = self.slots
+        while slots and slots[0][0] <= epoch - WINDOW_SLOTS:
+            self.total -= slots.popleft()[1]
+        if not slots or slots[-1][0] != epoch:
+            slots.append([epoch, 0, {}, now])
+        slot = slots[-1]
+        slot[1] += n
+        slot[2][status] = slot[2].get(status, 0) + n
+        self.total += n
+
+    def statuses(self) -> Dict[int, int]:
+        merged: Dict[int, int] = {}
+        for _, _, statuses, _ in self.slots:
+            for status, count in statuses.items():
+                merged[status] = merged.get(status, 0) + count
+        return merged
+
+    def first(self) -> float:
+        return self.slots[0][3]
+
+    def clear(self):
+        self.slots.clear()
+        self.total = 0
+
+
+class _Burst:
+    __slots__ = ("started", "last", "hits", "statuses", "reported")
+
+    def __init__(self, started, last, hits, statuses):
+        self.started = started
+        self.last = last
+        self.hits = hits
+        self.statuses = statuses
+        self.reported = last
+
+
+class _Tracker:
+    """One (site, IP, rule) key: its window, or its burst once it has one."""
+
+    __slots__ = ("path", "window", "burst")
+
+    def __init__(self, path, seconds):
+        self.path = path
+        self.window = _Window(seconds)
+        self.burst: Optional[_Burst] = None
+
+
+class _SiteErrors:
+    __slots__ = ("window", "alerted")
+
+    def __init__(self, seconds):
+        self.window = _Window(seconds)
+        self.alerted = None
+
+
+def _path(uri: str) -> str:
+    return uri.split("?", 1)[0]
+
+
+def format_burst(site, ip, path, burst: _Burst, ongoing=False) -> str:
+    # Example: IP 1.2.3.4 hit /login 840 times in 60s, 97% 401
+    status, count = max(burst.statuses.items(), key=lambda item: item[1])
+    seconds = max(int(burst.last - burst.started), 1)
+    title = "Ongoing burst" if ongoing else "Burst"
+    return (
+        f"🚨 <b>{title}:</b> {html.escape(site)}\n\n"
+        f"IP <code>{html.escape(ip)}</code> hit <code>{html.escape(path)}</code> "
+        f"{burst.hits} times in {seconds}s, {count * 100 // burst.hits}% {status}"
+        f"\n\n<pre>/ip {html.escape(ip)}</pre>"
+    )
+
+
+def format_errors(site, window: _Window, seconds) -> str:
+    top = sorted(window.statuses().items(), key=lambda item: item[1], reverse=True)[:3]
+    breakdown = ", ".join(f"{status} ×{count}" for status, count in top)
+    return (
+        f"⚠️ <b>5xx spike:</b> {html.escape(site)}\n\n"
+        f"{window.total} server errors in {seconds}s ({breakdown})"
+        f"\n\n<pre>/top {html.escape(site)}</pre>"
+    )
+
+
+class AlertEngine:
+    """
+    Streaming burst and 5xx detection over accepted records.
+
+    Like TrafficStats, it is only touched from the event loop thread
+    (process() on ingest, sweep() from watch()), so it needs no lock.
+    Alerts go to `notify` as {"site", "alert"} items, next to the DB
+    workers' previews and exports.
+    """
+
+    def __init__(
+        self,
+        config_lookup: Callable,
+        notify: Callable[[dict], None],
+        clock=time.monotonic,
+        max_keys=MAX_KEYS,
+    ):
+        self.config_lookup = config_lookup
+        self.notify = notify
+        self.clock = clock
+        self.max_keys = max_keys
+        self._trackers: "OrderedDict[tuple, _Tracker]" = OrderedDict()
+        # Trackers with an open burst, checked by sweep()
+        self._bursts: Dict[tuple, _Tracker] = {}
+        self._errors: "OrderedDict[str, _SiteErrors]" = OrderedDict()
+        self.muted = 0
+        self.alerts = 0
+        self.evicted = 0
+
+    def process(self, records: List[LogRecord]) -> List[LogRecord]:
+        """
+        Counts a batch of accepted records. Returns it with the previews of
+        hits that belong to a burst removed, so the DB writer stores them
+        without notifying each one.
+        """
+        now = self.clock()
+        result = records
+        for i, record in enumerate(records):
+            if record.status >= 500:
+                self._count_errors(record.site, record.status, 1, now)
+            if record.vip and record.preview is not None and self._in_burst(record, now):
+                if result is records:
+                    result = list(records)
+                result[i] = record._replace(preview=None)
+                self.muted += 1
+        return result
+
+    def _in_burst(self, record: LogRecord, now) -> bool:
+        config = self.config_lookup(record.site)
+        policy = config.alerts or DEFAULT_ALERTS
+        if not policy.burst_threshold:
+            return False
+        rule = config.matcher.vip_rule(record.method, record.uri.lower())
+        if rule is None:
+            return False  # Rules changed since the record was classified
+
+        key = (record.site, record.remote_ip, rule)
+        tracker = self._trackers.get(key)
+        if tracker is None:
+            tracker = self._trackers[key] = _Tracker(_path(record.uri), policy.burst_window)
+            if len(self._trackers) > self.max_keys:
+                self._evict()
+        else:
+            self._trackers.move_to_end(key)
+
+        burst = tracker.burst
+        if burst is not None:
+            if now - burst.last < policy.burst_window:
+                burst.last = now
+                burst.hits += 1
+                burst.statuses[record.status] = burst.statuses.get(record.status, 0) + 1
+                return True
+            # Quiet for a whole window: that burst is over, this hit starts afresh
+            self._close(key, tracker)
+
+        window = tracker.window
+        window.add(now, record.status)
+        if window.total < policy.burst_threshold:
+            return False
+        # The hits so far were notified; everything from here on is aggregated
+        tracker.burst = _Burst(window.first(), now, window.total, window.statuses())
+        window.clear()
+        self._bursts[key] = tracker
+        return True
+
+    def record_errors(self, errors: Dict[str, Dict[int, int]]):
+        """Counts discarded 5xx lines, as {site: {status: count}} from core.pipeline."""
+        now = self.clock()
+        for site, statuses in errors.items():
+            for status, n in statuses.items():
+                self._count_errors(site, status, n, now)
+
+    def _count_errors(self, site, status, n, now):
+        policy = self.config_lookup(site).alerts or DEFAULT_ALERTS
+        if not policy.error_threshold:
+            return
+        errors = self._errors.get(site)
+        if errors is None:
+            errors = self._errors[site] = _SiteErrors(policy.error_window)
+            if len(self._errors) > MAX_SITES:
+                self._errors.popitem(last=False)
+        else:
+            self._errors.move_to_end(site)
+
+        errors.window.add(now, status, n)
+        if errors.window.total < policy.error_threshold:
+            return
+        if errors.alerted is not None and now - errors.alerted < policy.error_window:
+            return
+        errors.alerted = now
+        self._emit(site, format_errors(site, errors.window, policy.error_window))
+        errors.window.clear()
+
+    def _evict(self):
+        key, tracker = self._trackers.popitem(last=False)
+        self.evicted += 1
+        if tracker.burst is not None:
+            # Report it rather than lose it; a new burst starts if it goes on
+            self._close(key, tracker)
+
+    def _close(self, key, tracker: _Tracker):
+        self._bursts.pop(key, None)
+        site, ip, _ = key
+        self._emit(site, format_burst(site, ip, tracker.path, tracker.burst))
+        tracker.burst = None
+
+    def _emit(self, site, text):
+        self.alerts += 1
+        self.notify({"site": site, "alert": text})
+
+    def sweep(self):
+        """Reports bursts that have ended, and progress of those that last."""
+        now = self.clock()
+        for key, tracker in list(self._bursts.items()):
+            policy = self.config_lookup(key[0]).alerts or DEFAULT_ALERTS
+            burst = tracker.burst
+            if now - burst.last >= policy.burst_window:
+                self._close(key, tracker)
+            elif policy.report_interval and now - burst.reported >= policy.report_interval:
+                burst.reported = now
+                site, ip, _ = key
+                self._emit(site, format_burst(site, ip, tracker.path, burst, ongoing=True))
+
+    async def watch(self, interval=1.0):
+        while True:
+            await anyio.sleep(interval)
+            self.sweep()
+
+    def get_stats(self) -> dict:
+        return {
+            "tracked": len(self._trackers),
+            "bursts": len(self._bursts),
+            "muted": self.muted,
+            "alerts": self.alerts,
+            "evicted": self.evicted,
+        }
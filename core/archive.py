@@ -0,0 +1,154 @@
+# core/archive.py
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+try:  # Optional: better ratio and much faster than gzip
+    import zstandard
+except ImportError:  # pragma: no cover - depends on environment
+    zstandard = None
+
+COMPRESSIONS = ("gzip", "zstd", "none")
+
+# Telegram bots may upload documents up to 50 MB
+DEFAULT_PART_SIZE = 45 * 1024 * 1024
+_CHUNK = 1024 * 1024
+
+# <name>.db followed by a compression suffix and/or a part number
+_PART_RE = re.compile(r"(.+\.db)(?:\.gz|\.zst)?(?:\.\d{3})?")
+# <prefix>_<site>_<timestamp>[_n].db plus the same suffixes; sites may contain "_"
+_EXPORT_RE = re.compile(r"(?:log|snapshot)_(.+)_\d{10,}(?:_\d+)?\.db(?:\.gz|\.zst)?(?:\.\d{3})?")
+
+
+class PartWriter:
+    """File-like sink that rolls over to <base>.001, .002, ... every part_size bytes."""
+
+    def __init__(self, base: Path, part_size: int):
+        self.base = Path(base)
+        self.part_size = part_size
+        self.paths: List[Path] = []
+        self._file = None
+        self._written = 0
+
+    def _next_part(self):
+        if self._file is not None:
+            self._file.close()
+        path = Path(f"{self.base}.{len(self.paths) + 1:03d}")
+        self.paths.append(path)
+        self._file = open(path, "wb")
+        self._written = 0
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        total = len(view)
+        while view:
+            if self._file is None or self._written >= self.part_size:
+                self._next_part()
+            n = min(len(view), self.part_size - self._written)
+            self._file.write(view[:n])
+            self._written += n
+            view = view[n:]
+        return total
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            self._next_part()  # Empty input still yields one (empty) part
+        self._file.close()
+
+    def finish(self) -> List[Path]:
+        """Drops the numeric suffix when everything fit into one part."""
+        if len(self.paths) == 1:
+            self.paths[0] = self.paths[0].rename(self.base)
+        return self.paths
+
+
+def export_source(name: str):
+    """The DB file name an export part was made from, or None if `name` is not a part."""
+    match = _PART_RE.fullmatch(name)
+    if match is None or match.group(1) == name:
+        return None
+    return match.group(1)
+
+
+def export_site(name: str) -> Optional[str]:
+    """The site an export file (or part) belongs to, or None if `name` is not an export."""
+    match = _EXPORT_RE.fullmatch(name)
+    return match.group(1) if match is not None else None
+
+
+def vacuum_copy(src: Path, dest: Path):
+    """Writes a defragmented copy of a SQLite file (no free pages, no WAL)."""
+    conn = sqlite3.connect(str(src))
+    try:
+        conn.execute("VACUUM INTO ?", (str(dest),))
+    finally:
+        conn.close()
+
+
+def compress_export(
+    src: Path, compression="gzip", part_size=DEFAULT_PART_SIZE, keep: Path = None
+) -> Tuple[List[Path], dict]:
+    """
+    VACUUMs a DB file into a compact copy, stream-compresses it and splits the
+    result into parts of at most part_size bytes. The compact copy is moved
+    to `keep` if given, otherwise removed. The source file is removed only
+    once every part is written, so an interrupted export can be redone from
+    it (see Outbox.recover_orphans); on failure, partial parts are removed.
+    Returns (paths, stats) where stats has sizes, ratio and elapsed seconds.
+    """
+    started = time.perf_counter()
+    src = Path(src)
+    compact = src.with_name(src.name + ".vacuum")
+    compact.unlink(missing_ok=True)  # Left by an interrupted run; VACUUM INTO needs a new file
+    vacuum_copy(src, compact)
+    original_size = src.stat().st_size
+
+    if compression == "zstd" and zstandard is None:
+        compression = "gzip"
+
+    suffix = {"gzip": ".gz", "zstd": ".zst", "none": ""}[compression]
+    writer = PartWriter(src.with_name(src.name + suffix), part_size)
+    try:
+        with open(compact, "rb") as f_in:
+            if compression == "gzip":
+                with gzip.GzipFile(fileobj=writer, mode="wb", compresslevel=6) as out:
+                    shutil.copyfileobj(f_in, out, _CHUNK)
+            elif compression == "zstd":
+                cctx = zstandard.ZstdCompressor(level=10)
+                cctx.copy_stream(f_in, writer, read_size=_CHUNK, write_size=_CHUNK)
+            else:
+                shutil.copyfileobj(f_in, writer, _CHUNK)
+        writer.close()
+    except BaseException:
+        writer.close()
+        for part in writer.paths:
+            part.unlink(missing_ok=True)
+        compact.unlink(missing_ok=True)
+        raise
+
+    if keep is not None:
+        compact.replace(keep)
+    else:
+        compact.unlink()
+    paths = writer.finish()
+    # Without compression, a single part takes over the source's name
+    if src not in paths:
+        src.unlink()
+    compressed_size = sum(os.path.getsize(p) for p in paths)
+    stats = {
+        "original": original_size,
+        "compressed": compressed_size,
+        "ratio": original_size / compressed_size if compressed_size else 0.0,
+        "seconds": time.perf_counter() - started,
+        "compression": compression,
+    }
+    return paths, stats
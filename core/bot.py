@@ -1,13 +1,30 @@
 # core/bot.py
+import html
 import os
 import time
+from functools import partial
 import anyio
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.types import FSInputFile
 from config import BOT_TOKEN, ADMIN_ID
-from core.database import DBWorker
+from core.cluster import IngestCluster
+from core.db_pool import DBWorkerPool
 from core.config_manager import config_manager
+from core.outbox import Outbox
+from core.query import QueryEngine
+from core.aggregates import WINDOWS, traffic_stats
+from core.alerts import AlertEngine
+from core.metrics import TELEGRAM_SEND_SECONDS, profiler
+from core.notifier import (
+    DEFAULT_BURST,
+    DEFAULT_RATE,
+    MAX_DIGEST_CHARS,
+    TokenBucket,
+    coalesce,
+    format_previews,
+    pump_notifications,
+)
 from utils.logger import log_event, log_error
 
 # Initialize Bot
@@ -16,69 +33,179 @@ dp = Dispatcher()
 _start_time = time.time()
 
 # Global reference to DB Worker for commands
-_db_worker: DBWorker = None
+_db_worker: DBWorkerPool = None
 
+# Durable queue of exports waiting for upload
+_outbox: Outbox = None
+_upload_wakeup = anyio.Event()
 
-def setup_bot(db_worker_instance):
-    global _db_worker
+# Queries over archived and live site DBs (/top, /ip)
+_query_engine: QueryEngine = None
+
+# Multi-process ingest, when enabled (/health lists its processes)
+_cluster: IngestCluster = None
+
+# Burst/5xx detection (/health shows its counters)
+_alert_engine: AlertEngine = None
+
+# Default time window for /top and /ip, in hours
+DEFAULT_QUERY_HOURS = 24
+# Longest accepted window (a year); larger values overflow time conversions
+MAX_QUERY_HOURS = 24 * 365
+
+
+def setup_bot(
+    db_worker_instance,
+    outbox_instance,
+    query_engine_instance=None,
+    cluster_instance=None,
+    alert_engine_instance=None,
+):
+    global _db_worker, _outbox, _query_engine, _cluster, _alert_engine
     _db_worker = db_worker_instance
+    _outbox = outbox_instance
+    _query_engine = query_engine_instance
+    _cluster = cluster_instance
+    _alert_engine = alert_engine_instance
 
 
 # --- Background Task: Send Files ---
-async def file_sender_loop():
-    """Watches the DB Worker queue and sends files to Telegram"""
-    log_event("Bot File Sender Loop Started")
-    while True:
-        try:
-            # Non-blocking check
-            while not _db_worker.notification_queue.empty():
-                item = _db_worker.notification_queue.get()
-                site = item["site"]
-                important_preview = item.get(
-                    "important_preview"
-                )  # Only important request preview no file sending
-                if important_preview:
-                    text = f"<b>🎯 Important req:</b> {site}\n\n"
-                    text += important_preview
-                    text += f"\n\n<pre>/getdb {site}</pre>"
-                    try:
-                        await bot.send_message(ADMIN_ID, text, parse_mode="HTML")
-
-                    except Exception as e:
-                        log_error(
-                            f"Failed to send important preview- {important_preview}: {e}"
-                        )
-                    finally:
-                        await anyio.sleep(1)  # Sleep to yield control
-                        continue
+async def _send_message(text, what):
+    started = time.perf_counter()
+    try:
+        await bot.send_message(ADMIN_ID, text, parse_mode="HTML")
+        TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started, "message", "ok")
+    except Exception as e:
+        TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started, "message", "error")
+        log_error(f"Failed to send {what}: {e}")
+
+
+async def _send_previews(site, previews):
+    await _send_message(
+        format_previews(site, previews),
+        f"{len(previews)} important preview(s) for {site}",
+    )
 
-                path = item["path"]
-                reason = item["reason"]
-                preview = item.get("preview")
 
-                caption = f"📦 <b>Log Export:</b> {site}\n📝 <b>Reason:</b> {reason}"
-                if preview:
-                    caption += f"\n\n{preview}"
+async def _send_file(item) -> bool:
+    site = item["site"]
+    path = item["path"]
+    reason = item["reason"]
+    preview = item.get("preview")
 
-                file_input = FSInputFile(path)
+    caption = f"📦 <b>Log Export:</b> {site}\n📝 <b>Reason:</b> {reason}"
+    if preview:
+        caption += f"\n\n{preview}"
 
-                try:
-                    await bot.send_document(
-                        ADMIN_ID, file_input, caption=caption, parse_mode="HTML"
-                    )
-                    log_event(f"Sent file {path} to user")
+    file_input = FSInputFile(path)
 
-                    if item.get("delete_after", True):
-                        os.remove(path)
-                        log_event(f"Deleted file {path}")
+    started = time.perf_counter()
+    try:
+        await bot.send_document(
+            ADMIN_ID, file_input, caption=caption, parse_mode="HTML"
+        )
+        TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started, "document", "ok")
+        log_event(f"Sent file {path} to user")
 
-                except Exception as e:
-                    log_error(f"Failed to send file {path}: {e}")
+        if item.get("delete_after", True):
+            os.remove(path)
+            log_event(f"Deleted file {path}")
+        return True
 
-            await anyio.sleep(1)  # Sleep to yield control
+    except Exception as e:
+        TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started, "document", "error")
+        log_error(f"Failed to send file {path}: {e}")
+        return False
+
+
+async def _upload(row_id, item, attempts, limiter):
+    if not os.path.exists(item["path"]):
+        log_error(f"Export {item['path']} is gone, dropping it from the outbox")
+        _outbox.mark_sent(row_id)
+        return
+
+    await limiter.acquire()
+    if await _send_file(item):
+        _outbox.mark_sent(row_id)
+    else:
+        delay = _outbox.mark_failed(row_id, attempts)
+        if delay is not None:
+            log_event(f"Retrying {item['path']} in {delay:.0f}s (attempt {attempts + 1})")
+
+
+async def upload_loop(limiter, concurrency):
+    """Uploads due outbox entries, at most `concurrency` at a time."""
+    global _upload_wakeup
+    in_flight = set()
+
+    async def run_upload(row_id, item, attempts):
+        try:
+            await _upload(row_id, item, attempts, limiter)
         except Exception as e:
-            log_error(f"Error in file sender loop: {e}")
-            await anyio.sleep(5)
+            log_error(f"Upload of {item.get('path')} crashed: {e}", exc_info=True)
+            _outbox.mark_failed(row_id, attempts)
+        finally:
+            in_flight.discard(row_id)
+            _upload_wakeup.set()
+
+    async with anyio.create_task_group() as tg:
+        while True:
+            _upload_wakeup = anyio.Event()
+            free = concurrency - len(in_flight)
+            if free > 0:
+                for row_id, item, attempts in _outbox.due(free, exclude=in_flight):
+                    in_flight.add(row_id)
+                    tg.start_soon(run_upload, row_id, item, attempts)
+
+            # Sleep until a new export arrives, an upload finishes or a retry is due
+            with anyio.move_on_after(_outbox.next_due_in(exclude=in_flight)):
+                await _upload_wakeup.wait()
+
+
+async def file_sender_loop(rate=DEFAULT_RATE, burst=DEFAULT_BURST, upload_concurrency=2):
+    """Sends DB Worker notifications to Telegram as soon as they arrive"""
+    log_event("Bot File Sender Loop Started")
+    limiter = TokenBucket(rate, burst)
+    send_stream, receive_stream = anyio.create_memory_object_stream(1000)
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(pump_notifications, _db_worker.notification_queue, send_stream)
+        tg.start_soon(upload_loop, limiter, upload_concurrency)
+
+        async with receive_stream:
+            async for first in receive_stream:
+                try:
+                    # Files go to the durable outbox; upload_loop sends them
+                    if "path" in first:
+                        _outbox.add(first)
+                        _upload_wakeup.set()
+                        continue
+
+                    # Wait for Telegram quota first, so a burst piles up and
+                    # can be merged into digests below
+                    await limiter.acquire()
+                    items = [first]
+                    while True:
+                        try:
+                            items.append(receive_stream.receive_nowait())
+                        except anyio.WouldBlock:
+                            break
+
+                    have_token = True
+                    for entry in coalesce(items):
+                        if "previews" not in entry and "alert" not in entry:
+                            _outbox.add(entry)
+                            _upload_wakeup.set()
+                            continue
+                        if not have_token:
+                            await limiter.acquire()
+                        have_token = False
+                        if "alert" in entry:
+                            await _send_message(entry["alert"], f"alert for {entry['site']}")
+                        else:
+                            await _send_previews(entry["site"], entry["previews"])
+                except Exception as e:
+                    log_error(f"Error in file sender loop: {e}")
 
 
 # --- Commands ---
@@ -91,27 +218,72 @@ async def cmd_start(message: types.Message):
     await message.answer(
         "👋 Caddy Log Processor Bot is Online!\n\n"
         "Commands:\n"
-        "/stats - Show active sites and row counts\n"
+        "/stats [1m|5m|1h] - Traffic per site: lines, statuses, top IPs/paths, latency\n"
         "/getdb <site> - Get current DB (snapshot)\n"
         "/rotate <site> - Force rotate and get DB\n"
         "/reload - Reload site configuration\n"
+        "/top <site> [hours] [path] - Top paths, IPs and statuses\n"
+        "/ip <addr> [hours] - Requests by one IP across sites\n"
         "/health - System status\n"
+        "/profile [start|stop] - Sampling profiler\n"
+    )
+
+
+def _format_ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.0f}ms"
+
+
+def _format_traffic(t):
+    latency = t["latency"]
+    statuses = ", ".join(f"{code}: {n}" for code, n in t["statuses"].items())
+    text = (
+        f"📥 {t['received']} lines, {t['accepted']} kept, "
+        f"{t['discarded']} discarded, {t['vip']} VIP\n"
+        f"⏱ p50 {_format_ms(latency['p50'])} / p90 {_format_ms(latency['p90'])}"
+        f" / p99 {_format_ms(latency['p99'])}\n"
     )
+    if statuses:
+        text += f"🔢 {statuses}\n"
+    if t["top_ips"]:
+        text += "🌍 " + ", ".join(
+            f"<code>{html.escape(ip)}</code> ({n})" for ip, n in t["top_ips"][:3]
+        ) + "\n"
+    if t["top_paths"]:
+        text += "🛣 " + ", ".join(
+            f"<code>{html.escape(path)}</code> ({n})" for path, n in t["top_paths"][:3]
+        ) + "\n"
+    return text
 
 
 @dp.message(Command("stats"))
 async def cmd_stats(message: types.Message):
+    """Usage: /stats [1m|5m|1h]"""
     if message.from_user.id != ADMIN_ID:
         return
 
-    stats = _db_worker.get_active_sites()
-    if not stats:
+    args = message.text.split()
+    window = args[1] if len(args) > 1 else "5m"
+    if window not in WINDOWS:
+        await message.answer("⚠️ Usage: `/stats [1m|5m|1h]`")
+        return
+
+    pending = _db_worker.get_active_sites()
+    traffic = traffic_stats.summary(window)
+    sites = sorted(set(pending) | set(traffic))
+    if not sites:
         await message.answer("No active sites currently tracking.")
         return
 
-    text = "📊 <b>Live Statistics</b>\n\n"
-    for site, count in stats.items():
-        text += f"🔹 <b>{site}</b>: {count} rows pending\n"
+    text = f"📊 <b>Live Statistics</b> (last {window})\n"
+    for shown, site in enumerate(sites):
+        block = f"\n🔹 <b>{html.escape(site)}</b>: {pending.get(site, 0)} rows pending\n"
+        t = traffic.get(site)
+        if t is not None and t["received"]:
+            block += _format_traffic(t)
+        if len(text) + len(block) > MAX_DIGEST_CHARS:
+            text += f"\n…and {len(sites) - shown} more site(s)"
+            break
+        text += block
     await message.answer(text, parse_mode="HTML")
 
 
@@ -161,6 +333,94 @@ async def cmd_reload(message: types.Message):
         await message.answer("❌ Failed to reload configuration. Check logs.")
 
 
+def _parse_hours(args, index):
+    """Optional hours argument at args[index]; returns (since, hours)."""
+    hours = DEFAULT_QUERY_HOURS
+    if len(args) > index:
+        hours = float(args[index])
+        # Also rejects nan; inf and huge values fail the upper bound
+        if not 0 < hours <= MAX_QUERY_HOURS:
+            raise ValueError(f"hours out of range: {hours}")
+    return time.time() - hours * 3600, hours
+
+
+def _format_top(title, pairs):
+    if not pairs:
+        return ""
+    lines = [f"\n<b>{title}</b>"]
+    for key, count in pairs:
+        lines.append(f"{count} × <code>{html.escape(str(key))}</code>")
+    return "\n".join(lines) + "\n"
+
+
+@dp.message(Command("top"))
+async def cmd_top(message: types.Message):
+    """Usage: /top site1.com [hours] [/path/prefix]"""
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    args = message.text.split()
+    if len(args) < 2:
+        await message.answer("⚠️ Usage: `/top <site_name> [hours] [path_prefix]`")
+        return
+
+    site = args[1]
+    try:
+        since, hours = _parse_hours(args, 2)
+    except ValueError:
+        await message.answer(f"⚠️ Hours must be a positive number up to {MAX_QUERY_HOURS}")
+        return
+    prefix = args[3] if len(args) > 3 else None
+
+    started = time.perf_counter()
+    result = await anyio.to_thread.run_sync(
+        partial(_query_engine.top, site, since, path_prefix=prefix)
+    )
+    elapsed = time.perf_counter() - started
+
+    text = (
+        f"📈 <b>Top for {html.escape(site)}</b> (last {hours:g}h"
+        + (f", {html.escape(prefix)}*" if prefix else "")
+        + f")\n{result['rows']} requests in {result['files']} file(s), {elapsed:.2f}s\n"
+    )
+    text += _format_top("Paths", result["paths"])
+    text += _format_top("IPs", result["ips"])
+    text += _format_top("Statuses", result["statuses"])
+    await message.answer(text, parse_mode="HTML")
+
+
+@dp.message(Command("ip"))
+async def cmd_ip(message: types.Message):
+    """Usage: /ip 1.2.3.4 [hours]"""
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    args = message.text.split()
+    if len(args) < 2:
+        await message.answer("⚠️ Usage: `/ip <address> [hours]`")
+        return
+
+    addr = args[1]
+    try:
+        since, hours = _parse_hours(args, 2)
+    except ValueError:
+        await message.answer(f"⚠️ Hours must be a positive number up to {MAX_QUERY_HOURS}")
+        return
+
+    started = time.perf_counter()
+    result = await anyio.to_thread.run_sync(partial(_query_engine.ip, addr, since))
+    elapsed = time.perf_counter() - started
+
+    text = (
+        f"🔎 <b>{html.escape(addr)}</b> (last {hours:g}h)\n"
+        f"{result['rows']} requests in {result['files']} file(s), {elapsed:.2f}s\n"
+    )
+    text += _format_top("Sites", result["sites"])
+    text += _format_top("Statuses", result["statuses"])
+    text += _format_top("Paths", result["paths"])
+    await message.answer(text, parse_mode="HTML")
+
+
 @dp.message(Command("health"))
 async def cmd_health(message: types.Message):
     if message.from_user.id != ADMIN_ID:
@@ -176,14 +436,88 @@ async def cmd_health(message: types.Message):
     stats = _db_worker.get_active_sites()
     total_sites = len(stats)
     total_pending = sum(stats.values())
+    q = _db_worker.get_queue_stats()
+    minute = traffic_stats.summary("1m").values()
+    received = sum(t["received"] for t in minute)
+    accepted = sum(t["accepted"] for t in minute)
 
     text = (
         f"🏥 <b>System Health</b>\n"
         f"⏱ <b>Uptime:</b> {uptime_str}\n"
         f"🌐 <b>Active Sites:</b> {total_sites}\n"
         f"📥 <b>Pending Logs:</b> {total_pending}\n"
+        f"📈 <b>Last Minute:</b> {received} lines, {accepted} kept\n"
+        f"📬 <b>Queue:</b> {q['depth']}/{q['capacity']} ({q['policy']})\n"
+        f"🗑 <b>Dropped:</b> {q['dropped']} | 💾 <b>Spilled:</b> {q['spilled']}"
+        f" | ♻️ <b>Replayed:</b> {q['replayed']}\n"
+        f"🛟 <b>Spool:</b> {q['spooled']} logs written, {q['recovered']} recovered at startup\n"
+        f"📤 <b>Pending Uploads:</b> {_outbox.pending()}\n"
         f"⚙️ <b>Service:</b> Running"
     )
+    if _alert_engine is not None:
+        a = _alert_engine.get_stats()
+        text += (
+            f"\n🚨 <b>Alerts:</b> {a['bursts']} active bursts, {a['alerts']} sent, "
+            f"{a['muted']} hits muted, {a['tracked']} keys tracked"
+        )
+
+    shards = _db_worker.get_shard_stats()
+    if len(shards) > 1:
+        text += "\n\n✍️ <b>Writers</b>"
+        for shard in shards:
+            text += (
+                f"\n#{shard['shard']}: queue {shard['depth']}, "
+                f"{shard['write_ms_avg']}ms avg / {shard['write_ms_max']}ms max, "
+                f"sites: {', '.join(shard['sites']) or '-'}"
+            )
+
+    if _cluster is not None:
+        workers = _cluster.get_stats()
+        alive = sum(w["alive"] for w in workers)
+        text += (
+            f"\n\n🧩 <b>Ingest Processes:</b> {alive}/{len(workers)} up, "
+            f"{sum(w['lines'] for w in workers)} lines, "
+            f"{sum(w['accepted'] for w in workers)} kept, "
+            f"{sum(w['restarts'] for w in workers)} restarts"
+        )
+        for w in workers:
+            state = "up" if w["alive"] else "down"
+            text += (
+                f"\n#{w['index']}: {state}, pid {w['pid']}, {w['uptime']}s, "
+                f"{w['lines']} lines, {w['restarts']} restarts"
+            )
+    await message.answer(text, parse_mode="HTML")
+
+
+@dp.message(Command("profile"))
+async def cmd_profile(message: types.Message):
+    """Usage: /profile start, then /profile stop for the report"""
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    args = message.text.split()
+    action = args[1] if len(args) > 1 else ("stop" if profiler.running else "start")
+
+    if action == "start":
+        profiler.start()
+        await message.answer("🔬 Profiler started. Send `/profile stop` for the report.")
+        return
+    if action != "stop":
+        await message.answer("⚠️ Usage: `/profile [start|stop]`")
+        return
+    if not profiler.running:
+        await message.answer("Profiler is not running.")
+        return
+
+    profiler.stop()
+    elapsed, samples, own, inclusive = profiler.report(top=12)
+    total = samples or 1
+    text = f"🔬 <b>Profile</b>: {samples} samples over {elapsed:.1f}s\n\n<b>Self</b>\n"
+    for frame, count in own:
+        text += f"{count * 100 / total:5.1f}% <code>{html.escape(frame)}</code>\n"
+    text += "\n<b>Inclusive</b>\n"
+    for frame, count in inclusive:
+        text += f"{count * 100 / total:5.1f}% <code>{html.escape(frame)}</code>\n"
     await message.answer(text, parse_mode="HTML")
 
 
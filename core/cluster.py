@@ -0,0 +1,237 @@
+# core/cluster.py
+"""
+Multi-process ingest: N processes share the log port via SO_REUSEPORT, each
+parsing and classifying its own connections, and send accepted records over
+a pipe to this (writer/bot) process, which owns the DB workers and the bot.
+"""
+import multiprocessing
+import os
+import time
+from typing import Dict, List, Optional
+import anyio
+from core import server
+from core.config_manager import config_manager
+from core.alerts import AlertEngine
+from core.db_pool import DBWorkerPool
+from core.framing import DEFAULT_MAX_FRAME, DEFAULT_MAX_LINE
+from core.metrics import metrics
+from utils.logger import log_event, log_error
+
+# Seconds between worker stats messages, which double as a heartbeat
+HEARTBEAT_INTERVAL = 2.0
+# A worker silent for this long is considered hung and restarted
+HEARTBEAT_TIMEOUT = 15.0
+# Restart delay after a crash; doubles while a worker keeps crashing quickly
+RESTART_MIN = 1.0
+RESTART_MAX = 30.0
+# A worker that ran at least this long resets the restart delay
+STABLE_AFTER = 60.0
+
+
+class RecordLink:
+    """Ingest-process end of the pipe to the writer process."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._lock = anyio.Lock()
+        self.started = time.time()
+        self.lines = 0
+        self.accepted = 0
+
+    async def send(self, records, discarded: Dict[str, int], errors=None, received=None):
+        self.lines += len(records) + sum(discarded.values())
+        self.accepted += len(records)
+        await self._send(("records", records, discarded, errors, received))
+
+    async def send_stats(self):
+        await self._send(
+            (
+                "stats",
+                {
+                    "pid": os.getpid(),
+                    "started": self.started,
+                    "lines": self.lines,
+                    "accepted": self.accepted,
+                    "config_generation": config_manager.generation,
+                },
+            )
+        )
+
+    async def _send(self, message):
+        # A full pipe blocks here while the writer catches up; that stalls
+        # this process's connections, like backpressure on a single process
+        async with self._lock:
+            await anyio.to_thread.run_sync(self._conn.send, message)
+
+
+async def _heartbeat(link: RecordLink):
+    while True:
+        await link.send_stats()
+        await anyio.sleep(HEARTBEAT_INTERVAL)
+
+
+async def _serve_worker(conn, options: dict):
+    metrics.enabled = options["metrics"]
+    link = RecordLink(conn)
+    async with anyio.create_task_group() as tg:
+        # Each process keeps its own rules; they follow rules.json on disk
+        tg.start_soon(config_manager.watch, options["config_poll"])
+        tg.start_soon(_heartbeat, link)
+        await server.start_server(
+            None,
+            host=options["host"],
+            port=options["port"],
+            max_line=options["max_line"],
+            bulk_port=options["bulk_port"],
+            max_frame=options["max_frame"],
+            reuse_port=True,
+            link=link,
+        )
+
+
+def _worker_main(conn, options: dict):
+    """Ingest process entry point."""
+    try:
+        anyio.run(_serve_worker, conn, options)
+    except KeyboardInterrupt:
+        pass
+
+
+def _receive(conn, timeout: float):
+    """Next message, or None if the worker stayed silent for `timeout`."""
+    if not conn.poll(timeout):
+        return None
+    return conn.recv()
+
+
+def _reap(process):
+    """Stops the worker process, killing it if SIGTERM isn't enough."""
+    if process.is_alive():
+        process.terminate()
+    process.join(5)
+    if process.is_alive():
+        process.kill()
+        process.join()
+
+
+class IngestCluster:
+    """Starts, feeds from and supervises the ingest processes."""
+
+    def __init__(
+        self,
+        processes: int,
+        host="0.0.0.0",
+        port=9000,
+        max_line=DEFAULT_MAX_LINE,
+        bulk_port=0,
+        max_frame=DEFAULT_MAX_FRAME,
+        config_poll=1.0,
+    ):
+        self.processes = processes
+        self.options = {
+            "host": host,
+            "port": port,
+            "max_line": max_line,
+            "bulk_port": bulk_port,
+            "max_frame": max_frame,
+            "config_poll": config_poll or 1.0,
+            "metrics": False,
+        }
+        # spawn: forking a process that already runs the DB thread is unsafe
+        self._ctx = multiprocessing.get_context("spawn")
+        self._workers: List[dict] = [
+            {"index": i, "pid": None, "alive": False, "restarts": 0, "seen": None, "stats": {}}
+            for i in range(processes)
+        ]
+
+    async def run(self, db_worker: DBWorkerPool, alert_engine: AlertEngine = None):
+        # Alerts are detected here, where every process's records meet
+        server.set_db_worker(db_worker, alert_engine)
+        self.options["metrics"] = metrics.enabled
+        log_event(
+            f"Ingest cluster: {self.processes} processes on "
+            f"{self.options['host']}:{self.options['port']}"
+        )
+        async with anyio.create_task_group() as tg:
+            for state in self._workers:
+                tg.start_soon(self._supervise, state)
+
+    async def _supervise(self, state: dict):
+        delay = RESTART_MIN
+        while True:
+            started = time.monotonic()
+            try:
+                exitcode = await self._run_worker(state)
+            except Exception:
+                # E.g. a message that failed to unpickle: restart the worker
+                log_error(f"Ingest process #{state['index']} failed", exc_info=True)
+                exitcode = None
+            if time.monotonic() - started >= STABLE_AFTER:
+                delay = RESTART_MIN
+            log_error(
+                f"Ingest process #{state['index']} exited ({exitcode}); "
+                f"restarting in {delay:.0f}s"
+            )
+            await anyio.sleep(delay)
+            delay = min(delay * 2, RESTART_MAX)
+            state["restarts"] += 1
+
+    async def _run_worker(self, state: dict) -> Optional[int]:
+        reader, writer = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(writer, self.options),
+            name=f"ingest-{state['index']}",
+            daemon=True,
+        )
+        process.start()
+        # Only the worker holds the write end, so EOF means it is gone
+        writer.close()
+        state.update(pid=process.pid, alive=True, seen=time.time(), stats={})
+
+        try:
+            while True:
+                try:
+                    message = await anyio.to_thread.run_sync(
+                        _receive, reader, HEARTBEAT_TIMEOUT, abandon_on_cancel=True
+                    )
+                except EOFError:
+                    break
+                if message is None:
+                    log_error(f"Ingest process #{state['index']} is not responding")
+                    break
+
+                state["seen"] = time.time()
+                if message[0] == "records":
+                    _, records, discarded, errors, received = message
+                    await server.ingest_records(records, discarded, errors, received)
+                elif message[0] == "stats":
+                    state["stats"] = message[1]
+        finally:
+            state["alive"] = False
+            # join() blocks; the bot and the other supervisors keep running meanwhile
+            with anyio.CancelScope(shield=True):
+                await anyio.to_thread.run_sync(_reap, process)
+            reader.close()
+        return process.exitcode
+
+    def get_stats(self) -> List[dict]:
+        """Per-process status for /health."""
+        now = time.time()
+        result = []
+        for state in self._workers:
+            stats = state["stats"]
+            result.append(
+                {
+                    "index": state["index"],
+                    "pid": state["pid"],
+                    "alive": state["alive"],
+                    "restarts": state["restarts"],
+                    "uptime": int(now - stats["started"]) if stats else 0,
+                    "seen_ago": int(now - state["seen"]) if state["seen"] else None,
+                    "lines": stats.get("lines", 0),
+                    "accepted": stats.get("accepted", 0),
+                    "config_generation": stats.get("config_generation"),
+                }
+            )
+        return result
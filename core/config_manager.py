@@ -1,9 +1,22 @@
 # core/config_manager.py
 import json
+import os
+import threading
+import time
 from pathlib import Path
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+import anyio
+from core.alerts import AlertPolicy
 from core.processing import SiteConfig
+from core.rotation import RotationPolicy
 from utils.logger import log_event, log_error
 
+try:  # Optional: inotify/FSEvents/kqueue instead of polling
+    from watchfiles import awatch
+except ImportError:  # pragma: no cover - depends on environment
+    awatch = None
+
 DEFAULT_CONFIG = SiteConfig(
     "default",
     ["GET", "POST", "PUT", "DELETE", "PATCH"],
@@ -42,46 +55,143 @@ DEFAULT_CONFIG = SiteConfig(
         "reset",
         "forgot",
     ],
-)
+).compile()
+
+
+class ConfigSnapshot(NamedTuple):
+    """One immutable, fully built version of rules.json."""
+
+    generation: int
+    sites: Mapping[str, SiteConfig]
+    rules: Mapping[str, dict]
+
+
+def _build_site(host, rules) -> SiteConfig:
+    return SiteConfig(
+        host,
+        [method.upper() for method in rules.get("important_methods", [])],
+        [path.lower() for path in rules.get("important_paths", [])],
+        [method.upper() for method in rules.get("very_important_methods", [])],
+        [path.lower() for path in rules.get("very_important_paths", [])],
+        rotation=(
+            RotationPolicy.from_dict(rules["rotation"]) if "rotation" in rules else None
+        ),
+        alerts=AlertPolicy.from_dict(rules["alerts"]) if "alerts" in rules else None,
+    ).compile()
 
 
 class ConfigManager:
+    """
+    Readers only ever dereference self.snapshot once, and a reload builds
+    the next snapshot on the side and swaps the reference, so lookups never
+    lock and never see a half-built state.
+    """
+
     def __init__(self, config_path="rules.json"):
         self.config_path = Path(config_path)
-        self.configs = {}
+        self.snapshot = ConfigSnapshot(0, MappingProxyType({}), MappingProxyType({}))
+        self._reload_lock = threading.Lock()
         self.load_configs()
 
+    @property
+    def configs(self) -> Mapping[str, SiteConfig]:
+        return self.snapshot.sites
+
+    @property
+    def generation(self) -> int:
+        """Bumped on every successful load so parse workers know to reload."""
+        return self.snapshot.generation
+
     def load_configs(self):
         try:
             if not self.config_path.exists():
                 log_error(f"Config file {self.config_path} not found.")
                 return False
 
+            started = time.perf_counter()
             with open(self.config_path, "r") as f:
                 raw_rules = json.load(f)
+            if not isinstance(raw_rules, dict):
+                raise ValueError("top level must be an object of sites")
+
+            with self._reload_lock:
+                old = self.snapshot
+                # Unchanged sites keep their compiled SiteConfig (and its
+                # RotationPolicy identity, which the DB writers cache on)
+                new_sites = {}
+                rebuilt = 0
+                for host, rules in raw_rules.items():
+                    if old.rules.get(host) == rules:
+                        new_sites[host] = old.sites[host]
+                    else:
+                        new_sites[host] = _build_site(host, rules)
+                        rebuilt += 1
+                removed = len(set(old.rules) - set(raw_rules))
 
-            new_configs = {}
-            for host, rules in raw_rules.items():
-                new_configs[host] = SiteConfig(
-                    host,
-                    [method.upper() for method in rules.get("important_methods", [])],
-                    [path.lower() for path in rules.get("important_paths", [])],
-                    [
-                        method.upper()
-                        for method in rules.get("very_important_methods", [])
-                    ],
-                    [path.lower() for path in rules.get("very_important_paths", [])],
+                self.snapshot = ConfigSnapshot(
+                    old.generation + 1,
+                    MappingProxyType(new_sites),
+                    MappingProxyType(raw_rules),
                 )
 
-            self.configs = new_configs
-            log_event(f"Loaded configuration for {len(self.configs)} sites.")
+            log_event(
+                f"Loaded configuration for {len(new_sites)} sites in "
+                f"{(time.perf_counter() - started) * 1000:.1f}ms: {rebuilt} rebuilt, "
+                f"{removed} removed, {len(new_sites) - rebuilt} unchanged."
+            )
             return True
         except Exception as e:
             log_error(f"Failed to load config: {e}")
             return False
 
     def get_config(self, host: str) -> SiteConfig:
-        return self.configs.get(host, DEFAULT_CONFIG)
+        return self.snapshot.sites.get(host, DEFAULT_CONFIG)
+
+    def get_rotation(self, host: str):
+        """Per-site RotationPolicy from rules.json, or None for the default."""
+        return self.get_config(host).rotation
+
+    def _file_state(self):
+        try:
+            stat = self.config_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    async def watch(self, interval=1.0, settle=0.2):
+        """
+        Reloads whenever the rules file changes. Uses inotify & co. through
+        the optional watchfiles package, otherwise polls mtime/size/inode.
+        Waits until the file stops changing, so half-written saves are skipped.
+        """
+        if awatch is not None:
+            log_event(f"Watching {self.config_path} for changes")
+            name = self.config_path.name
+            # Watch the directory: editors often replace the file on save.
+            # Only its top level, and only our file: data/ below it sees a
+            # stream of DB, WAL and spool writes
+            async for _ in awatch(
+                self.config_path.parent,
+                watch_filter=lambda change, path: os.path.basename(path) == name,
+                recursive=False,
+                debounce=int(settle * 1000),
+            ):
+                self.load_configs()
+            return
+
+        log_event(f"Polling {self.config_path} for changes every {interval}s")
+        last = self._file_state()
+        while True:
+            await anyio.sleep(interval)
+            state = self._file_state()
+            if state == last or state is None:
+                continue
+            await anyio.sleep(settle)
+            settled = self._file_state()
+            if settled != state:
+                continue  # Still being written; look again next round
+            last = settled
+            self.load_configs()
 
 
 # Global Instance
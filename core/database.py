@@ -4,74 +4,275 @@ import threading
 import queue
 import time
 import shutil
+import itertools
 from pathlib import Path
+from typing import Optional
+from core.ingest_queue import (
+    IngestQueue,
+    LogBatch,
+    SpillFile,
+    OVERLOAD_POLICIES,
+    POLICY_DROP,
+    POLICY_SPILL,
+)
+from core.archive import COMPRESSIONS, DEFAULT_PART_SIZE
+from core.exporter import ExportWorker
+from core.metrics import (
+    DB_COMMIT_SECONDS,
+    DB_INSERT_SECONDS,
+    DB_ROWS,
+    INGEST_TO_COMMIT_SECONDS,
+    QUEUE_WAIT_SECONDS,
+    ROTATION_SECONDS,
+    metrics,
+)
+from core.spool import DEFAULT_FSYNC_INTERVAL, Spool
+from core.rotation import (
+    DeadlineHeap,
+    RotationPolicy,
+    estimate_row_bytes,
+)
+from core.storage import STORAGE_FORMATS, CompactStorage, detect_storage
 from utils.logger import log_event, log_error
 
-CREATE_TABLE_SQL = """
-CREATE TABLE IF NOT EXISTS logs (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    host TEXT, remote_ip TEXT, method TEXT, uri TEXT, status INTEGER,
-    headers TEXT, body TEXT, cookies TEXT, resp_headers TEXT, duration REAL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-"""
+# PRAGMAs applied when a site DB is opened.
+# "safe" keeps SQLite defaults (rollback journal, synchronous=FULL): every
+# commit is fsynced. "fast" uses WAL with synchronous=NORMAL: a power loss
+# can drop the last few commits, but the DB stays consistent.
+SQLITE_PROFILES = {
+    "safe": {},
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,  # 64 MiB
+        "temp_store": "MEMORY",
+    },
+}
+
+# Marker for "nothing was read ahead" while draining a batch
+_NO_TASK = object()
 
 
 class DBWorker(threading.Thread):
-    def __init__(self, db_folder="data", rotate_limit=1000):
-        super().__init__()
+    def __init__(
+        self,
+        db_folder="data",
+        rotate_limit=1000,
+        batch_size=500,
+        flush_interval=0.05,
+        queue_size=100000,
+        overload_policy="backpressure",
+        notification_queue=None,
+        shard_id=None,
+        sqlite_profile="fast",
+        mmap_size=0,
+        storage_format="plain",
+        body_compress_threshold=512,
+        snapshot_pages_per_step=256,
+        export_compression="gzip",
+        export_part_size=DEFAULT_PART_SIZE,
+        policy_lookup=None,
+        archive_catalog=None,
+        spool_segment_size=0,
+        spool_fsync_interval=DEFAULT_FSYNC_INTERVAL,
+    ):
+        super().__init__(name="DBWorker" if shard_id is None else f"DBWorker-{shard_id}")
+        self.shard_id = shard_id
+        self.shard_label = "0" if shard_id is None else str(shard_id)
         self.db_folder = Path(db_folder)
         self.db_folder.mkdir(exist_ok=True)
         self.rotate_limit = rotate_limit
 
-        # Unified Queue for Logs AND Commands
-        self.input_queue = queue.Queue()
+        # Rotation: policy_lookup(site) may return a per-site RotationPolicy;
+        # otherwise only rotate_limit rows applies. Time-based rotations and
+        # deferred ones (min_interval) fire from a heap of deadlines.
+        self.default_policy = RotationPolicy(max_rows=rotate_limit, min_interval=0)
+        self.policy_lookup = policy_lookup
+        self._merged_policies = {}
+        self._deadlines = DeadlineHeap()
+        self._last_rotation = {}
+        self._conn_ids = itertools.count(1)
+
+        # Batching: drain up to batch_size logs, waiting at most flush_interval sec.
+        # batch_size=1 gives the old commit-per-row behaviour.
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+
+        if sqlite_profile not in SQLITE_PROFILES:
+            raise ValueError(f"Unknown SQLite profile: {sqlite_profile}")
+        self.pragmas = dict(SQLITE_PROFILES[sqlite_profile])
+        if mmap_size:
+            self.pragmas["mmap_size"] = mmap_size
+
+        if storage_format not in STORAGE_FORMATS:
+            raise ValueError(f"Unknown storage format: {storage_format}")
+        if storage_format == "compact":
+            self.storage = CompactStorage(body_threshold=body_compress_threshold)
+        else:
+            self.storage = STORAGE_FORMATS[storage_format]()
+
+        # Unified Queue for Logs AND Commands.
+        # Only logs count towards queue_size; commands always get in.
+        if overload_policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy: {overload_policy}")
+        self.overload_policy = overload_policy
+        self.input_queue = IngestQueue(max_records=queue_size)
+        spill_name = "overflow" if shard_id is None else f"overflow_{shard_id}"
+        self.spill = SpillFile(self.db_folder / f"{spill_name}.jsonl")
+        self.dropped_logs = 0
+        self.spilled_logs = 0
+        self.replayed_logs = 0
+
+        # Write-ahead spool of queued logs, replayed after a crash (0 = off)
+        self.spool = None
+        if spool_segment_size:
+            spool_name = "spool" if shard_id is None else f"spool_{shard_id}"
+            self.spool = Spool(
+                self.db_folder / spool_name, spool_segment_size, spool_fsync_interval
+            )
+
+        # Queue for Bot Notifications (shared by all shards of a DBWorkerPool)
+        self.notification_queue = notification_queue or queue.Queue()
+
+        # Write latency per transaction, in ms (EWMA + worst seen)
+        self.rows_written = 0
+        self.write_latency_avg = 0.0
+        self.write_latency_max = 0.0
 
-        # Queue for Bot Notifications
-        self.notification_queue = queue.Queue()
+        # Slow halves of snapshot/rotation run here, off the writer thread
+        if export_compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown export compression: {export_compression}")
+        self.exporter = ExportWorker(
+            self.notification_queue,
+            pages_per_step=snapshot_pages_per_step,
+            compression=export_compression,
+            part_size=export_part_size,
+            catalog=archive_catalog,
+        )
 
         self._site_connections = {}
+        self._published_counts = {}
         self.running = True
         self.daemon = True
 
     def stop(self):
         self.running = False
-        self.input_queue.put(None)
+        self.input_queue.put_control(None)
+
+    def offer_batch(self, batch: LogBatch) -> Optional[LogBatch]:
+        """
+        Non-blocking enqueue of a batch of records, applying the overload
+        policy. Returns None when handled, or the records still to queue
+        under backpressure: the caller should wait and offer them again.
+        """
+        if self.input_queue.offer(batch, self._spool_batch if self.spool else None):
+            return None
+
+        if self.overload_policy == POLICY_DROP:
+            vips = [record for record in batch.records if record.vip]
+            self.dropped_logs += len(batch.records) - len(vips)
+            if not vips:
+                return None
+            # VIP logs are kept, but within the bound: when even they do
+            # not fit, the caller waits as under backpressure
+            vip_batch = batch._replace(records=vips)
+            if self.input_queue.offer(vip_batch, self._spool_batch if self.spool else None):
+                return None
+            return vip_batch
+
+        if self.overload_policy == POLICY_SPILL:
+            self.spill.append(batch.records)
+            self.spilled_logs += len(batch.records)
+            return None
+
+        return batch
+
+    def _spool_batch(self, batch: LogBatch) -> LogBatch:
+        try:
+            return batch._replace(position=self.spool.append(batch.records))
+        except OSError as e:
+            # Still queue the logs; they are just not crash-safe
+            log_error(f"Spool append failed: {e}")
+            return batch
+
+    def get_queue_stats(self):
+        return {
+            "depth": self.input_queue.records,
+            "capacity": self.input_queue.max_records,
+            "policy": self.overload_policy,
+            "dropped": self.dropped_logs,
+            "spilled": self.spilled_logs,
+            "replayed": self.replayed_logs,
+            "spooled": self.spool.appended if self.spool else 0,
+            "recovered": self.spool.replayed if self.spool else 0,
+            "rows_written": self.rows_written,
+            "write_ms_avg": round(self.write_latency_avg, 2),
+            "write_ms_max": round(self.write_latency_max, 2),
+        }
 
     def get_active_sites(self):
-        """Thread-safe way to get list of sites and row counts for stats"""
-        # Returns a COPY of the stats to avoid thread race conditions
-        stats = {}
-        # Note: Iterating this dict while the thread modifies it is technically risky
-        # but in CPython mostly atomic for simple reads. For strict safety,
-        # we would push a "get_stats" command, but for simple stats this suffices.
-        for site, info in self._site_connections.items():
-            stats[site] = info["count"]
-        return stats
+        """Sites and their pending row counts, as last published by the writer."""
+        # The writer swaps in a fresh dict; never iterate _site_connections here
+        return dict(self._published_counts)
+
+    def _publish_counts(self):
+        """Writer thread only: snapshot row counts for get_active_sites."""
+        self._published_counts = {
+            site: info["count"] for site, info in self._site_connections.items()
+        }
 
     def request_snapshot(self, site):
         """Public method to request a non-destructive copy of the DB"""
-        self.input_queue.put({"type": "snapshot", "site": site})
+        self.input_queue.put_control({"type": "snapshot", "site": site})
 
     def request_rotation(self, site):
         """Public method to force rotation"""
-        self.input_queue.put({"type": "rotate", "site": site})
+        self.input_queue.put_control({"type": "rotate", "site": site})
+
+    def recover_export(self, path, site):
+        """Finalizes an export DB left unfinished by a previous run (see Outbox.recover_orphans)."""
+        self.exporter.submit(
+            {
+                "type": "finalize",
+                "site": site,
+                "path": str(path),
+                "reason": "Recovered after restart",
+                "archive": Path(path).name.startswith("log_"),
+            }
+        )
 
     def run(self):
         log_event("DB Worker Thread Started")
+        self.exporter.start()
+        if self.spool is not None:
+            self._replay_spool()
+        next_task = _NO_TASK
         while self.running:
             try:
-                task = self.input_queue.get()
+                self._fire_deadlines()
+                self._publish_counts()
+                if next_task is _NO_TASK:
+                    # Catch up on overflow once the live queue has drained
+                    if self.input_queue.empty() and self.spill.has_data():
+                        self._replay_spill()
+                    try:
+                        # Sleep until the next timed rotation at the latest
+                        task = self.input_queue.get(timeout=self._deadlines.next_in())
+                    except queue.Empty:
+                        continue
+                else:
+                    # A command that interrupted the previous batch
+                    task, next_task = next_task, _NO_TASK
                 if task is None:
                     break
 
-                msg_type = task.get("type")
+                if isinstance(task, LogBatch):
+                    batches, next_task = self._collect_batch(task)
+                    self._handle_batches(batches)
+                    continue
 
-                if msg_type == "log":
-                    self._handle_write(
-                        task["site"], task["data"], task["vip"], task.get("preview")
-                    )
-                elif msg_type == "snapshot":
+                msg_type = task.get("type")
+                if msg_type == "snapshot":
                     self._handle_snapshot(task["site"])
                 elif msg_type == "rotate":
                     self._rotate_log(task["site"], "User Command")
@@ -81,65 +282,246 @@ class DBWorker(threading.Thread):
 
         self._close_all()
 
+    def _replay_spool(self):
+        """Commits what a previous run spooled but never checkpointed."""
+        try:
+            for chunk in self.spool.replay(self.batch_size):
+                self._handle_batch(chunk)
+            self.spool.finish_replay()
+        except Exception as e:
+            log_error(f"Spool replay failed: {e}", exc_info=True)
+            return
+        if self.spool.replayed:
+            log_event(f"Recovered {self.spool.replayed} uncommitted logs from the spool")
+
+    def _replay_spill(self):
+        for chunk in self.spill.take(self.batch_size):
+            self._handle_batch(chunk)
+            self.replayed_logs += len(chunk)
+        log_event(f"Replayed overflow logs (total {self.replayed_logs})")
+
     def _get_conn(self, site):
         if site not in self._site_connections:
             db_path = self.db_folder / f"{site}.db"
             conn = sqlite3.connect(str(db_path), check_same_thread=False)
-            conn.execute(CREATE_TABLE_SQL)
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM logs")
-            self._site_connections[site] = {"conn": conn, "count": cursor.fetchone()[0]}
+            for pragma, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {pragma}={value}")
+            storage = detect_storage(conn, self.storage)
+            storage.create(conn)
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            self._site_connections[site] = {
+                "id": next(self._conn_ids),  # Tells stale deadlines apart
+                "conn": conn,
+                "count": self._row_count(conn, storage.table),
+                "bytes": page_size * page_count,  # Kept as an estimate from here
+                "first_row_at": self._first_row_time(conn, storage.table),
+                "age_timer": False,  # max_age deadline pushed for this DB
+                "deferred": False,  # Rotation due but held back by min_interval
+                "storage": storage,
+                "state": {},  # Per-connection storage cache (e.g. known hashes)
+                "snapshots": [],  # Events for backups still reading this conn
+            }
         return self._site_connections[site]
 
-    def _handle_write(self, site, log_data, is_vip, preview=None):
-        info = self._get_conn(site)
-        info["conn"].execute(
-            """
-            INSERT INTO logs (host, remote_ip, method, uri, status, headers, body, cookies, resp_headers, duration)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-            log_data,
-        )
-        info["conn"].commit()
-        info["count"] += 1
-        limit_reached = info["count"] >= self.rotate_limit
-
-        if limit_reached:
-            reason = "Limit Reached"
-            if is_vip:
-                reason += " AND Important Log"
-            # Pass the preview to rotation
-            self._rotate_log(site, reason, preview_context=preview)
-
-        if is_vip and not limit_reached:
-            self.notification_queue.put(
-                {
-                    "site": site,
-                    "important_preview": preview,
-                }
-            )
+    @staticmethod
+    def _first_row_time(conn, table):
+        row = conn.execute(
+            f"SELECT CAST(strftime('%s', created_at) AS REAL) FROM {table} "
+            f"WHERE id = (SELECT MIN(id) FROM {table})"
+        ).fetchone()
+        return row[0] if row else None
+
+    def _policy(self, site) -> RotationPolicy:
+        policy = self.policy_lookup(site) if self.policy_lookup else None
+        if policy is None:
+            return self.default_policy
+        # Merge with the defaults once per loaded policy object
+        cached = self._merged_policies.get(site)
+        if cached is None or cached[0] is not policy:
+            cached = (policy, policy.with_defaults(self.default_policy))
+            self._merged_policies[site] = cached
+        return cached[1]
+
+    def _fire_deadlines(self):
+        for site, conn_id, reason in self._deadlines.pop_due():
+            info = self._site_connections.get(site)
+            # The DB this timer was set for may have rotated already
+            if info is None or info["id"] != conn_id or not info["count"]:
+                continue
+            self._rotate_log(site, reason)
+
+    @staticmethod
+    def _row_count(conn, table):
+        """
+        Rows in a live site DB without a full scan. Live DBs are append-only
+        (AUTOINCREMENT ids from 1, never deleted), so MAX(id) is the row count
+        and SQLite answers it from the rightmost rowid B-tree page.
+        """
+        return conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+
+    def _collect_batch(self, first_batch):
+        """
+        Drains queued LogBatches until batch_size records are reached or
+        flush_interval expires. Returns (batches, next_task): a command (or
+        stop) ends the batch early and is handed back so it runs after the flush.
+        """
+        batches = [first_batch]
+        records = len(first_batch.records)
+        deadline = time.monotonic() + self.flush_interval
+        while records < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    task = self.input_queue.get(timeout=timeout)
+                else:
+                    task = self.input_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if not isinstance(task, LogBatch):
+                return batches, task
+            batches.append(task)
+            records += len(task.records)
+        return batches, _NO_TASK
+
+    def _handle_batches(self, batches):
+        timed = metrics.enabled
+        if timed:
+            now = time.perf_counter()
+            for batch in batches:
+                if batch.enqueued is not None:
+                    QUEUE_WAIT_SECONDS.observe(now - batch.enqueued, n=len(batch.records))
+
+        if len(batches) == 1:
+            records = batches[0].records
+        else:
+            records = [record for batch in batches for record in batch.records]
+        self._handle_batch(records)
+
+        # Written or failed for good either way: a replay would not help
+        if self.spool is not None:
+            for batch in reversed(batches):
+                if batch.position is not None:
+                    self.spool.checkpoint(batch.position)
+                    break
+
+        if timed:
+            now = time.perf_counter()
+            for batch in batches:
+                if batch.received is not None:
+                    INGEST_TO_COMMIT_SECONDS.observe(now - batch.received, n=len(batch.records))
+
+    def _handle_batch(self, records):
+        # Group by site, keeping arrival order within each site
+        by_site = {}
+        for record in records:
+            by_site.setdefault(record.site, []).append(record)
+
+        for site, site_records in by_site.items():
+            try:
+                self._write_site_batch(site, site_records)
+            except Exception as e:
+                log_error(f"Batch write failed for {site}: {e}", exc_info=True)
+
+    def _write_site_batch(self, site, records):
+        policy = self._policy(site)
+        while records:
+            info = self._get_conn(site)
+
+            # Never write past the row limit in one transaction, unless a
+            # rotation is already pending and the DB keeps filling meanwhile
+            room = self.batch_size
+            if policy.max_rows and not info["deferred"]:
+                room = min(room, max(policy.max_rows - info["count"], 1))
+            chunk, records = records[:room], records[room:]
+            rows = [record.row for record in chunk]
+
+            started = time.perf_counter()
+            try:
+                with info["conn"]:
+                    info["storage"].insert(info["conn"], rows, info["state"])
+                    inserted = time.perf_counter()
+            except Exception:
+                # Rolled back: caches may reference rows that were never stored
+                info["state"].clear()
+                raise
+            finished = time.perf_counter()
+            self._record_latency((finished - started) * 1000)
+            if metrics.enabled:
+                shard = self.shard_label
+                DB_INSERT_SECONDS.observe(inserted - started, shard)
+                DB_COMMIT_SECONDS.observe(finished - inserted, shard)
+                DB_ROWS.inc(len(chunk), shard)
+            info["count"] += len(chunk)
+            info["bytes"] += estimate_row_bytes(rows)
+            self.rows_written += len(chunk)
+
+            if info["first_row_at"] is None:
+                info["first_row_at"] = time.time()
+            if policy.max_age and not info["age_timer"]:
+                info["age_timer"] = True
+                self._deadlines.push(
+                    info["first_row_at"] + policy.max_age,
+                    site,
+                    info["id"],
+                    "Max Age Reached",
+                )
+
+            reason = None
+            if not info["deferred"]:
+                reason = policy.size_reason(info["count"], info["bytes"])
+            if reason:
+                last = self._last_rotation.get(site, 0)
+                wait = last + (policy.min_interval or 0) - time.time()
+                if wait > 0:
+                    # Too soon after the last rotation; rotate when allowed
+                    info["deferred"] = True
+                    self._deadlines.push(time.time() + wait, site, info["id"], reason)
+                    reason = None
+
+            # The row that hits the limit travels with the rotated file instead.
+            # Hits of a burst have no preview: the alert engine reports them
+            trigger = chunk[-1] if reason else None
+            for record in chunk:
+                if record.vip and record.preview is not None and record is not trigger:
+                    self.notification_queue.put(
+                        {
+                            "site": site,
+                            "important_preview": record.preview,
+                        }
+                    )
+
+            if reason:
+                if trigger.vip:
+                    reason += " AND Important Log"
+                # Pass the preview to rotation
+                self._rotate_log(site, reason, preview_context=trigger.preview)
+
+    def _record_latency(self, ms):
+        self.write_latency_avg += (ms - self.write_latency_avg) * 0.1
+        if ms > self.write_latency_max:
+            self.write_latency_max = ms
 
     def _handle_snapshot(self, site):
         """Creates a copy without closing the connection"""
-        if site not in self._site_connections:
-            # If no DB exists yet, create an empty one just so we can send it
-            self._get_conn(site)
-
-        # Use SQLite Backup API to safely copy even if open
-        src_conn = self._site_connections[site]["conn"]
-        timestamp = int(time.time())
-        dest_path = self.db_folder / f"snapshot_{site}_{timestamp}.db"
+        # If no DB exists yet, this creates an empty one just so we can send it
+        info = self._get_conn(site)
 
-        bck_conn = sqlite3.connect(str(dest_path))
-        src_conn.backup(bck_conn)
-        bck_conn.close()
+        # Reserve the name now; the copy itself runs on the export thread
+        dest_path = self._export_path("snapshot", site)
+        dest_path.touch()
 
-        self.notification_queue.put(
+        done = threading.Event()
+        info["snapshots"] = [e for e in info["snapshots"] if not e.is_set()]
+        info["snapshots"].append(done)
+        self.exporter.submit(
             {
+                "type": "snapshot",
                 "site": site,
+                "conn": info["conn"],
                 "path": str(dest_path),
-                "reason": "Manual Snapshot",
-                "delete_after": True,  # Helper flag
+                "done": done,
             }
         )
 
@@ -147,26 +529,68 @@ class DBWorker(threading.Thread):
         if site not in self._site_connections:
             return
 
-        # Close and Rename
-        self._site_connections[site]["conn"].close()
-        del self._site_connections[site]
+        started = time.perf_counter()
+        info = self._site_connections.pop(site)
+        self._release_conn(info)
+        self._last_rotation[site] = time.time()
 
-        timestamp = int(time.time())
+        # Rename only; checkpointing runs on the export thread
         original = self.db_folder / f"{site}.db"
-        rotated = self.db_folder / f"log_{site}_{timestamp}.db"
+        rotated = self._export_path("log", site)
 
         if original.exists():
             shutil.move(str(original), str(rotated))
-            self.notification_queue.put(
+            # The -wal travels with its DB; -shm is rebuilt on the next open
+            wal = Path(f"{original}-wal")
+            if wal.exists():
+                wal.rename(f"{rotated}-wal")
+            shm = Path(f"{original}-shm")
+            if shm.exists():
+                shm.unlink()
+
+            self.exporter.submit(
                 {
+                    "type": "finalize",
                     "site": site,
                     "path": str(rotated),
                     "reason": f"{reason} 🔁",
-                    "delete_after": True,
                     "preview": preview_context,
                 }
             )
+        if metrics.enabled:
+            ROTATION_SECONDS.observe(time.perf_counter() - started)
+
+    def _release_conn(self, info):
+        """
+        Closes a site connection without the on-close WAL checkpoint, which is
+        the slow part of a rotation. Waits for snapshots still copying from it.
+        """
+        for done in info["snapshots"]:
+            done.wait()
+        conn = info["conn"]
+        if conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            conn.setconfig(sqlite3.SQLITE_DBCONFIG_NO_CKPT_ON_CLOSE, True)
+        conn.close()
+
+    def _export_path(self, prefix, site):
+        """Timestamped export name; batched writes can rotate twice per second."""
+        timestamp = int(time.time())
+        path = self.db_folder / f"{prefix}_{site}_{timestamp}.db"
+        n = 1
+        # Exports become .db.gz / .db.gz.001 etc., so match on the prefix too
+        while path.exists() or any(self.db_folder.glob(f"{path.name}.*")):
+            path = self.db_folder / f"{prefix}_{site}_{timestamp}_{n}.db"
+            n += 1
+        return path
 
     def _close_all(self):
+        self.spill.close()
+        if self.spool is not None:
+            self.spool.close()
         for info in self._site_connections.values():
+            for done in info["snapshots"]:
+                done.wait()
             info["conn"].close()
+        # Let queued finalize jobs finish so rotated files are standalone
+        self.exporter.stop()
+        self.exporter.join()
@@ -0,0 +1,138 @@
+# core/db_pool.py
+import bisect
+import queue
+import zlib
+from typing import Optional
+from core.database import DBWorker
+from core.ingest_queue import LogBatch
+
+
+class HashRing:
+    """Consistent hashing of site names onto shard indexes."""
+
+    def __init__(self, shards: int, vnodes: int = 64):
+        points = []
+        for shard in range(shards):
+            for v in range(vnodes):
+                points.append((self._hash(f"{shard}#{v}"), shard))
+        points.sort()
+        self._keys = [p[0] for p in points]
+        self._shards = [p[1] for p in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        # crc32 is stable across processes, unlike hash()
+        return zlib.crc32(key.encode())
+
+    def shard_for(self, site: str) -> int:
+        idx = bisect.bisect(self._keys, self._hash(site)) % len(self._keys)
+        return self._shards[idx]
+
+
+class DBWorkerPool:
+    """
+    K DBWorker threads behind the single-worker interface. Each site is
+    routed to a fixed shard, which owns that site's connection and files.
+    """
+
+    def __init__(self, writers=1, **worker_kwargs):
+        self.notification_queue = queue.Queue()
+        self.shards = [
+            DBWorker(
+                notification_queue=self.notification_queue,
+                shard_id=i if writers > 1 else None,
+                **worker_kwargs,
+            )
+            for i in range(writers)
+        ]
+        self._ring = HashRing(writers)
+
+    def _shard(self, site) -> DBWorker:
+        # Not cached across calls: sites are client-controlled
+        return self.shards[self._ring.shard_for(site)]
+
+    # --- Thread-like lifecycle ---
+
+    def start(self):
+        for shard in self.shards:
+            shard.start()
+
+    def stop(self):
+        for shard in self.shards:
+            shard.stop()
+
+    def join(self, timeout=None):
+        for shard in self.shards:
+            shard.join(timeout)
+
+    # --- DBWorker facade ---
+
+    def offer_batch(self, batch: LogBatch) -> Optional[LogBatch]:
+        """
+        Splits the batch by shard and offers each part. Returns None when all
+        parts were handled, otherwise a batch of the records to offer again.
+        """
+        if len(self.shards) == 1:
+            return self.shards[0].offer_batch(batch)
+
+        parts = {}
+        # Routes of this batch's sites only; a batch has few distinct sites
+        routes = {}
+        for record in batch.records:
+            shard = routes.get(record.site)
+            if shard is None:
+                shard = routes[record.site] = self._shard(record.site)
+            parts.setdefault(shard, []).append(record)
+
+        rejected = []
+        for shard, records in parts.items():
+            left = shard.offer_batch(batch._replace(records=records))
+            if left is not None:
+                rejected.extend(left.records)
+        return batch._replace(records=rejected) if rejected else None
+
+    def request_snapshot(self, site):
+        self._shard(site).request_snapshot(site)
+
+    def request_rotation(self, site):
+        self._shard(site).request_rotation(site)
+
+    def recover_export(self, path, site):
+        self._shard(site).recover_export(path, site)
+
+    def get_active_sites(self):
+        stats = {}
+        for shard in self.shards:
+            stats.update(shard.get_active_sites())
+        return stats
+
+    def get_queue_stats(self):
+        """Totals across shards, in the same shape as DBWorker.get_queue_stats."""
+        per_shard = [shard.get_queue_stats() for shard in self.shards]
+        totals = per_shard[0].copy()
+        for key in (
+            "depth",
+            "capacity",
+            "dropped",
+            "spilled",
+            "replayed",
+            "spooled",
+            "recovered",
+        ):
+            totals[key] = sum(s[key] for s in per_shard)
+        totals["rows_written"] = sum(s["rows_written"] for s in per_shard)
+        totals["write_ms_avg"] = round(
+            sum(s["write_ms_avg"] for s in per_shard) / len(per_shard), 2
+        )
+        totals["write_ms_max"] = max(s["write_ms_max"] for s in per_shard)
+        return totals
+
+    def get_shard_stats(self):
+        """Per-shard queue depth, write latency and sites, to spot hot sites."""
+        result = []
+        for i, shard in enumerate(self.shards):
+            stats = shard.get_queue_stats()
+            stats["shard"] = i
+            stats["sites"] = sorted(shard.get_active_sites())
+            result.append(stats)
+        return result
@@ -0,0 +1,150 @@
+# core/exporter.py
+import itertools
+import sqlite3
+import threading
+import queue
+import time
+from pathlib import Path
+from core.archive import compress_export, DEFAULT_PART_SIZE
+from core.metrics import EXPORT_SECONDS
+from utils.logger import log_event, log_error
+
+# Job order on the export thread: snapshot copies hold up the writer's
+# connection (see DBWorker._release_conn), so they go before queued finalizes
+_PRIORITY = {"snapshot": 0, "finalize": 1}
+_STOP = 2
+
+
+def _human_size(size):
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+class ExportWorker(threading.Thread):
+    """
+    Background thread for the slow half of snapshots and rotations, so the
+    DB writer only does the constant-time part (hand-off / rename).
+
+    Jobs:
+      snapshot: incremental backup of a live connection, pages_per_step pages
+                at a time, pausing between steps so the writer can commit.
+                Its "done" event is set as soon as the copy is taken.
+      finalize: checkpoint a rotated WAL database into one standalone file.
+    Both then VACUUM, compress and split the file (core.archive) and put the
+    resulting part(s) on the notification queue. With a catalog, the VACUUMed
+    copy of each rotated DB is kept in the archive folder for core.query.
+    """
+
+    def __init__(
+        self,
+        notification_queue,
+        pages_per_step=256,
+        step_pause=0.001,
+        compression="gzip",
+        part_size=DEFAULT_PART_SIZE,
+        catalog=None,
+    ):
+        super().__init__(name="ExportWorker", daemon=True)
+        self.notification_queue = notification_queue
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.compression = compression
+        self.part_size = part_size
+        self.catalog = catalog
+        self.jobs = queue.PriorityQueue()
+        self._seq = itertools.count()
+
+    def submit(self, job):
+        self.jobs.put((_PRIORITY[job["type"]], next(self._seq), job))
+
+    def stop(self):
+        self.jobs.put((_STOP, next(self._seq), None))
+
+    def run(self):
+        while True:
+            _, _, job = self.jobs.get()
+            if job is None:
+                break
+            started = time.perf_counter()
+            try:
+                if job["type"] == "snapshot":
+                    self._snapshot(job)
+                elif job["type"] == "finalize":
+                    self._finalize(job)
+            except Exception as e:
+                log_error(f"Export job failed for {job.get('site')}: {e}", exc_info=True)
+            finally:
+                EXPORT_SECONDS.observe(time.perf_counter() - started, job["type"])
+                # Already set on success; a failed job must not leave the writer waiting
+                if "done" in job:
+                    job["done"].set()
+
+    def _snapshot(self, job):
+        started = time.perf_counter()
+        dest = sqlite3.connect(job["path"])
+        try:
+            # Runs on the writer's own connection: its commits during the copy
+            # are applied to the destination instead of restarting the backup.
+            job["conn"].backup(
+                dest,
+                pages=self.pages_per_step,
+                progress=lambda status, remaining, total: time.sleep(self.step_pause),
+            )
+            # The backup copies the WAL flag in the header; make the copy standalone
+            dest.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            dest.close()
+        # The live connection is no longer read: let the writer close or
+        # rotate it now rather than after VACUUM and compression
+        job["done"].set()
+
+        log_event(
+            f"Snapshot of {job['site']} took {time.perf_counter() - started:.2f}s"
+        )
+        self._publish(job["site"], job["path"], "Manual Snapshot")
+
+    def _finalize(self, job):
+        conn = sqlite3.connect(job["path"])
+        try:
+            # Opening recovers the renamed -wal; fold it in and drop WAL mode
+            if conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                conn.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            conn.close()
+
+        keep = None
+        # Recovered snapshots are not archived: their rows are still live
+        if self.catalog is not None and job.get("archive", True):
+            keep = self.catalog.folder / Path(job["path"]).name
+        self._publish(job["site"], job["path"], job["reason"], job.get("preview"), keep)
+
+        if keep is not None:
+            try:
+                self.catalog.register(keep, job["site"])
+            except Exception as e:
+                log_error(f"Failed to catalog {keep}: {e}", exc_info=True)
+
+    def _publish(self, site, path, reason, preview=None, keep=None):
+        paths, stats = compress_export(path, self.compression, self.part_size, keep=keep)
+        log_event(
+            f"Export {path}: {_human_size(stats['original'])} -> {_human_size(stats['compressed'])} "
+            f"({stats['compression']}, {stats['ratio']:.1f}x) in {stats['seconds']:.2f}s"
+        )
+
+        size_note = f"{_human_size(stats['original'])} → {_human_size(stats['compressed'])}"
+        for n, part in enumerate(paths, 1):
+            part_reason = reason
+            if len(paths) > 1:
+                part_reason += f" (part {n}/{len(paths)})"
+            self.notification_queue.put(
+                {
+                    "site": site,
+                    "path": str(part),
+                    "reason": f"{part_reason}\n🗜 <b>Size:</b> {size_note}",
+                    "delete_after": True,
+                    # Only the first part carries the preview
+                    "preview": preview if n == 1 else None,
+                }
+            )
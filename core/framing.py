@@ -0,0 +1,169 @@
+# core/framing.py
+import gzip
+import io
+import struct
+import zlib
+from typing import List, Tuple
+from utils.logger import log_error
+
+try:  # Optional: zstd frames from the forwarder
+    import zstandard
+except ImportError:  # pragma: no cover - depends on environment
+    zstandard = None
+
+# What a truncated or corrupt payload raises while decompressing
+_DECODE_ERRORS = (OSError, EOFError, zlib.error)
+if zstandard is not None:
+    _DECODE_ERRORS += (zstandard.ZstdError,)
+
+# Caddy lines with captured bodies stay well under this
+DEFAULT_MAX_LINE = 1024 * 1024
+
+# Bulk ingest frames: codec (1 byte) and payload length (4 bytes, big endian),
+# then the payload, which decodes to newline-delimited log lines
+FRAME_HEADER = struct.Struct(">BI")
+CODEC_NONE = 0
+CODEC_GZIP = 1
+CODEC_ZSTD = 2
+CODECS = {"none": CODEC_NONE, "gzip": CODEC_GZIP, "zstd": CODEC_ZSTD}
+# Sent back once a frame's lines are queued; the sender may then forget it
+FRAME_ACK = b"\x06"
+
+# Largest payload accepted on the wire, and the most it may expand to
+DEFAULT_MAX_FRAME = 8 * 1024 * 1024
+MAX_FRAME_EXPANSION = 64 * 1024 * 1024
+# Decompressed bytes handed to the LineReader per step
+_DECODE_STEP = 256 * 1024
+
+
+class LineReader:
+    """
+    Incremental newline framing for a byte stream.
+
+    Chunks are appended to one bytearray; lines are located with find() from
+    the last scanned offset and copied out once through a memoryview. The
+    consumed prefix is compacted once per chunk. A line longer than max_line
+    is dropped (up to its terminating newline) instead of growing the buffer.
+    """
+
+    def __init__(self, max_line: int = DEFAULT_MAX_LINE):
+        self.max_line = max_line
+        self.dropped_lines = 0
+        self._buf = bytearray()
+        self._scanned = 0  # Bytes of _buf already known to contain no newline
+        self._discarding = False
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        buf = self._buf
+        buf += chunk
+        lines = []
+        pos = 0
+
+        with memoryview(buf) as view:
+            while True:
+                nl = buf.find(b"\n", self._scanned)
+                if nl < 0:
+                    break
+                if self._discarding:
+                    self._discarding = False
+                elif nl - pos > self.max_line:
+                    # Complete within the buffer, but still too long
+                    self.dropped_lines += 1
+                    log_error(f"Dropping log line over {self.max_line} bytes")
+                elif nl > pos:
+                    lines.append(view[pos:nl].tobytes())
+                pos = self._scanned = nl + 1
+
+        if pos:
+            del buf[:pos]
+        self._scanned = len(buf)
+
+        if len(buf) > self.max_line or (self._discarding and buf):
+            if not self._discarding:
+                self.dropped_lines += 1
+                log_error(f"Dropping log line over {self.max_line} bytes")
+            self._discarding = True
+            buf.clear()
+            self._scanned = 0
+
+        return lines
+
+
+class FrameError(ValueError):
+    """The peer sent something that is not a valid bulk frame."""
+
+
+class FrameReader:
+    """Incremental framing of length-prefixed bulk frames from a byte stream."""
+
+    def __init__(self, max_frame: int = DEFAULT_MAX_FRAME):
+        self.max_frame = max_frame
+        self._buf = bytearray()
+
+    def feed(self, chunk: bytes) -> List[Tuple[int, bytes]]:
+        """Returns the (codec, payload) frames completed by `chunk`."""
+        buf = self._buf
+        buf += chunk
+        frames = []
+        pos = 0
+        while len(buf) - pos >= FRAME_HEADER.size:
+            codec, length = FRAME_HEADER.unpack_from(buf, pos)
+            if codec not in CODECS.values():
+                raise FrameError(f"Unknown frame codec {codec}")
+            if length > self.max_frame:
+                raise FrameError(f"Frame of {length} bytes exceeds {self.max_frame}")
+            start = pos + FRAME_HEADER.size
+            if len(buf) - start < length:
+                break
+            frames.append((codec, bytes(buf[start : start + length])))
+            pos = start + length
+        if pos:
+            del buf[:pos]
+        return frames
+
+
+def _open_payload(codec: int, payload: bytes):
+    if codec == CODEC_GZIP:
+        return gzip.GzipFile(fileobj=io.BytesIO(payload))
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise FrameError("zstd frame received but zstandard is not installed")
+        return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(payload))
+    return io.BytesIO(payload)
+
+
+def decode_frame(codec: int, payload: bytes, max_line: int = DEFAULT_MAX_LINE) -> List[bytes]:
+    """
+    Decompresses a frame into its log lines. Runs in a worker thread:
+    decompression is stepwise into a LineReader, so oversized lines are
+    dropped as on the plain listener, and a payload expanding past
+    MAX_FRAME_EXPANSION raises FrameError instead of exhausting memory.
+    """
+    reader = LineReader(max_line)
+    lines = []
+    total = 0
+    try:
+        with _open_payload(codec, payload) as stream:
+            while True:
+                data = stream.read(_DECODE_STEP)
+                if not data:
+                    break
+                total += len(data)
+                if total > MAX_FRAME_EXPANSION:
+                    raise FrameError(f"Frame expands past {MAX_FRAME_EXPANSION} bytes")
+                lines.extend(reader.feed(data))
+    except _DECODE_ERRORS as e:
+        raise FrameError(f"Corrupt frame: {e}") from e
+    # A final line without a trailing newline still counts
+    lines.extend(reader.feed(b"\n"))
+    return lines
+
+
+def encode_frame(lines: List[bytes], codec: int = CODEC_GZIP, level: int = 6) -> bytes:
+    """Builds one bulk frame from raw log lines (used by forwarder.py)."""
+    payload = b"".join(line + b"\n" for line in lines)
+    if codec == CODEC_GZIP:
+        payload = gzip.compress(payload, compresslevel=level, mtime=0)
+    elif codec == CODEC_ZSTD:
+        payload = zstandard.ZstdCompressor(level=level).compress(payload)
+    return FRAME_HEADER.pack(codec, len(payload)) + payload
@@ -0,0 +1,142 @@
+# core/ingest_queue.py
+import json
+import queue
+import threading
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Tuple
+from core.processing import LogRecord
+from utils.logger import log_error
+
+# What DBWorker.offer_batch does when the ingest queue is full
+POLICY_BACKPRESSURE = "backpressure"  # Caller waits (stops reading its socket)
+POLICY_DROP = "drop"  # Non-VIP logs are dropped, VIP logs wait for room
+POLICY_SPILL = "spill"  # Logs go to an on-disk overflow file, replayed later
+OVERLOAD_POLICIES = (POLICY_BACKPRESSURE, POLICY_DROP, POLICY_SPILL)
+
+
+class LogBatch(NamedTuple):
+    """Records read from one socket chunk, queued as a single item."""
+
+    records: List[LogRecord]
+    # perf_counter() stamps, only set while metrics are enabled
+    received: Optional[float] = None
+    enqueued: Optional[float] = None
+    # Spool position to checkpoint once these records are committed
+    position: Optional[Tuple[int, int]] = None
+
+
+class IngestQueue(queue.Queue):
+    """
+    Queue of LogBatch items and commands, bounded by the number of records
+    it holds (max_records, 0 = unbounded) rather than by items. offer()
+    applies the bound; put_control() always succeeds, so commands are never
+    dropped or blocked.
+    """
+
+    def __init__(self, max_records=0):
+        super().__init__()
+        self.max_records = max_records
+        self.records = 0
+
+    def offer(
+        self, batch: LogBatch, prepare: Optional[Callable[[LogBatch], LogBatch]] = None
+    ) -> bool:
+        """
+        Non-blocking put of a batch. A batch always fits an empty queue.
+        prepare(batch), if given, runs only once the batch is known to fit,
+        under the queue lock, and its result is what gets queued.
+        """
+        with self.not_full:
+            size = len(batch.records)
+            if self.max_records and self.records and self.records + size > self.max_records:
+                return False
+            if prepare is not None:
+                batch = prepare(batch)
+            self._put(batch)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+            return True
+
+    def put_control(self, item):
+        with self.not_full:
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    # Called by queue.Queue with the mutex held
+    def _put(self, item):
+        if isinstance(item, LogBatch):
+            self.records += len(item.records)
+        self.queue.append(item)
+
+    def _get(self):
+        item = self.queue.popleft()
+        if isinstance(item, LogBatch):
+            self.records -= len(item.records)
+        return item
+
+
+class SpillFile:
+    """Append-only JSON-lines overflow for records that did not fit the queue."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.replay_path = self.path.with_suffix(".replay")
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, records: List[LogRecord]):
+        # One JSON array per record, in LogRecord field order
+        text = "".join(json.dumps(record) + "\n" for record in records)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(text)
+            self._file.flush()
+
+    def has_data(self):
+        with self._lock:
+            return (
+                self._file is not None
+                or self.path.exists()
+                or self.replay_path.exists()
+            )
+
+    def take(self, chunk_size):
+        """
+        Detaches the current spill file and yields its records in chunks.
+        New spills while replaying go to a fresh file. A .replay file left by
+        an interrupted run is finished first.
+        """
+        replay_path = self.replay_path
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self.path.exists() and not replay_path.exists():
+                self.path.rename(replay_path)
+
+        if not replay_path.exists():
+            return
+
+        chunk = []
+        with open(replay_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = LogRecord(*json.loads(line))
+                except (ValueError, TypeError):
+                    log_error("Skipping corrupt overflow record")
+                    continue
+                chunk.append(record)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+        replay_path.unlink()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
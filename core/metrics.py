@@ -0,0 +1,311 @@
+# core/metrics.py
+import bisect
+import collections
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+import anyio
+from utils.logger import log_event, log_error
+
+# Latency buckets in seconds (Prometheus "le" bounds)
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+class Counter:
+    __slots__ = ("name", "help", "labels", "values")
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, amount=1, *label_values):
+        """inc(5) or, with labels, inc(5, "shard-0")."""
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram; observe() is a bisect and two adds."""
+
+    __slots__ = ("name", "help", "labels", "buckets", "series")
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self.series: Dict[tuple, list] = {}
+
+    def observe(self, value, *label_values, n=1):
+        """Records `value` (n times, e.g. once per record of a batch)."""
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += n
+        series[1] += value * n
+
+    def quantile(self, q, *label_values) -> float:
+        """Estimated q-quantile, interpolated inside the bucket that holds it."""
+        series = self.series.get(label_values)
+        if series is None:
+            return 0.0
+        counts = series[0]
+        rank = q * sum(counts)
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets + (self.buckets[-1],), counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.buckets[-1]
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                names = self.labels + ("le",)
+                lines.append(
+                    f"{self.name}_bucket{_labels(names, label_values + (le,))} {cumulative}"
+                )
+            suffix = _labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Read at scrape time from a callback, so it costs nothing in between."""
+
+    __slots__ = ("name", "help", "read")
+
+    def __init__(self, name, help, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def collect(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception as e:
+            log_error(f"Gauge {self.name} failed: {e}")
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{str(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Registry:
+    """
+    Process-wide metrics. Instrumented code checks `enabled` before taking
+    any timestamp, so with metrics off the hot path pays one attribute read.
+    Updates are plain dict/list writes under the GIL, without locks; a
+    scrape may see a histogram mid-update, which only skews one sample.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, read) -> Gauge:
+        return self._add(Gauge(name, help, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics):
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+metrics = Registry()
+
+# --- Hot-path metrics ---
+LINES_RECEIVED = metrics.counter("caddy_lines_received_total", "Log lines read from sockets")
+BULK_BYTES = metrics.counter(
+    "caddy_bulk_bytes_total",
+    "Bulk listener bytes, as sent (wire) and after decompression (decoded)",
+    ("kind",),
+)
+BULK_DECODE_SECONDS = metrics.histogram(
+    "caddy_bulk_decode_seconds", "Decompressing and splitting one bulk frame"
+)
+PARSE_SECONDS = metrics.histogram(
+    "caddy_parse_seconds", "Full parse_line time per line (inline or thread parsing)"
+)
+CLASSIFY_SECONDS = metrics.histogram(
+    "caddy_classify_seconds", "Peek + rule classification time per line"
+)
+PARSE_BATCH_SECONDS = metrics.histogram(
+    "caddy_parse_batch_seconds", "Round trip of one batch through the parse pool"
+)
+INGEST_TO_COMMIT_SECONDS = metrics.histogram(
+    "caddy_ingest_to_commit_seconds",
+    "From reading a log off the socket to its row being committed",
+    # Finer than the defaults: this is what the load benchmark reports p50/p99 of
+    buckets=tuple(0.00005 * 1.5**i for i in range(36)),
+)
+QUEUE_WAIT_SECONDS = metrics.histogram(
+    "caddy_queue_wait_seconds", "Time a log spent in the ingest queue"
+)
+DB_INSERT_SECONDS = metrics.histogram(
+    "caddy_db_insert_seconds", "SQLite insert time per batch", ("shard",)
+)
+DB_COMMIT_SECONDS = metrics.histogram(
+    "caddy_db_commit_seconds", "SQLite commit time per batch", ("shard",)
+)
+DB_ROWS = metrics.counter("caddy_db_rows_total", "Rows written", ("shard",))
+ROTATION_SECONDS = metrics.histogram(
+    "caddy_rotation_seconds", "Writer-side rotation time (close + rename)"
+)
+EXPORT_SECONDS = metrics.histogram(
+    "caddy_export_seconds", "Snapshot/finalize time on the export thread", ("type",)
+)
+TELEGRAM_SEND_SECONDS = metrics.histogram(
+    "caddy_telegram_send_seconds", "Telegram API call latency", ("kind", "result")
+)
+
+
+# --- HTTP endpoint ---
+
+async def _handle_scrape(stream):
+    async with stream:
+        request = b""
+        with anyio.move_on_after(5):
+            while b"\r\n\r\n" not in request and len(request) < 8192:
+                chunk = await stream.receive()
+                if not chunk:
+                    break
+                request += chunk
+        path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+        if path == b"/metrics":
+            status, body = "200 OK", metrics.render().encode()
+        else:
+            status, body = "404 Not Found", b"Not Found\n"
+        await stream.send(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+
+
+async def _serve_scrape(stream):
+    try:
+        await _handle_scrape(stream)
+    except (anyio.EndOfStream, anyio.BrokenResourceError, anyio.ClosedResourceError):
+        pass
+
+
+async def serve_metrics(host="127.0.0.1", port=9100):
+    """Serves GET /metrics in the Prometheus text format."""
+    listener = await anyio.create_tcp_listener(local_host=host, local_port=port)
+    log_event(f"Metrics endpoint on http://{host}:{port}/metrics")
+    await listener.serve(_serve_scrape)
+
+
+# --- Sampling profiler ---
+
+class SamplingProfiler:
+    """
+    Samples every thread's stack at a fixed interval from a background
+    thread and counts where time goes. Costs nothing while stopped.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+        self._own = collections.Counter()
+        self._inclusive = collections.Counter()
+        self.samples = 0
+        self.started_at = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self.running:
+            return
+        self._own.clear()
+        self._inclusive.clear()
+        self.samples = 0
+        self.started_at = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="Profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                self.samples += 1
+                self._own[_frame_key(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    key = _frame_key(frame)
+                    if key not in seen:
+                        seen.add(key)
+                        self._inclusive[key] += 1
+                    frame = frame.f_back
+
+    def report(self, top=15) -> Tuple[float, int, list, list]:
+        """(seconds, samples, top self frames, top inclusive frames)."""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return (
+            elapsed,
+            self.samples,
+            self._own.most_common(top),
+            self._inclusive.most_common(top),
+        )
+
+
+def _frame_key(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename.rsplit("/", 2)
+    return f"{'/'.join(filename[-2:])}:{code.co_name}"
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,94 @@
+# core/notifier.py
+import queue
+import time
+from typing import List
+import anyio
+from anyio.streams.memory import MemoryObjectSendStream
+
+# Telegram allows roughly one message per second per chat, with short bursts
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 3
+
+# Telegram's message length limit, with room for the header
+MAX_DIGEST_CHARS = 3800
+
+
+class TokenBucket:
+    """Async token bucket: `rate` sends per second, up to `burst` at once."""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        self._refill()
+        while self.tokens < 1:
+            await anyio.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+
+async def pump_notifications(
+    source: queue.Queue, send_stream: MemoryObjectSendStream, poll_timeout=0.5
+):
+    """
+    Moves items from the DB workers' thread queue onto an anyio stream.
+    A worker thread blocks on get(), so items are forwarded as soon as they
+    are produced; the timeout only bounds how long shutdown can take.
+    """
+
+    def next_item():
+        try:
+            return source.get(timeout=poll_timeout)
+        except queue.Empty:
+            return None
+
+    async with send_stream:
+        while True:
+            item = await anyio.to_thread.run_sync(next_item)
+            if item is not None:
+                await send_stream.send(item)
+
+
+def coalesce(items: List[dict]) -> List[dict]:
+    """
+    Merges the important previews in a burst into one entry per site, with a
+    "previews" list, placed where that site's first preview was. File exports
+    and alerts pass through in order.
+    """
+    result = []
+    by_site = {}
+    for item in items:
+        preview = item.get("important_preview")
+        if preview is None:
+            result.append(item)
+            continue
+        entry = by_site.get(item["site"])
+        if entry is None:
+            entry = by_site[item["site"]] = {"site": item["site"], "previews": []}
+            result.append(entry)
+        entry["previews"].append(preview)
+    return result
+
+
+def format_previews(site: str, previews: List[str]) -> str:
+    if len(previews) == 1:
+        text = f"<b>🎯 Important req:</b> {site}\n\n{previews[0]}"
+    else:
+        text = f"<b>🎯 {len(previews)} important reqs:</b> {site}"
+        shown = 0
+        for preview in previews:
+            if len(text) + len(preview) > MAX_DIGEST_CHARS:
+                break
+            text += f"\n\n{preview}"
+            shown += 1
+        if shown < len(previews):
+            text += f"\n\n… and {len(previews) - shown} more"
+    return text + f"\n\n<pre>/getdb {site}</pre>"
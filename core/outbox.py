@@ -0,0 +1,179 @@
+# core/outbox.py
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable
+from core.archive import export_site, export_source
+from utils.logger import log_event, log_error
+
+CREATE_OUTBOX_SQL = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT UNIQUE,
+    item TEXT,
+    attempts INTEGER DEFAULT 0,
+    next_attempt REAL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Export files the DB workers leave in data/; temp/sidecar files are skipped
+_EXPORT_PREFIXES = ("log_", "snapshot_")
+_TEMP_SUFFIXES = (".vacuum", "-wal", "-shm", "-journal")
+
+# Failed uploads of one export before it is dropped from the outbox
+DEFAULT_MAX_ATTEMPTS = 20
+
+
+class Outbox:
+    """
+    Durable queue of exports waiting to be uploaded, kept in a small SQLite
+    journal so pending files survive restarts. Failed uploads are retried
+    with exponential backoff, up to max_attempts times. Only used from the
+    event loop thread.
+    """
+
+    def __init__(
+        self,
+        path="data/outbox.db",
+        base_delay=5.0,
+        max_delay=3600.0,
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(CREATE_OUTBOX_SQL)
+        self.conn.commit()
+
+    def add(self, item: dict):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO outbox (path, item) VALUES (?, ?)",
+                (item["path"], json.dumps(item)),
+            )
+
+    def due(self, limit: int, exclude=()):
+        """Up to `limit` (id, item, attempts) entries whose retry time has come."""
+        rows = self.conn.execute(
+            "SELECT id, item, attempts FROM outbox WHERE next_attempt <= ? "
+            "ORDER BY id LIMIT ?",
+            (time.time(), limit + len(exclude)),
+        ).fetchall()
+        return [
+            (row_id, json.loads(item), attempts)
+            for row_id, item, attempts in rows
+            if row_id not in exclude
+        ][:limit]
+
+    def next_due_in(self, exclude=()):
+        """Seconds until the next entry is due, or None when nothing is waiting."""
+        ids = list(exclude)
+        placeholders = ",".join("?" * len(ids))
+        row = self.conn.execute(
+            f"SELECT MIN(next_attempt) FROM outbox WHERE id NOT IN ({placeholders})",
+            ids,
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def pending(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def mark_sent(self, row_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+
+    def mark_failed(self, row_id, attempts):
+        """Schedules a retry and returns its delay, or None if the export was given up."""
+        if self.max_attempts and attempts + 1 >= self.max_attempts:
+            row = self.conn.execute("SELECT path FROM outbox WHERE id = ?", (row_id,)).fetchone()
+            with self.conn:
+                self.conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+            # The file stays in place; the next restart queues it once more
+            log_error(
+                f"Giving up on {row[0] if row else row_id} after {attempts + 1} failed uploads"
+            )
+            return None
+        delay = min(self.base_delay * 2**attempts, self.max_delay)
+        with self.conn:
+            self.conn.execute(
+                "UPDATE outbox SET attempts = ?, next_attempt = ? WHERE id = ?",
+                (attempts + 1, time.time() + delay, row_id),
+            )
+        return delay
+
+    def recover_orphans(self, folder, finalize: Callable[[str, str], None]):
+        """
+        Queues export files left in `folder` by a previous run.
+        Databases that were rotated or snapshotted but never compressed go
+        to finalize(path, site) instead, which exports them the usual way;
+        that includes exports interrupted mid-compression, whose partial
+        parts are deleted. Call before the DB workers start, so nothing is
+        half-written.
+        """
+        known = {
+            row[0] for row in self.conn.execute("SELECT path FROM outbox").fetchall()
+        }
+        names = set(os.listdir(folder))
+        # A VACUUMed copy without its source: an older run crashed while
+        # compressing it, and it is the only complete copy left
+        for name in names:
+            if name.startswith(_EXPORT_PREFIXES) and name.endswith(".vacuum"):
+                source = name[: -len(".vacuum")]
+                if source not in names:
+                    os.replace(os.path.join(folder, name), os.path.join(folder, source))
+        with os.scandir(folder) as entries:
+            files = {entry.name: entry for entry in entries if entry.is_file()}
+
+        found = finalized = discarded = 0
+        for name, entry in files.items():
+            if not name.startswith(_EXPORT_PREFIXES) or name.endswith(_TEMP_SUFFIXES):
+                continue
+            if entry.path in known:
+                continue
+            source = export_source(name)
+            if source is not None and source in files:
+                # Part of an export whose source is still here: it was cut
+                # short, and finalizing the source writes it again
+                os.unlink(entry.path)
+                discarded += 1
+                continue
+            site = export_site(name)
+            if site is None:
+                continue  # Not named like an export
+            if entry.stat().st_size == 0:
+                continue  # Snapshot reserved but never written
+            if name.endswith(".db"):
+                # Not yet VACUUMed, compressed or split (or archived)
+                finalize(entry.path, site)
+                finalized += 1
+                continue
+            self.add(
+                {
+                    "site": site,
+                    "path": entry.path,
+                    "reason": "Recovered after restart",
+                    "delete_after": True,
+                }
+            )
+            found += 1
+        if found or finalized or discarded:
+            log_event(
+                f"Outbox: recovered {found} orphaned export file(s), "
+                f"{finalized} database(s) to finalize, {discarded} partial part(s) removed"
+            )
+        return found + finalized
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception as e:
+            log_error(f"Failed to close outbox: {e}")
@@ -0,0 +1,174 @@
+# core/pipeline.py
+import sys
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import anyio
+from core.processing import (
+    DISCARD,
+    IMPORTANT,
+    VERY_IMPORTANT,
+    LogRecord,
+    build_record,
+    loads,
+    peek_error_status,
+    peek_request,
+)
+from core.config_manager import config_manager
+from core.metrics import CLASSIFY_SECONDS, PARSE_SECONDS, metrics
+from utils.logger import log_event, log_error
+
+
+def site_name(host: str) -> str:
+    if ":" in host:
+        host = host.split(":")[0]
+    return host
+
+
+def _count_discard(discarded, site):
+    if discarded is not None:
+        discarded[site] = discarded.get(site, 0) + 1
+
+
+def _count_error(errors, site, status):
+    if errors is not None:
+        statuses = errors.setdefault(site, {})
+        statuses[status] = statuses.get(status, 0) + 1
+
+
+def _wants_errors(config) -> bool:
+    """Whether discarded lines of this site are checked for 5xx (see core.alerts)."""
+    return config.alerts is not None and bool(config.alerts.error_threshold)
+
+
+def parse_line(
+    line: bytes,
+    discarded: Optional[Dict[str, int]] = None,
+    errors: Optional[Dict[str, Dict[int, int]]] = None,
+) -> Optional[LogRecord]:
+    """
+    CPU-bound part of ingestion: parse, classify and build the LogRecord.
+    Returns None for discarded or malformed lines, counting them per site
+    in `discarded` when given. Discarded 5xx lines of sites with 5xx alerts
+    are also counted per site and status in `errors`.
+    """
+    host = "unknown"
+    # Timed only with metrics on; pool processes never are (see ParsePool)
+    timed = metrics.enabled
+    if timed:
+        started = time.perf_counter()
+    try:
+        # 0. Fast reject: classify from host/method/uri before a full decode
+        level = None
+        peeked = peek_request(line)
+        if peeked is not None:
+            host, method, uri = peeked
+            config = config_manager.get_config(site_name(host))
+            level = config.matcher.classify(method, uri)
+            if timed:
+                CLASSIFY_SECONDS.observe(time.perf_counter() - started)
+            if level == DISCARD:
+                _count_discard(discarded, site_name(host))
+                if _wants_errors(config):
+                    status = peek_error_status(line)
+                    if status:
+                        _count_error(errors, site_name(host), status)
+                return None
+
+        data = loads(line)
+        request = data.get("request", {})
+        host = site_name(request.get("host", "unknown"))
+
+        # 1. Classify with this site's rules unless the pre-filter already did
+        config = config_manager.get_config(host)
+        if level is None:
+            level = config.matcher.classify(request.get("method", ""), request.get("uri", ""))
+
+        if level == VERY_IMPORTANT:
+            log_event(f"!!! VIP [{host}]: {data.get('status', 0)} {request.get('uri', '')}")
+        elif level == IMPORTANT:
+            log_event(f"* IMP [{host}]: {request.get('method', '')}")
+        else:
+            _count_discard(discarded, host)
+            status = data.get("status", 0)
+            if _wants_errors(config) and isinstance(status, int) and status >= 500:
+                _count_error(errors, host, status)
+            return None  # Discard
+
+        # 2. Only the row fields (and a preview for VIP) travel to the DB worker
+        return build_record(line, data, host, level)
+
+    except Exception as e:
+        log_error(f"Error processing log line: {e}", exc_info=True)
+        _count_discard(discarded, site_name(host))
+        return None
+
+    finally:
+        if timed:
+            PARSE_SECONDS.observe(time.perf_counter() - started)
+
+
+# Config generation this worker process last loaded (process pools only)
+_worker_generation = None
+
+
+def parse_batch(
+    lines: List[bytes], generation: Optional[int] = None
+) -> Tuple[List[LogRecord], Dict[str, int], Dict[str, Dict[int, int]]]:
+    """
+    Pool entry point. Reloads rules.json when the parent has reloaded it.
+    Returns the records, the number of discarded lines per site and the
+    discarded 5xx lines per site and status.
+    """
+    global _worker_generation
+    if generation is not None and generation != _worker_generation:
+        if _worker_generation is not None:
+            config_manager.load_configs()
+        _worker_generation = generation
+
+    records = []
+    discarded = {}
+    errors = {}
+    for line in lines:
+        record = parse_line(line, discarded, errors)
+        if record is not None:
+            records.append(record)
+    return records, discarded, errors
+
+
+def _gil_enabled() -> bool:
+    return getattr(sys, "_is_gil_enabled", lambda: True)()
+
+
+class ParsePool:
+    """
+    Runs parse_batch off the event loop. Uses processes on regular builds
+    and threads on free-threaded builds, where threads scale across cores.
+    Worker processes keep their own (disabled) metrics; the server times
+    each batch round trip instead.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.uses_processes = _gil_enabled()
+        if self.uses_processes:
+            # spawn: forking a process that already runs the DB thread is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="parse"
+            )
+
+    async def parse(
+        self, lines: List[bytes]
+    ) -> Tuple[List[LogRecord], Dict[str, int], Dict[str, Dict[int, int]]]:
+        # Threads share config_manager, so only processes need the generation
+        generation = config_manager.generation if self.uses_processes else None
+        future = self._executor.submit(parse_batch, lines, generation)
+        return await anyio.to_thread.run_sync(future.result)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,6 +1,139 @@
 # core/processing.py
 import json
-from typing import Dict, Any
+import math
+import re
+from typing import NamedTuple, Optional, Tuple
+
+try:  # Optional faster decoder for lines that are actually stored
+    import orjson
+
+    loads = orjson.loads
+except ImportError:  # pragma: no cover - depends on environment
+    loads = json.loads
+
+# Classification levels returned by RuleMatcher.classify
+DISCARD = 0
+IMPORTANT = 1
+VERY_IMPORTANT = 2
+
+
+def _compile_keywords(keywords) -> Tuple[str, ...]:
+    """Keywords deduplicated, longest first so vip_rule() names the most specific."""
+    return tuple(sorted(set(keywords), key=len, reverse=True))
+
+
+# Caddy writes request.method/host/uri before request.headers, so the first
+# occurrence of each key inside that window belongs to the request object.
+_REQUEST_START = b'"request":{'
+_HEADERS_START = b'"headers":'
+# Runs of plain characters are one repeat each, which keeps the regex
+# engine's backtracking stack small on long strings
+_PEEK_RE = re.compile(rb'"(method|host|uri)":("(?:[^"\\]+|\\.)*")')
+
+
+# Caddy writes the top-level status unspaced; inside JSON strings the quotes
+# are escaped, so this cannot match a header or URI
+_STATUS_5XX = b'"status":5'
+
+
+def _decode_json_str(raw: bytes) -> str:
+    if b"\\" in raw:
+        return json.loads(raw)
+    return raw[1:-1].decode("utf-8")
+
+
+def peek_request(line: bytes) -> Optional[Tuple[str, str, str]]:
+    """
+    Cheaply extracts (host, method, uri) from a raw Caddy access log line
+    without decoding the whole document. Returns None when the line does
+    not have the expected shape; callers should fall back to a full decode.
+    """
+    start = line.find(_REQUEST_START)
+    if start < 0:
+        return None
+    end = line.find(_HEADERS_START, start)
+    if end < 0:
+        return None
+
+    found = {}
+    for match in _PEEK_RE.finditer(line, start, end):
+        key = match.group(1)
+        if key not in found:
+            found[key] = match.group(2)
+
+    if len(found) < 3:
+        return None
+    try:
+        return (
+            _decode_json_str(found[b"host"]),
+            _decode_json_str(found[b"method"]),
+            _decode_json_str(found[b"uri"]),
+        )
+    except ValueError:  # Also covers UnicodeDecodeError
+        return None
+
+
+def peek_error_status(line: bytes) -> int:
+    """The status of a raw log line if it is a 5xx, else 0, without decoding it."""
+    i = line.find(_STATUS_5XX)
+    if i < 0:
+        return 0
+    start = i + len(_STATUS_5XX) - 1
+    digits = line[start : start + 3]
+    if len(digits) < 3 or not digits.isdigit() or line[start + 3 : start + 4].isdigit():
+        return 0
+    return int(digits)
+
+
+class RuleMatcher:
+    """
+    Pre-compiled form of a SiteConfig used on the hot path. The URI is
+    lowered once per line and each keyword is a plain substring test; one
+    alternation regex over all keywords measured slower
+    (benchmarks/bench_classify.py).
+    """
+
+    __slots__ = ("important_methods", "important_paths", "vip_methods", "vip_paths")
+
+    def __init__(self, config: "SiteConfig"):
+        self.important_methods = frozenset(config.important_methods)
+        self.important_paths = _compile_keywords(config.important_paths)
+        self.vip_methods = frozenset(config.very_important_methods)
+        self.vip_paths = _compile_keywords(config.very_important_paths)
+
+    def is_important(self, method: str, uri_lower: str) -> bool:
+        if method not in self.important_methods:
+            return False
+        for path in self.important_paths:
+            if path in uri_lower:
+                return True
+        return False
+
+    def is_very_important(self, method: str, uri_lower: str) -> bool:
+        return self.vip_rule(method, uri_lower) is not None
+
+    def vip_rule(self, method: str, uri_lower: str) -> Optional[str]:
+        """The very_important_paths keyword a very important request matched."""
+        if method not in self.vip_methods:
+            return None
+        for path in self.vip_paths:
+            if path in uri_lower:
+                return path
+        return None
+
+    def classify(self, method: str, uri: str) -> int:
+        """Returns VERY_IMPORTANT, IMPORTANT or DISCARD in a single pass."""
+        # Inlined is_very_important / is_important: this runs for every line
+        uri_lower = uri.lower()
+        if method in self.vip_methods:
+            for path in self.vip_paths:
+                if path in uri_lower:
+                    return VERY_IMPORTANT
+        if method in self.important_methods:
+            for path in self.important_paths:
+                if path in uri_lower:
+                    return IMPORTANT
+        return DISCARD
 
 
 class SiteConfig:
@@ -13,6 +146,8 @@ class SiteConfig:
         important_paths: list = [],
         very_important_methods: list = [],
         very_important_paths: list = [],
+        rotation=None,
+        alerts=None,
     ):
         self.name = name
         self.important_methods = important_methods
@@ -21,71 +156,193 @@ class SiteConfig:
         self.very_important_methods = very_important_methods
         self.very_important_paths = very_important_paths
 
+        # Optional RotationPolicy; the DB worker's default applies when None
+        self.rotation = rotation
+        # Optional AlertPolicy; core.alerts.DEFAULT_ALERTS applies when None
+        self.alerts = alerts
 
-class CaddyLog:
-    def __init__(self, raw_data: Dict[str, Any], site_config: SiteConfig):
-        self.raw = raw_data
-        self.config = site_config
+        self._matcher = None
 
-        # Extract Request Data
-        req = raw_data.get("request", {})
-        self.host = req.get("host", "unknown")
-        self.remote_ip = req.get("remote_ip", "")
-        self.method = req.get("method", "")
-        self.uri = req.get("uri", "")
-        self.headers = json.dumps(req.get("headers", {}))
+    def compile(self) -> "SiteConfig":
+        """Builds the RuleMatcher for this config. Returns self for chaining."""
+        self._matcher = RuleMatcher(self)
+        return self
 
-        # Caddy doesn't always log body by default unless configured,
-        # but if it's there, we grab it.
-        self.body = json.dumps(raw_data.get("request_body", {}))
+    @property
+    def matcher(self) -> RuleMatcher:
+        if self._matcher is None:
+            self.compile()
+        return self._matcher
 
-        # Cookies are usually inside headers, but we can extract strictly if needed
-        self.cookies = req.get("headers", {}).get("Cookie", [])
-        if isinstance(self.cookies, list):
-            self.cookies = "; ".join(self.cookies)
 
-        # Extract Response Data
-        self.status = raw_data.get("status", 0)
-        self.resp_headers = json.dumps(raw_data.get("resp_headers", {}))
+# Number of leading LogRecord fields that make up a logs table row
+ROW_LEN = 10
 
-        # Metrics
-        self.duration = raw_data.get("duration", 0)
 
-    @property
-    def is_important(self) -> bool:
-        if self.method in self.config.important_methods:
-            for path in self.config.important_paths:
-                if path in self.uri.lower():
-                    return True
+class LogRecord(NamedTuple):
+    """
+    One accepted log line, as queued for the DB writer. The first ROW_LEN
+    fields follow INSERT_LOG_SQL; headers and resp_headers are the original
+    JSON text from the line, not re-encoded.
+    """
 
-        return False
+    host: str
+    remote_ip: str
+    method: str
+    uri: str
+    status: int
+    headers: str
+    body: str
+    cookies: str
+    resp_headers: str
+    duration: Optional[float]
+    site: str
+    vip: bool
+    preview: Optional[str]
 
     @property
-    def is_very_important(self) -> bool:
-        if self.method in self.config.very_important_methods:
-            for path in self.config.very_important_paths:
-                if path in self.uri.lower():
-                    return True
+    def row(self) -> tuple:
+        return self[:ROW_LEN]
 
-        return False
 
-    def get_preview_string(self):
-        """Generates a short summary for Telegram captions."""
-        # Example: 🚨 500 POST /admin/login (1.2.3.4)
-        icon = "🆕" if self.is_very_important else "📝"
-        return f"{icon} <b>{self.status}</b> {self.method} {self.uri}\nIP: <code>{self.remote_ip}</code>"
+# Strings (with escapes) and brackets: enough to find where a JSON value ends
+_JSON_TOKEN_RE = re.compile(rb'"(?:[^"\\]+|\\.)*"|[{}\[\]]')
+_RESP_HEADERS_KEY = b'"resp_headers":'
 
-    def to_tuple(self):
-        """Helper for SQLite insertion"""
-        return (
-            self.host,
-            self.remote_ip,
-            self.method,
-            self.uri,
-            self.status,
-            self.headers,
-            self.body,
-            self.cookies,
-            self.resp_headers,
-            self.duration,
+
+def _raw_object(line: bytes, start: int) -> Optional[str]:
+    """The JSON object starting at line[start] as text, or None if it isn't one."""
+    if start < 0 or line[start : start + 1] != b"{":
+        return None
+    depth = 0
+    for match in _JSON_TOKEN_RE.finditer(line, start):
+        token = match.group()
+        if token in (b"{", b"["):
+            depth += 1
+        elif token in (b"}", b"]"):
+            depth -= 1
+            if depth == 0:
+                return line[start : match.end()].decode("utf-8")
+    return None
+
+
+def _raw_headers(line: bytes, request: dict) -> str:
+    start = line.find(_REQUEST_START)
+    end = line.find(_HEADERS_START, start) if start >= 0 else -1
+    raw = _raw_object(line, end + len(_HEADERS_START)) if end >= 0 else None
+    if raw is None:
+        raw = json.dumps(request.get("headers", {}), separators=(",", ":"))
+    return raw
+
+
+def _raw_resp_headers(line: bytes, data: dict) -> str:
+    # Caddy writes resp_headers last; a nested key of that name comes earlier
+    key = line.rfind(_RESP_HEADERS_KEY)
+    raw = _raw_object(line, key + len(_RESP_HEADERS_KEY)) if key >= 0 else None
+    if raw is None:
+        raw = json.dumps(data.get("resp_headers", {}), separators=(",", ":"))
+    return raw
+
+
+# Low-cardinality strings (hosts, methods) are shared between records
+# instead of each record holding its own decoded copy
+_SHARED_MAX = 4096
+_shared = {}
+
+
+def _share(value: str) -> str:
+    shared = _shared.get(value)
+    if shared is not None:
+        return shared
+    if len(_shared) < _SHARED_MAX:
+        _shared[value] = value
+    return value
+
+
+def format_preview(status, method, uri, remote_ip, vip=True) -> str:
+    """Generates a short summary for Telegram captions."""
+    # Example: 🚨 500 POST /admin/login (1.2.3.4)
+    icon = "🆕" if vip else "📝"
+    return f"{icon} <b>{status}</b> {method} {uri}\nIP: <code>{remote_ip}</code>"
+
+
+def _as_status(value) -> int:
+    """Caddy writes an int; anything else a client sends counts as 0."""
+    if type(value) is int:
+        return value
+    try:
+        return int(value) if isinstance(value, (str, float)) else 0
+    except (ValueError, OverflowError):
+        return 0
+
+
+# Go durations, as Caddy writes them with `duration_format string`: 1.5ms, 1m2.5s
+_GO_DURATION_PART = r"(\d+(?:\.\d+)?)(ms|us|µs|μs|ns|h|m|s)"
+_GO_DURATION_RE = re.compile(f"(?:{_GO_DURATION_PART})+")
+_GO_DURATION_PART_RE = re.compile(_GO_DURATION_PART)
+_GO_DURATION_UNITS = {
+    "h": 3600.0,
+    "m": 60.0,
+    "s": 1.0,
+    "ms": 1e-3,
+    "us": 1e-6,
+    "µs": 1e-6,
+    "μs": 1e-6,
+    "ns": 1e-9,
+}
+
+
+def _as_duration(value) -> Optional[float]:
+    """Seconds as a float, or None when the line has no usable duration."""
+    if isinstance(value, str):
+        if not _GO_DURATION_RE.fullmatch(value):
+            return None
+        return sum(
+            float(amount) * _GO_DURATION_UNITS[unit]
+            for amount, unit in _GO_DURATION_PART_RE.findall(value)
         )
+    if type(value) not in (int, float):
+        return None
+    try:
+        value = float(value)
+    except OverflowError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+def build_record(line: bytes, data: dict, site: str, level: int) -> LogRecord:
+    """
+    Turns a decoded, accepted line into a LogRecord. Keeps no reference to
+    `data`, so the decoded dict is freed as soon as the caller drops it.
+    """
+    req = data.get("request", {})
+    headers = req.get("headers", {})
+    remote_ip = req.get("remote_ip", "")
+    if not isinstance(remote_ip, str):
+        remote_ip = str(remote_ip)  # Used as a key by the stats and alerts
+    method = _share(req.get("method", ""))
+    uri = req.get("uri", "")
+    status = _as_status(data.get("status", 0))
+    vip = level == VERY_IMPORTANT
+
+    cookies = headers.get("Cookie", [])
+    if isinstance(cookies, list):
+        cookies = "; ".join(cookies)
+
+    return LogRecord(
+        _share(req.get("host", "unknown")),
+        remote_ip,
+        method,
+        uri,
+        status,
+        _raw_headers(line, req),
+        # Caddy doesn't always log body by default unless configured,
+        # but if it's there, we grab it.
+        json.dumps(data["request_body"]) if "request_body" in data else "{}",
+        cookies,
+        _raw_resp_headers(line, data),
+        _as_duration(data.get("duration", 0)),
+        _share(site),
+        vip,
+        format_preview(status, method, uri, remote_ip) if vip else None,
+    )
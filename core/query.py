@@ -0,0 +1,288 @@
+# core/query.py
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import anyio
+from utils.logger import log_event, log_error
+
+CREATE_CATALOG_SQL = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    site TEXT,
+    rows INTEGER,
+    min_id INTEGER,
+    max_id INTEGER,
+    first_ts TEXT,
+    last_ts TEXT,
+    indexed INTEGER DEFAULT 0,
+    archived_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_files_site ON files(site, last_ts);
+"""
+
+# Built lazily on archived files the first time they are queried
+ARCHIVE_INDEXES = {
+    "idx_logs_remote_ip": "remote_ip",
+    "idx_logs_status": "status",
+    "idx_logs_created_at": "created_at",
+}
+
+# SQLite allows 10 attached databases per connection by default
+DEFAULT_ATTACH_BATCH = 8
+
+# Seconds between retention passes (besides the one after each new archive)
+PRUNE_INTERVAL = 3600
+
+
+def _data_table(conn, schema="main"):
+    """logs in the plain format, log_rows behind the compact format's view."""
+    row = conn.execute(
+        f"SELECT type FROM {schema}.sqlite_master WHERE name = 'logs'"
+    ).fetchone()
+    return "log_rows" if row and row[0] == "view" else "logs"
+
+
+def _utc(ts: float) -> str:
+    """Same format as SQLite's CURRENT_TIMESTAMP, so strings compare in order."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+
+
+class ArchiveCatalog:
+    """
+    Index of retained, rotated site DBs: per file its site, row count, id
+    range and time range, so queries only open the files that can match.
+    """
+
+    def __init__(self, folder="data/archive", retention_days=7):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.retention_days = retention_days
+        self.path = self.folder / "catalog.db"
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(CREATE_CATALOG_SQL)
+
+    def _connect(self):
+        return sqlite3.connect(str(self.path), timeout=10)
+
+    def register(self, path: Path, site: str):
+        """Records an archived DB file. Called from the export thread."""
+        src = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            table = _data_table(src)
+            stats = src.execute(
+                f"SELECT COUNT(*), MIN(id), MAX(id), MIN(created_at), MAX(created_at) "
+                f"FROM {table}"
+            ).fetchone()
+        finally:
+            src.close()
+
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO files "
+                "(path, site, rows, min_id, max_id, first_ts, last_ts, indexed, archived_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)",
+                (str(path), site, *stats, time.time()),
+            )
+        self.prune()
+
+    def prune(self):
+        """Drops archived files older than retention_days."""
+        if not self.retention_days:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        with self._lock, self._connect() as conn:
+            old = conn.execute(
+                "SELECT path FROM files WHERE archived_at < ?", (cutoff,)
+            ).fetchall()
+            for (path,) in old:
+                Path(path).unlink(missing_ok=True)
+            conn.execute("DELETE FROM files WHERE archived_at < ?", (cutoff,))
+
+    async def watch(self, interval=PRUNE_INTERVAL):
+        """Applies retention periodically, so it also holds while nothing rotates."""
+        while True:
+            try:
+                await anyio.to_thread.run_sync(self.prune)
+            except Exception as e:
+                log_error(f"Archive pruning failed: {e}", exc_info=True)
+            await anyio.sleep(interval)
+
+    def files(self, site=None, since=None):
+        """[(path, indexed)] of archives for `site` (or all) with rows after `since`."""
+        sql = "SELECT path, indexed FROM files WHERE rows > 0"
+        args = []
+        if site is not None:
+            sql += " AND site = ?"
+            args.append(site)
+        if since is not None:
+            sql += " AND last_ts >= ?"
+            args.append(_utc(since))
+        with self._lock, self._connect() as conn:
+            return conn.execute(sql + " ORDER BY last_ts DESC", args).fetchall()
+
+    def mark_indexed(self, path):
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE files SET indexed = 1 WHERE path = ?", (str(path),))
+
+    def summary(self):
+        with self._lock, self._connect() as conn:
+            return conn.execute("SELECT COUNT(*), SUM(rows) FROM files").fetchone()
+
+
+class QueryEngine:
+    """
+    Runs filtered aggregate queries over archived site DBs (plus the live
+    ones, read-only) in a thread pool. Files are ATTACHed in batches so one
+    connection scans several DBs with a single UNION ALL query.
+    """
+
+    def __init__(
+        self,
+        catalog: ArchiveCatalog,
+        live_folder="data",
+        workers=4,
+        attach_batch=DEFAULT_ATTACH_BATCH,
+    ):
+        self.catalog = catalog
+        self.live_folder = Path(live_folder)
+        self.attach_batch = attach_batch
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+        self._index_lock = threading.Lock()
+        self._indexing = set()
+
+    # --- Public queries (blocking; call from a worker thread) ---
+
+    def top(self, site, since=None, path_prefix=None, limit=10):
+        """Top paths, IPs and status codes for one site."""
+        files = self._files(site, since)
+        where, args = self._filters(path_prefix=path_prefix, since=since)
+        return {
+            "files": len(files),
+            "rows": sum(self._count(files, where, args).values()),
+            "paths": self._top(files, "uri", where, args, limit),
+            "ips": self._top(files, "remote_ip", where, args, limit),
+            "statuses": self._top(files, "status", where, args, limit),
+        }
+
+    def ip(self, addr, since=None, status=None, limit=10):
+        """Hits by one IP across all sites: per site, per status, top paths."""
+        files = self._files(None, since)
+        where, args = self._filters(ip=addr, status=status, since=since)
+        return {
+            "files": len(files),
+            "rows": sum(self._count(files, where, args).values()),
+            "sites": self._top(files, "host", where, args, limit),
+            "statuses": self._top(files, "status", where, args, limit),
+            "paths": self._top(files, "uri", where, args, limit),
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- Internals ---
+
+    def _files(self, site, since):
+        files, unindexed = [], []
+        if self.catalog is not None:
+            for path, indexed in self.catalog.files(site, since):
+                files.append(Path(path))
+                if not indexed:
+                    unindexed.append(Path(path))
+        if unindexed:
+            # Once per archived file, in parallel, before the first scan
+            for _ in self._pool.map(self._build_indexes, unindexed):
+                pass
+
+        # Live DBs are read as-is: no index builds while the writer owns them
+        pattern = f"{site}.db" if site else "*.db"
+        for live in self.live_folder.glob(pattern):
+            if not live.name.startswith(("log_", "snapshot_", "outbox")):
+                files.append(live)
+        return files
+
+    @staticmethod
+    def _filters(ip=None, status=None, path_prefix=None, since=None):
+        clauses, args = [], []
+        if ip is not None:
+            clauses.append("remote_ip = ?")
+            args.append(ip)
+        if status is not None:
+            clauses.append("status = ?")
+            args.append(status)
+        if path_prefix is not None:
+            clauses.append("uri >= ? AND uri < ?")
+            args += [path_prefix, path_prefix + "\uffff"]
+        if since is not None:
+            clauses.append("created_at >= ?")
+            args.append(_utc(since))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def _count(self, files, where, args):
+        return self._run(files, "COUNT(*)", None, where, args)
+
+    def _top(self, files, column, where, args, limit):
+        counts = self._run(files, "COUNT(*)", column, where, args)
+        return Counter(counts).most_common(limit)
+
+    def _run(self, files, aggregate, group_by, where, args):
+        """Fans batches of files out to the pool and merges their counts."""
+        batches = [
+            files[i : i + self.attach_batch]
+            for i in range(0, len(files), self.attach_batch)
+        ]
+        futures = [
+            self._pool.submit(self._run_batch, batch, aggregate, group_by, where, args)
+            for batch in batches
+        ]
+        total = Counter()
+        for future in futures:
+            try:
+                total.update(future.result())
+            except Exception as e:
+                log_error(f"Archive query batch failed: {e}", exc_info=True)
+        return total
+
+    def _run_batch(self, batch, aggregate, group_by, where, args):
+        conn = sqlite3.connect(":memory:")
+        try:
+            selects = []
+            for n, path in enumerate(batch):
+                conn.execute(f"ATTACH DATABASE ? AS db{n}", (f"file:{path}?mode=ro",))
+                table = _data_table(conn, f"db{n}")
+                key = group_by or "NULL"
+                selects.append(f"SELECT {key} AS k FROM db{n}.{table}{where}")
+
+            sql = (
+                f"SELECT k, {aggregate} FROM ("
+                + " UNION ALL ".join(selects)
+                + ") GROUP BY k"
+            )
+            rows = conn.execute(sql, args * len(selects)).fetchall()
+            return {k: v for k, v in rows}
+        finally:
+            conn.close()
+
+    def _build_indexes(self, path):
+        with self._index_lock:
+            if path in self._indexing:
+                return
+            self._indexing.add(path)
+        conn = sqlite3.connect(str(path), timeout=30)
+        try:
+            table = _data_table(conn)
+            for name, column in ARCHIVE_INDEXES.items():
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({column})")
+            conn.commit()
+        except sqlite3.Error as e:
+            log_error(f"Failed to index {path}: {e}")
+            with self._index_lock:
+                self._indexing.discard(path)
+            return
+        finally:
+            conn.close()
+        self.catalog.mark_indexed(path)
+        log_event(f"Built query indexes on {path}")
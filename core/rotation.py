@@ -0,0 +1,90 @@
+# core/rotation.py
+import heapq
+import itertools
+import time
+from typing import Optional
+
+
+class RotationPolicy:
+    """
+    When a site DB gets rotated. Any limit left as None/0 is not checked.
+      max_rows:     rows in the live DB
+      max_bytes:    estimated DB size in bytes
+      max_age:      seconds since the first row was written
+      min_interval: seconds that must pass between two automatic rotations
+    """
+
+    __slots__ = ("max_rows", "max_bytes", "max_age", "min_interval")
+
+    def __init__(self, max_rows=None, max_bytes=None, max_age=None, min_interval=0):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.min_interval = min_interval
+
+    @classmethod
+    def from_dict(cls, rules: dict) -> "RotationPolicy":
+        """Builds a policy from a rules.json "rotation" block."""
+        return cls(
+            max_rows=rules.get("max_rows"),
+            max_bytes=rules.get("max_bytes"),
+            max_age=rules.get("max_age"),
+            min_interval=rules.get("min_interval"),
+        )
+
+    def with_defaults(self, default: "RotationPolicy") -> "RotationPolicy":
+        """Fills unset (None) limits from `default`; 0 explicitly disables one."""
+        return RotationPolicy(
+            *(
+                default_value if value is None else value
+                for value, default_value in (
+                    (self.max_rows, default.max_rows),
+                    (self.max_bytes, default.max_bytes),
+                    (self.max_age, default.max_age),
+                    (self.min_interval, default.min_interval),
+                )
+            )
+        )
+
+    def size_reason(self, rows: int, size: int) -> Optional[str]:
+        """Reason string if a row/size limit is reached, else None."""
+        if self.max_rows and rows >= self.max_rows:
+            return "Limit Reached"
+        if self.max_bytes and size >= self.max_bytes:
+            return "Size Limit Reached"
+        return None
+
+
+def estimate_row_bytes(rows) -> int:
+    """Rough on-disk size of a batch, from its text lengths (no stat() calls)."""
+    total = 0
+    for row in rows:
+        total += 40  # Record header, numbers and created_at
+        for value in row:
+            if isinstance(value, str):
+                total += len(value)
+    return total
+
+
+class DeadlineHeap:
+    """Min-heap of (when, site, token, reason) timers for the DB worker."""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+
+    def push(self, when, site, token, reason):
+        heapq.heappush(self._heap, (when, next(self._seq), site, token, reason))
+
+    def next_in(self) -> Optional[float]:
+        """Seconds until the earliest deadline, or None when there is none."""
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.time())
+
+    def pop_due(self):
+        """Yields (site, token, reason) for every deadline that has passed."""
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, site, token, reason = heapq.heappop(self._heap)
+            yield site, token, reason
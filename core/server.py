@@ -1,68 +1,202 @@
+import time
+from typing import List
 import anyio
-import json
-from core.processing import CaddyLog
-from core.config_manager import config_manager
+from core.aggregates import traffic_stats
+from core.alerts import AlertEngine
+from core.metrics import (
+    BULK_BYTES,
+    BULK_DECODE_SECONDS,
+    LINES_RECEIVED,
+    PARSE_BATCH_SECONDS,
+    metrics,
+)
+from core.ingest_queue import LogBatch
+from core.pipeline import ParsePool, parse_batch
+from core.processing import LogRecord
+from core.framing import (
+    DEFAULT_MAX_FRAME,
+    DEFAULT_MAX_LINE,
+    FRAME_ACK,
+    FrameError,
+    FrameReader,
+    LineReader,
+    decode_frame,
+)
 from utils.logger import log_event, log_error
-from core.database import DBWorker
+from core.db_pool import DBWorkerPool
 
-db_worker_ref: DBWorker = None
+db_worker_ref: DBWorkerPool = None
+max_line_ref: int = DEFAULT_MAX_LINE
+max_frame_ref: int = DEFAULT_MAX_FRAME
+parse_pool_ref: ParsePool = None
+# Set in cluster ingest processes: records go to the writer process instead
+link_ref = None
+# Burst/5xx detection, run where records reach the DB workers
+alert_engine_ref: AlertEngine = None
 
+# Seconds to wait before retrying a full ingest queue
+BACKPRESSURE_DELAY = 0.01
+# Bulk frames are ingested in slices of this many lines
+BULK_SLICE_LINES = 512
+
+
+def set_db_worker(db_worker: DBWorkerPool, alert_engine: AlertEngine = None):
+    global db_worker_ref, alert_engine_ref
+    db_worker_ref = db_worker
+    alert_engine_ref = alert_engine
+
+
+async def enqueue_batch(batch: LogBatch):
+    if metrics.enabled:
+        batch = batch._replace(enqueued=time.perf_counter())
+    if db_worker_ref:
+        # Backpressure: stop reading this socket until the queue has room.
+        # Only the records that did not fit come back for another try.
+        batch = db_worker_ref.offer_batch(batch)
+        while batch is not None:
+            await anyio.sleep(BACKPRESSURE_DELAY)
+            batch = db_worker_ref.offer_batch(batch)
+
+
+def record_discarded(discarded, now):
+    for site, count in discarded.items():
+        traffic_stats.record_discarded(site, count, now)
+
+
+async def ingest_lines(lines: List[bytes]):
+    """Parses, counts and queues lines; shared by the plain and bulk listeners."""
+    received = None
+    if metrics.enabled:
+        received = time.perf_counter()
+        LINES_RECEIVED.inc(len(lines))
 
-async def handle_log_line(line: bytes):
     try:
-        data = json.loads(line)
-        host = data.get("request", {}).get("host", "unknown")
-        if ":" in host:
-            host = host.split(":")[0]
-
-        # 1. Use ConfigManager
-        config = config_manager.get_config(host)
-        log_obj = CaddyLog(data, config)
-
-        preview_text = None
-        is_vip = log_obj.is_very_important
-
-        # 2. Generate Preview if VIP
-        if is_vip:
-            preview_text = log_obj.get_preview_string()
-            log_event(f"!!! VIP [{host}]: {log_obj.status} {log_obj.uri}")
-        elif log_obj.is_important:
-            log_event(f"* IMP [{host}]: {log_obj.method}")
+        if parse_pool_ref is not None:
+            # Parsing happens in the pool; the loop only moves bytes
+            if metrics.enabled:
+                started = time.perf_counter()
+                records, discarded, errors = await parse_pool_ref.parse(lines)
+                PARSE_BATCH_SECONDS.observe(time.perf_counter() - started)
+            else:
+                records, discarded, errors = await parse_pool_ref.parse(lines)
         else:
-            return  # Discard
-
-        if db_worker_ref:
-            # 3. Pass 'preview' to DB Worker
-            db_worker_ref.input_queue.put(
-                {
-                    "type": "log",
-                    "site": host,
-                    "data": log_obj.to_tuple(),
-                    "vip": is_vip,
-                    "preview": preview_text,
-                }
-            )
+            records, discarded, errors = parse_batch(lines)
+    except Exception as e:
+        # A bad batch must not take the connection (or the listener) down
+        log_error(f"Error parsing {len(lines)} log lines: {e}", exc_info=True)
+        return
 
+    if link_ref is not None:
+        await link_ref.send(records, discarded, errors, received)
+    else:
+        await ingest_records(records, discarded, errors, received)
+
+
+async def ingest_records(records: List[LogRecord], discarded, errors=None, received=None):
+    """
+    Counts and queues parsed records (here or in a cluster ingest process).
+    `errors` has the discarded 5xx lines per site and status, for alerts.
+    """
+    try:
+        # One clock read per batch; the rolling windows are 10s slots at the finest
+        now = traffic_stats.clock()
+        record_discarded(discarded, now)
+        if errors and alert_engine_ref is not None:
+            alert_engine_ref.record_errors(errors)
+        if records:
+            for record in records:
+                traffic_stats.record(record, now)
+            if alert_engine_ref is not None:
+                records = alert_engine_ref.process(records)
     except Exception as e:
-        log_error(f"Error processing log line: {e}", exc_info=True)
+        # Stats and alerts are best effort; the records are still stored
+        log_error(f"Error counting {len(records)} log records: {e}", exc_info=True)
+    if records:
+        await enqueue_batch(LogBatch(records, received))
 
 
 async def handle_connection(stream: anyio.abc.ByteStream):
-    # Same as Phase 1 ...
+    reader = LineReader(max_line_ref)
     async with stream:
-        buffer = b""
         async for chunk in stream:
-            buffer += chunk
-            while b"\n" in buffer:
-                line, buffer = buffer.split(b"\n", 1)
-                if line:
-                    await handle_log_line(line)
+            lines = reader.feed(chunk)
+            if lines:
+                await ingest_lines(lines)
+
+
+async def handle_bulk_connection(stream: anyio.abc.ByteStream):
+    """Length-prefixed, optionally compressed frames of many lines each."""
+    reader = FrameReader(max_frame_ref)
+    async with stream:
+        try:
+            async for chunk in stream:
+                for codec, payload in reader.feed(chunk):
+                    # Decompression stays off the event loop
+                    if metrics.enabled:
+                        started = time.perf_counter()
+                        lines = await anyio.to_thread.run_sync(
+                            decode_frame, codec, payload, max_line_ref
+                        )
+                        BULK_DECODE_SECONDS.observe(time.perf_counter() - started)
+                        BULK_BYTES.inc(len(payload), "wire")
+                        BULK_BYTES.inc(sum(len(line) + 1 for line in lines), "decoded")
+                    else:
+                        lines = await anyio.to_thread.run_sync(
+                            decode_frame, codec, payload, max_line_ref
+                        )
+                    # Slices keep each parse step (and its loop stall) short
+                    for i in range(0, len(lines), BULK_SLICE_LINES):
+                        await ingest_lines(lines[i : i + BULK_SLICE_LINES])
+                    await stream.send(FRAME_ACK)
+        except FrameError as e:
+            log_error(f"Closing bulk connection: {e}")
+        except anyio.BrokenResourceError:
+            pass  # Sender went away before reading its acks
 
 
-async def start_server(db_worker: DBWorker, host="0.0.0.0", port=9000):
-    global db_worker_ref
-    db_worker_ref = db_worker  # Store reference for handlers
+async def start_server(
+    db_worker: DBWorkerPool,
+    host="0.0.0.0",
+    port=9000,
+    max_line=DEFAULT_MAX_LINE,
+    parse_workers=0,
+    bulk_port=0,
+    max_frame=DEFAULT_MAX_FRAME,
+    reuse_port=False,
+    link=None,
+    alert_engine=None,
+):
+    """
+    Serves the log port (and bulk_port if set). In cluster ingest processes
+    db_worker is None, `link` carries records to the writer process and
+    reuse_port lets every process bind the same port.
+    """
+    global max_line_ref, max_frame_ref, parse_pool_ref, link_ref
+    set_db_worker(db_worker, alert_engine)  # Store references for handlers
+    max_line_ref = max_line
+    max_frame_ref = max_frame
+    link_ref = link
 
-    listener = await anyio.create_tcp_listener(local_host=host, local_port=port)
-    log_event(f"TCP Log Server listening on {host}:{port}")
-    await listener.serve(handle_connection)
+    # parse_workers=0 keeps parsing inline on the event loop
+    if parse_workers > 0:
+        parse_pool_ref = ParsePool(parse_workers)
+        log_event(f"Parsing offloaded to {parse_workers} workers")
+
+    try:
+        listener = await anyio.create_tcp_listener(
+            local_host=host, local_port=port, reuse_port=reuse_port
+        )
+        log_event(f"TCP Log Server listening on {host}:{port}")
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(listener.serve, handle_connection)
+            # bulk_port=0 leaves the compressed-frame listener off
+            if bulk_port:
+                bulk = await anyio.create_tcp_listener(
+                    local_host=host, local_port=bulk_port, reuse_port=reuse_port
+                )
+                log_event(f"Bulk frame listener on {host}:{bulk_port}")
+                tg.start_soon(bulk.serve, handle_bulk_connection)
+    finally:
+        if parse_pool_ref is not None:
+            parse_pool_ref.shutdown()
+            parse_pool_ref = None
@@ -0,0 +1,301 @@
+# core/spool.py
+"""
+Write-ahead spool for the ingest queue.
+
+Accepted records are appended to memory-mapped segment files before they
+are queued; the DB writer advances a checkpoint once they are committed.
+After a crash, everything past the checkpoint is replayed. Appends are a
+memcpy into the mapping (it survives a process crash as soon as it is
+made); a flusher thread msyncs at a fixed interval, so a power loss costs
+at most that many seconds. Segments behind the checkpoint are recycled.
+"""
+import errno
+import marshal
+import mmap
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from core.processing import LogRecord
+from utils.logger import log_error
+
+# Entry: payload length and CRC32, then the marshalled record tuples. The
+# CRC is seeded with the segment number, so stale entries in a recycled
+# segment never validate. A zero length (fresh, zero-filled space) ends a segment.
+ENTRY_HEADER = struct.Struct("<II")
+# Checkpoint file: segment number, offset, CRC32 of both
+CHECKPOINT = struct.Struct("<QQI")
+# Fixed marshal format, readable by later Python versions
+MARSHAL_VERSION = 4
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+DEFAULT_FSYNC_INTERVAL = 1.0
+# Emptied segments kept for reuse instead of being deleted
+SPARE_SEGMENTS = 2
+
+# (segment number, offset just past an entry)
+Position = Tuple[int, int]
+
+
+def _segment_name(number: int) -> str:
+    return f"seg-{number:010d}.wal"
+
+
+def _read_entries(view, number: int, offset: int) -> Iterator[Tuple[int, bytes]]:
+    """Valid entries of a segment from `offset`, as (end offset, payload)."""
+    size = len(view)
+    while offset + ENTRY_HEADER.size <= size:
+        length, crc = ENTRY_HEADER.unpack_from(view, offset)
+        start = offset + ENTRY_HEADER.size
+        if length == 0 or start + length > size:
+            return
+        payload = view[start : start + length]
+        if zlib.crc32(payload, number & 0xFFFFFFFF) != crc:
+            return
+        offset = start + length
+        yield offset, payload
+
+
+class _Segment:
+    __slots__ = ("number", "path", "file", "map")
+
+    def __init__(self, number: int, path: Path, size: int):
+        self.number = number
+        self.path = path
+        self.file = open(path, "r+b")
+        if os.fstat(self.file.fileno()).st_size < size:
+            # Reserve the blocks now: a write into a sparse mapping on a full
+            # disk would kill the process with SIGBUS instead of raising
+            try:
+                os.posix_fallocate(self.file.fileno(), 0, size)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    self.file.close()
+                    raise
+                self.file.truncate(size)  # Filesystem without fallocate
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class Spool:
+    """Segmented, memory-mapped write-ahead log of queued LogRecords."""
+
+    def __init__(
+        self,
+        folder,
+        segment_size=DEFAULT_SEGMENT_SIZE,
+        fsync_interval=DEFAULT_FSYNC_INTERVAL,
+    ):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+
+        checkpoint_path = self.folder / "checkpoint"
+        self.checkpoint_pos = self._load_checkpoint(checkpoint_path)
+        self._checkpoint_fd = os.open(checkpoint_path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._checkpoint_dirty = False
+
+        # Segment files on disk by number; those at or past the checkpoint
+        # hold records that may not have been committed and are replayed
+        self._files: Dict[int, Path] = {}
+        for path in self.folder.glob("seg-*.wal"):
+            self._files[int(path.stem.split("-")[1])] = path
+        self._spares = sorted(self.folder.glob("spare-*.wal"))
+        first = self.checkpoint_pos[0] if self.checkpoint_pos else 0
+        for number in [n for n in self._files if n < first]:
+            self._recycle(self._files.pop(number))
+        self._replay = sorted(self._files)
+        # New appends start in a fresh segment past everything on disk
+        self._next_number = max(self._replay, default=first) + 1
+        self.replay_end: Position = (self._next_number, 0)
+
+        self._head: Optional[_Segment] = None
+        self._offset = 0
+        self._open: Dict[int, _Segment] = {}
+        self._dirty = set()
+        self._new_files = False
+        self._retired: List[int] = []
+        self.appended = 0
+        self.replayed = 0
+
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="SpoolFlush", daemon=True)
+        self._flusher.start()
+
+    @staticmethod
+    def _load_checkpoint(path: Path) -> Optional[Position]:
+        try:
+            data = path.read_bytes()[: CHECKPOINT.size]
+        except FileNotFoundError:
+            return None
+        if len(data) < CHECKPOINT.size:
+            return None
+        number, offset, crc = CHECKPOINT.unpack(data)
+        if zlib.crc32(data[:16]) != crc:
+            log_error("Spool checkpoint is corrupt; replaying every segment")
+            return None
+        return (number, offset)
+
+    # --- Hot path (ingest side) ---
+
+    def append(self, records: List[LogRecord]) -> Position:
+        """Spools a batch; returns the position to checkpoint once it is committed."""
+        payload = marshal.dumps([tuple(record) for record in records], MARSHAL_VERSION)
+        needed = ENTRY_HEADER.size + len(payload)
+        with self._lock:
+            head = self._head
+            if head is None or len(head.map) - self._offset < needed:
+                head = self._new_segment(needed)
+            start = self._offset
+            end = start + needed
+            crc = zlib.crc32(payload, head.number & 0xFFFFFFFF)
+            ENTRY_HEADER.pack_into(head.map, start, len(payload), crc)
+            head.map[start + ENTRY_HEADER.size : end] = payload
+            self._offset = end
+            self.appended += len(records)
+            if self.fsync_interval:
+                self._dirty.add(head.number)
+            else:
+                head.map.flush()
+            return (head.number, end)
+
+    def _new_segment(self, needed: int) -> _Segment:
+        number = self._next_number
+        self._next_number += 1
+        path = self.folder / _segment_name(number)
+        size = max(self.segment_size, needed + ENTRY_HEADER.size)
+        if self._spares:
+            self._spares.pop().rename(path)
+        else:
+            path.touch()
+        segment = _Segment(number, path, size)
+        self._files[number] = path
+        self._new_files = True
+        self._open[number] = segment
+        self._head = segment
+        self._offset = 0
+        return segment
+
+    # --- DB writer side ---
+
+    def replay(self, chunk_records: int) -> Iterator[List[LogRecord]]:
+        """
+        Yields records past the checkpoint, from the segments found at
+        startup, in chunks of at least chunk_records. Call finish_replay()
+        once they are committed.
+        """
+        chunk = []
+        for number in self._replay:
+            offset = 0
+            if self.checkpoint_pos and self.checkpoint_pos[0] == number:
+                offset = self.checkpoint_pos[1]
+            with open(self._files[number], "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    for _, payload in _read_entries(view, number, offset):
+                        try:
+                            rows = marshal.loads(payload)
+                            chunk.extend(LogRecord(*row) for row in rows)
+                        except (ValueError, TypeError, EOFError):
+                            log_error(f"Skipping corrupt spool entry in segment {number}")
+                            continue
+                        if len(chunk) >= chunk_records:
+                            self.replayed += len(chunk)
+                            yield chunk
+                            chunk = []
+        if chunk:
+            self.replayed += len(chunk)
+            yield chunk
+
+    def finish_replay(self):
+        self._replay = []
+        self.checkpoint(self.replay_end)
+
+    def checkpoint(self, position: Position):
+        """Everything up to `position` is committed (DB writer thread)."""
+        with self._lock:
+            if self.checkpoint_pos is not None and position <= self.checkpoint_pos:
+                return
+            self.checkpoint_pos = position
+            data = struct.pack("<QQ", *position)
+            os.pwrite(self._checkpoint_fd, data + struct.pack("<I", zlib.crc32(data)), 0)
+            self._checkpoint_dirty = True
+            # Segments wholly behind the checkpoint are closed and recycled
+            # by the flusher, off the hot path
+            for number in [n for n in self._files if n < position[0]]:
+                if number not in self._retired:
+                    self._retired.append(number)
+
+    # --- Flusher thread ---
+
+    def _flush_loop(self):
+        interval = self.fsync_interval or 1.0
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                log_error(f"Spool flush failed: {e}", exc_info=True)
+
+    def flush(self):
+        """msyncs dirty segments and the checkpoint, then recycles retired segments."""
+        with self._lock:
+            dirty = [self._open[n] for n in self._dirty if n in self._open]
+            self._dirty.clear()
+            sync_checkpoint = self._checkpoint_dirty
+            self._checkpoint_dirty = False
+            sync_folder, self._new_files = self._new_files, False
+            retired, self._retired = self._retired, []
+            retired_segments = [(self._files.pop(n), self._open.pop(n, None)) for n in retired]
+
+        # Only this thread closes segments, so these maps stay valid unlocked
+        for segment in dirty:
+            segment.map.flush()
+        if sync_checkpoint:
+            os.fsync(self._checkpoint_fd)
+        if sync_folder:
+            # Make new segment names durable too
+            fd = os.open(self.folder, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        for path, segment in retired_segments:
+            if segment is not None:
+                segment.close()
+            self._recycle(path)
+
+    def _recycle(self, path: Path):
+        with self._lock:
+            keep = len(self._spares) < SPARE_SEGMENTS and path.stat().st_size == self.segment_size
+            if keep:
+                spare = path.with_name(f"spare-{path.name}")
+                path.rename(spare)
+                self._spares.append(spare)
+        if not keep:
+            path.unlink()
+
+    def close(self):
+        self._stop.set()
+        if self._flusher.is_alive():
+            self._flusher.join()
+        self.flush()
+        with self._lock:
+            for segment in self._open.values():
+                segment.close()
+            self._open.clear()
+            self._head = None
+            os.close(self._checkpoint_fd)
+
+    def get_stats(self) -> dict:
+        return {
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "segments": len(self._files),
+            "checkpoint": self.checkpoint_pos,
+        }
@@ -0,0 +1,140 @@
+# core/storage.py
+import hashlib
+import json
+import zlib
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    host TEXT, remote_ip TEXT, method TEXT, uri TEXT, status INTEGER,
+    headers TEXT, body TEXT, cookies TEXT, resp_headers TEXT, duration REAL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+INSERT_LOG_SQL = """
+INSERT INTO logs (host, remote_ip, method, uri, status, headers, body, cookies, resp_headers, duration)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Compact format: header sets are stored once in header_sets and referenced
+# by hash; large bodies are zlib-compressed into body_z. The logs view keeps
+# the plain column layout, with two differences: request headers leave out
+# Cookie (it is already in the cookies column and would make every set
+# unique), and compressed bodies come back as zlib BLOBs.
+CREATE_COMPACT_SQL = """
+CREATE TABLE IF NOT EXISTS header_sets (
+    hash BLOB PRIMARY KEY,
+    data TEXT
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS log_rows (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    host TEXT, remote_ip TEXT, method TEXT, uri TEXT, status INTEGER,
+    headers_hash BLOB, body TEXT, body_z BLOB, cookies TEXT,
+    resp_headers_hash BLOB, duration REAL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE VIEW IF NOT EXISTS logs AS
+SELECT r.id, r.host, r.remote_ip, r.method, r.uri, r.status,
+       h.data AS headers, COALESCE(r.body, r.body_z) AS body, r.cookies,
+       rh.data AS resp_headers, r.duration, r.created_at
+FROM log_rows r
+LEFT JOIN header_sets h ON h.hash = r.headers_hash
+LEFT JOIN header_sets rh ON rh.hash = r.resp_headers_hash;
+"""
+
+INSERT_COMPACT_SQL = """
+INSERT INTO log_rows (host, remote_ip, method, uri, status, headers_hash, body, body_z, cookies, resp_headers_hash, duration)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_HEADER_SET_SQL = "INSERT OR IGNORE INTO header_sets (hash, data) VALUES (?, ?)"
+
+# Known header-set hashes remembered per connection before the cache resets
+_KNOWN_HASHES_LIMIT = 50000
+
+
+class PlainStorage:
+    """The original one-table layout: every row carries its full JSON."""
+
+    name = "plain"
+    table = "logs"
+
+    def create(self, conn):
+        conn.execute(CREATE_TABLE_SQL)
+
+    def insert(self, conn, rows, state):
+        conn.executemany(INSERT_LOG_SQL, rows)
+
+
+class CompactStorage:
+    """Deduplicated header sets + compressed large bodies, behind a logs view."""
+
+    name = "compact"
+    table = "log_rows"
+
+    def __init__(self, body_threshold=512, level=6):
+        self.body_threshold = body_threshold
+        self.level = level
+
+    def create(self, conn):
+        conn.executescript(CREATE_COMPACT_SQL)
+
+    def insert(self, conn, rows, state):
+        # state: per-connection set of hashes already in header_sets
+        known = state.setdefault("known_hashes", set())
+        if len(known) > _KNOWN_HASHES_LIMIT:
+            known.clear()
+
+        new_sets = {}
+        out = []
+        for (host, ip, method, uri, status, headers, body, cookies, resp, dur) in rows:
+            h_hash = self._intern(self._without_cookie(headers), known, new_sets)
+            rh_hash = self._intern(resp, known, new_sets)
+
+            body_z = None
+            if body is not None and len(body) >= self.body_threshold:
+                body_z = zlib.compress(body.encode(), self.level)
+                body = None
+            out.append(
+                (host, ip, method, uri, status, h_hash, body, body_z, cookies, rh_hash, dur)
+            )
+
+        if new_sets:
+            conn.executemany(INSERT_HEADER_SET_SQL, new_sets.items())
+        conn.executemany(INSERT_COMPACT_SQL, out)
+
+    @staticmethod
+    def _without_cookie(headers):
+        if headers is None or '"Cookie"' not in headers:
+            return headers
+        parsed = json.loads(headers)
+        parsed.pop("Cookie", None)
+        return json.dumps(parsed)
+
+    @staticmethod
+    def _intern(text, known, new_sets):
+        if text is None:
+            return None
+        digest = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        if digest not in known:
+            known.add(digest)
+            new_sets[digest] = text
+        return digest
+
+
+STORAGE_FORMATS = {"plain": PlainStorage, "compact": CompactStorage}
+
+
+def detect_storage(conn, default):
+    """Keeps an existing DB file in the format it was created with."""
+    row = conn.execute(
+        "SELECT type FROM sqlite_master WHERE name = 'logs'"
+    ).fetchone()
+    if row is None:
+        return default
+    if row[0] == "table":
+        return default if default.name == "plain" else PlainStorage()
+    return default if default.name == "compact" else CompactStorage()
@@ -0,0 +1,186 @@
+# forwarder.py
+"""
+Tails a Caddy access log and ships it to a processor's bulk listener
+(BULK_PORT) as compressed frames of many lines each.
+
+Usage: python forwarder.py /var/log/caddy/access.log HOST:PORT
+           [--codec gzip|zstd|none] [--batch-lines N] [--batch-bytes N]
+           [--flush-interval S] [--from-start]
+
+Follows the file across rotation (rename + new file) and truncation. Each
+frame waits for the listener's ack and is re-sent after reconnecting if none
+arrives, so delivery is at-least-once: a connection dropping between queueing
+and ack can duplicate one frame.
+"""
+import argparse
+import os
+import sys
+import time
+import anyio
+from core.framing import (
+    CODECS,
+    CODEC_ZSTD,
+    FRAME_ACK,
+    LineReader,
+    encode_frame,
+    zstandard,
+)
+from utils.logger import log_event, log_error
+
+# Seconds between checks for new data in the log file
+POLL_INTERVAL = 0.2
+READ_SIZE = 256 * 1024
+# Reconnect backoff, doubled per failure up to the max
+RETRY_MIN = 0.5
+RETRY_MAX = 30.0
+# A frame not acked within this many seconds is re-sent on a new connection
+ACK_TIMEOUT = 30.0
+
+
+class LogTail:
+    """Complete new lines from a growing file, surviving rotation."""
+
+    def __init__(self, path, from_start=False, max_line=1024 * 1024):
+        self.path = path
+        self.max_line = max_line
+        self._file = None
+        self._inode = None
+        self._reader = LineReader(max_line)
+        self._open(from_start)
+
+    def _open(self, from_start=True):
+        try:
+            self._file = open(self.path, "rb")
+        except FileNotFoundError:
+            self._file = None
+            return
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        if not from_start:
+            self._file.seek(0, os.SEEK_END)
+        self._reader = LineReader(self.max_line)
+
+    def _drain(self):
+        lines = []
+        while True:
+            data = self._file.read(READ_SIZE)
+            if not data:
+                return lines
+            lines.extend(self._reader.feed(data))
+
+    def read(self):
+        if self._file is None:
+            self._open()
+            if self._file is None:
+                return []
+
+        lines = self._drain()
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return lines  # Rotated away; the new file is picked up next time
+
+        if st.st_ino != self._inode:
+            # Rotated: whatever was left in the old file is already drained
+            self._file.close()
+            self._open()
+            if self._file is not None:
+                lines.extend(self._drain())
+        elif st.st_size < self._file.tell():
+            # Truncated in place (copytruncate)
+            self._file.seek(0)
+            self._reader = LineReader(self.max_line)
+            lines.extend(self._drain())
+        return lines
+
+
+class FrameSender:
+    """One TCP connection to the bulk listener, re-established on failure."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._stream = None
+        self._delay = RETRY_MIN
+
+    async def send(self, frame: bytes):
+        while True:
+            try:
+                if self._stream is None:
+                    self._stream = await anyio.connect_tcp(self.host, self.port)
+                    log_event(f"Connected to {self.host}:{self.port}")
+                await self._stream.send(frame)
+                with anyio.fail_after(ACK_TIMEOUT):
+                    ack = await self._stream.receive(1)
+                if ack != FRAME_ACK:
+                    raise OSError(f"unexpected reply {ack!r}")
+                self._delay = RETRY_MIN
+                return
+            except (OSError, TimeoutError, anyio.BrokenResourceError, anyio.EndOfStream) as e:
+                log_error(f"Send failed ({e!r}); retrying in {self._delay:.1f}s")
+                await self.close()
+                await anyio.sleep(self._delay)
+                self._delay = min(self._delay * 2, RETRY_MAX)
+
+    async def close(self):
+        if self._stream is not None:
+            try:
+                await self._stream.aclose()
+            except OSError:
+                pass
+            self._stream = None
+
+
+async def forward(args):
+    host, _, port = args.target.rpartition(":")
+    codec = CODECS[args.codec]
+    tail = LogTail(args.path, args.from_start)
+    sender = FrameSender(host or "127.0.0.1", int(port))
+
+    pending, pending_bytes = [], 0
+    oldest = None
+    try:
+        while True:
+            lines = tail.read()
+            if lines:
+                if not pending:
+                    oldest = time.monotonic()
+                pending.extend(lines)
+                pending_bytes += sum(len(line) + 1 for line in lines)
+
+            full = len(pending) >= args.batch_lines or pending_bytes >= args.batch_bytes
+            due = pending and time.monotonic() - oldest >= args.flush_interval
+            if full or due:
+                # Split what piled up (e.g. after a reconnect) into bounded frames
+                while pending:
+                    batch, pending = pending[: args.batch_lines], pending[args.batch_lines :]
+                    await sender.send(encode_frame(batch, codec, args.level))
+                pending_bytes = 0
+            elif not lines:
+                await anyio.sleep(POLL_INTERVAL)
+    finally:
+        await sender.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path", help="Caddy access log to follow")
+    parser.add_argument("target", help="HOST:PORT of the bulk listener")
+    parser.add_argument("--codec", choices=sorted(CODECS), default="gzip")
+    parser.add_argument("--level", type=int, default=6, help="compression level")
+    parser.add_argument("--batch-lines", type=int, default=2000)
+    parser.add_argument("--batch-bytes", type=int, default=1024 * 1024)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--from-start", action="store_true", help="ship existing lines too")
+    args = parser.parse_args()
+
+    if CODECS[args.codec] == CODEC_ZSTD and zstandard is None:
+        sys.exit("--codec zstd needs the zstandard package")
+
+    try:
+        anyio.run(forward, args)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
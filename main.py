@@ -1,32 +1,141 @@
 # main.py
 import sys
+from functools import partial
 import anyio
+import config
 from core.server import start_server
-from core.database import DBWorker
+from core.cluster import IngestCluster
+from core.framing import DEFAULT_MAX_FRAME, DEFAULT_MAX_LINE
+from core.archive import DEFAULT_PART_SIZE
+from core.alerts import AlertEngine
+from core.db_pool import DBWorkerPool
+from core.outbox import Outbox
+from core.spool import DEFAULT_FSYNC_INTERVAL, DEFAULT_SEGMENT_SIZE
+from core.query import ArchiveCatalog, QueryEngine
+from core.metrics import metrics, serve_metrics
+from core.config_manager import config_manager
 from core.bot import start_bot, setup_bot, file_sender_loop
 from utils.logger import log_event, log_error
 from utils.crash_reporter import send_crash_alert
 
 
 async def main():
-    # 1. Start DB Thread
-    db_worker = DBWorker(rotate_limit=1000)
+    # Rotated DBs are kept here (VACUUMed) for /top and /ip; 0 days disables it
+    retention_days = getattr(config, "ARCHIVE_RETENTION_DAYS", 7)
+    catalog = ArchiveCatalog("data/archive", retention_days) if retention_days else None
+    query_engine = QueryEngine(
+        catalog, "data", workers=getattr(config, "QUERY_WORKERS", 4)
+    )
+
+    # 1. Start DB Threads (one per shard)
+    db_worker = DBWorkerPool(
+        writers=getattr(config, "DB_WRITERS", 1),
+        rotate_limit=getattr(config, "ROTATE_LIMIT", 1000),
+        batch_size=getattr(config, "DB_BATCH_SIZE", 500),
+        flush_interval=getattr(config, "DB_FLUSH_INTERVAL", 0.05),
+        queue_size=getattr(config, "INGEST_QUEUE_SIZE", 100000),
+        overload_policy=getattr(config, "OVERLOAD_POLICY", "backpressure"),
+        sqlite_profile=getattr(config, "SQLITE_PROFILE", "fast"),
+        mmap_size=getattr(config, "SQLITE_MMAP_SIZE", 0),
+        storage_format=getattr(config, "STORAGE_FORMAT", "plain"),
+        body_compress_threshold=getattr(config, "BODY_COMPRESS_THRESHOLD", 512),
+        snapshot_pages_per_step=getattr(config, "SNAPSHOT_PAGES_PER_STEP", 256),
+        export_compression=getattr(config, "EXPORT_COMPRESSION", "gzip"),
+        export_part_size=getattr(config, "EXPORT_PART_SIZE", DEFAULT_PART_SIZE),
+        policy_lookup=config_manager.get_rotation,
+        archive_catalog=catalog,
+        spool_segment_size=getattr(config, "SPOOL_SEGMENT_SIZE", DEFAULT_SEGMENT_SIZE),
+        spool_fsync_interval=getattr(config, "SPOOL_FSYNC_INTERVAL", DEFAULT_FSYNC_INTERVAL),
+    )
+
+    # Pick up exports a previous run never uploaded, before new ones appear
+    outbox = Outbox("data/outbox.db")
+    outbox.recover_orphans("data", db_worker.recover_export)
     db_worker.start()
 
+    # Aggregates bursts of very important hits instead of notifying each one
+    alert_engine = AlertEngine(config_manager.get_config, db_worker.notification_queue.put)
+
+    # >1 parses in that many processes sharing the port; this one only writes
+    ingest_processes = getattr(config, "INGEST_PROCESSES", 1)
+    max_line = getattr(config, "MAX_LINE_BYTES", DEFAULT_MAX_LINE)
+    bulk_port = getattr(config, "BULK_PORT", 0)
+    max_frame = getattr(config, "MAX_FRAME_BYTES", DEFAULT_MAX_FRAME)
+    cluster = None
+    if ingest_processes > 1:
+        cluster = IngestCluster(
+            ingest_processes,
+            max_line=max_line,
+            bulk_port=bulk_port,
+            max_frame=max_frame,
+            config_poll=getattr(config, "CONFIG_POLL_INTERVAL", 1.0),
+        )
+
     # 2. Setup Bot References
-    setup_bot(db_worker)
+    setup_bot(db_worker, outbox, query_engine, cluster, alert_engine)
+
+    # Instrumentation is off (and free) unless the endpoint is configured
+    metrics_port = getattr(config, "METRICS_PORT", 0)
+    if metrics_port:
+        metrics.enabled = True
+        metrics.gauge(
+            "caddy_ingest_queue_depth",
+            "Logs waiting for the DB writers",
+            lambda: db_worker.get_queue_stats()["depth"],
+        )
+        metrics.gauge(
+            "caddy_outbox_pending", "Exports waiting for upload", outbox.pending
+        )
 
     try:
         log_event("🚀 Caddy Log Processor Starting...")
         async with anyio.create_task_group() as tg:
-            # Task A: TCP Server
-            tg.start_soon(start_server, db_worker)
+            # Task A: TCP Server (or the ingest processes serving its port)
+            if cluster is not None:
+                tg.start_soon(cluster.run, db_worker, alert_engine)
+            else:
+                tg.start_soon(
+                    partial(
+                        start_server,
+                        db_worker,
+                        max_line=max_line,
+                        parse_workers=getattr(config, "PARSE_WORKERS", 0),
+                        bulk_port=bulk_port,
+                        max_frame=max_frame,
+                        alert_engine=alert_engine,
+                    )
+                )
 
             # Task B: Bot Polling (Receiving Commands)
             tg.start_soon(start_bot)
 
             # Task C: Bot File Sender (Sending DBs)
-            tg.start_soon(file_sender_loop)
+            tg.start_soon(
+                file_sender_loop,
+                getattr(config, "TELEGRAM_RATE", 1.0),
+                getattr(config, "TELEGRAM_BURST", 3),
+                getattr(config, "UPLOAD_CONCURRENCY", 2),
+            )
+
+            # Task D: Reload rules.json when it changes (0 = only via /reload)
+            config_poll = getattr(config, "CONFIG_POLL_INTERVAL", 1.0)
+            if config_poll:
+                tg.start_soon(config_manager.watch, config_poll)
+
+            # Task E: Report bursts once they end (and while they last)
+            tg.start_soon(alert_engine.watch)
+
+            # Task F: Prometheus-style /metrics endpoint
+            if metrics_port:
+                tg.start_soon(
+                    serve_metrics,
+                    getattr(config, "METRICS_HOST", "127.0.0.1"),
+                    metrics_port,
+                )
+
+            # Task G: Archive retention, also when no rotations happen
+            if catalog is not None:
+                tg.start_soon(catalog.watch)
 
     except KeyboardInterrupt:
         log_event("User stopped the program.")
@@ -34,6 +143,8 @@ async def main():
         log_event("Shutting down...")
         db_worker.stop()
         db_worker.join()
+        outbox.close()
+        query_engine.shutdown()
         await anyio.sleep(0.5)  # Give asyncio a moment to cleanup
 
 
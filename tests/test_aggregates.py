@@ -0,0 +1,99 @@
+import json
+import pytest
+from core import aggregates
+from core.aggregates import SpaceSaving, TrafficStats
+from core.processing import IMPORTANT, build_record
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def record(site="example.com", ip="1.2.3.4", uri="/admin", status=200, duration=0.01):
+    line = json.dumps(
+        {
+            "request": {"host": site, "remote_ip": ip, "method": "GET", "uri": uri, "headers": {}},
+            "status": status,
+            "duration": duration,
+        },
+        separators=(",", ":"),
+    ).encode()
+    return build_record(line, json.loads(line), site, IMPORTANT)
+
+
+def test_space_saving_is_exact_below_capacity():
+    top = SpaceSaving(capacity=4)
+    for key in "aababcabcd":
+        top.add(key)
+    assert top.counts == {"a": 4, "b": 3, "c": 2, "d": 1}
+
+
+def test_space_saving_evicts_the_smallest_count():
+    top = SpaceSaving(capacity=2)
+    for key in "aaab":
+        top.add(key)
+    top.add("c")  # Replaces b and inherits its count
+    assert top.counts == {"a": 3, "c": 2}
+    assert top.min_count == 2
+
+
+def test_summary_counts_a_window():
+    clock = Clock()
+    stats = TrafficStats(clock)
+    for ip in ("1.1.1.1", "1.1.1.1", "2.2.2.2"):
+        stats.record(record(ip=ip, uri="/admin?x=1", status=200))
+    stats.record(record(status=500, duration=0.5))
+    stats.record_discarded("example.com", 6)
+
+    summary = stats.summary("1m")["example.com"]
+    assert (summary["received"], summary["accepted"], summary["discarded"]) == (10, 4, 6)
+    assert summary["statuses"] == {200: 3, 500: 1}
+    assert summary["top_ips"][0] == ("1.1.1.1", 2)
+    assert summary["top_paths"][0] == ("/admin", 4)
+    assert 0.01 <= summary["latency"]["p50"] < 0.0125
+    assert 0.5 <= summary["latency"]["p99"] < 0.625
+
+
+def test_summary_drops_old_slots():
+    clock = Clock()
+    stats = TrafficStats(clock)
+    stats.record(record())
+    clock.now += 30
+    stats.record(record())
+    assert stats.summary("1m")["example.com"]["accepted"] == 2
+    clock.now += 40
+    assert stats.summary("1m")["example.com"]["accepted"] == 1
+    assert stats.summary("5m")["example.com"]["accepted"] == 2
+
+
+@pytest.mark.parametrize(
+    "duration, seconds",
+    [("1.5ms", 0.0015), ("1m2.5s", 62.5), ("350µs", 0.00035), (2, 2.0), (0.25, 0.25)],
+)
+def test_build_record_reads_durations(duration, seconds):
+    assert record(duration=duration).duration == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize("duration", [None, "fast", "", "1.5", True, [1], {"ms": 1}])
+def test_unusable_durations_are_counted_but_not_timed(duration):
+    stats = TrafficStats(Clock())
+    rec = record(duration=duration)
+    assert rec.duration is None
+    stats.record(rec)
+    summary = stats.summary("1m")["example.com"]
+    assert summary["accepted"] == 1
+    assert summary["latency"]["p50"] is None
+
+
+def test_sites_beyond_max_share_one_entry(monkeypatch):
+    monkeypatch.setattr(aggregates, "MAX_SITES", 2)
+    stats = TrafficStats(Clock())
+    for site in ("a", "b", "c", "d"):
+        stats.record(record(site=site))
+    summary = stats.summary("1m")
+    assert set(summary) == {"a", "b", aggregates.OTHER_SITE}
+    assert summary[aggregates.OTHER_SITE]["accepted"] == 2
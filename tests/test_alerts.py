@@ -0,0 +1,148 @@
+import json
+import anyio
+import pytest
+from core import server
+from core.alerts import AlertEngine, AlertPolicy, _Window
+from core.config_manager import config_manager
+from core.pipeline import parse_batch
+from core.processing import IMPORTANT, VERY_IMPORTANT, SiteConfig, build_record
+
+SITE = "example.com"
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def site_config(**alerts):
+    return SiteConfig(SITE, ["GET"], ["admin"], ["POST"], ["login"], alerts=AlertPolicy(**alerts))
+
+
+def line(ip="1.2.3.4", method="POST", uri="/login", status=401):
+    return json.dumps(
+        {
+            "request": {"host": SITE, "remote_ip": ip, "method": method, "uri": uri, "headers": {}},
+            "status": status,
+            "duration": 0.01,
+        },
+        separators=(",", ":"),
+    ).encode()
+
+
+def record(level=VERY_IMPORTANT, **fields):
+    raw = line(**fields)
+    return build_record(raw, json.loads(raw), SITE, level)
+
+
+def engine(clock, max_keys=100, **alerts):
+    config = site_config(**alerts)
+    alerts_out = []
+    return AlertEngine(lambda site: config, alerts_out.append, clock, max_keys), alerts_out
+
+
+def test_window_counts_the_last_window():
+    window = _Window(60)  # 5s slots
+    for now, status in ((0, 401), (10, 401), (59, 500)):
+        window.add(now, status)
+    assert window.total == 3
+    window.add(65, 401, n=2)  # The slot at t=0 slides out
+    assert window.total == 4
+    assert window.statuses() == {401: 3, 500: 1}
+    assert window.first() == 10
+
+
+def test_burst_mutes_previews_then_reports_once():
+    clock = Clock()
+    alerts, sent = engine(clock, burst_threshold=3, burst_window=60)
+    batch = [record() for _ in range(5)]
+    out = alerts.process(batch)
+    assert [r.preview is not None for r in out] == [True, True, False, False, False]
+    assert alerts.muted == 3 and sent == []
+
+    clock.now += 30
+    alerts.sweep()
+    assert sent == []  # Still within the window
+    clock.now += 60
+    alerts.sweep()
+    [alert] = sent
+    assert alert["site"] == SITE
+    assert "1.2.3.4" in alert["alert"] and "5 times" in alert["alert"] and "401" in alert["alert"]
+
+
+def test_bursts_are_per_ip():
+    alerts, _ = engine(Clock(), burst_threshold=2)
+    out = alerts.process([record(ip="1.1.1.1"), record(ip="2.2.2.2")])
+    assert all(r.preview is not None for r in out)
+
+
+def test_long_burst_reports_progress():
+    clock = Clock()
+    alerts, sent = engine(clock, burst_threshold=2, burst_window=60, report_interval=120)
+    for _ in range(5):
+        alerts.process([record()])
+        clock.now += 40
+        alerts.sweep()
+    assert len(sent) == 1 and "Ongoing burst" in sent[0]["alert"]
+
+
+def test_evicted_burst_is_reported():
+    alerts, sent = engine(Clock(), max_keys=1, burst_threshold=2)
+    alerts.process([record(ip="1.1.1.1"), record(ip="1.1.1.1")])
+    alerts.process([record(ip="2.2.2.2")])
+    assert alerts.evicted == 1
+    assert len(sent) == 1 and "1.1.1.1" in sent[0]["alert"]
+
+
+def test_5xx_spike_alerts_once_per_window():
+    clock = Clock()
+    alerts, sent = engine(clock, error_threshold=3, error_window=60)
+    errors = [record(level=IMPORTANT, method="GET", uri="/admin", status=502) for _ in range(5)]
+    alerts.process(errors)
+    assert len(sent) == 1 and "5xx spike" in sent[0]["alert"]
+    clock.now += 61
+    alerts.record_errors({SITE: {500: 2, 503: 1}})
+    assert len(sent) == 2 and "503" in sent[1]["alert"]
+
+
+def test_discarded_5xx_lines_reach_the_spike_alert(monkeypatch):
+    config = site_config(error_threshold=3)
+    monkeypatch.setattr(config_manager, "get_config", lambda host: config)
+    lines = [line(method="GET", uri="/static/app.js", status=503) for _ in range(3)]
+    records, discarded, errors = parse_batch(lines)
+    assert records == [] and discarded == {SITE: 3}
+    assert errors == {SITE: {503: 3}}
+
+    sent = []
+    AlertEngine(lambda site: config, sent.append, Clock()).record_errors(errors)
+    assert len(sent) == 1
+
+
+@pytest.mark.parametrize(
+    "status, expected",
+    [(None, 0), ("502", 502), ("oops", 0), ([500], 0), (True, 0), (float("inf"), 0), (404, 404)],
+)
+def test_build_record_coerces_status(status, expected):
+    rec = record(status=status)
+    assert rec.status == expected
+    alerts, _ = engine(Clock(), error_threshold=1)
+    alerts.process([rec])  # Must not raise on a malformed status
+
+
+def test_ingest_records_survives_a_failing_engine(monkeypatch):
+    class Broken:
+        def process(self, records):
+            raise TypeError("boom")
+
+    queued = []
+
+    async def enqueue(batch):
+        queued.append(batch)
+
+    monkeypatch.setattr(server, "alert_engine_ref", Broken())
+    monkeypatch.setattr(server, "enqueue_batch", enqueue)
+    anyio.run(server.ingest_records, [record()], {})
+    assert len(queued) == 1 and len(queued[0].records) == 1
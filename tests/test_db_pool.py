@@ -0,0 +1,25 @@
+from core.db_pool import HashRing
+
+SITES = [f"site{i}.example.com" for i in range(2000)]
+
+
+def test_routes_are_stable_and_in_range():
+    ring = HashRing(4)
+    routes = [ring.shard_for(site) for site in SITES]
+    assert routes == [HashRing(4).shard_for(site) for site in SITES]
+    assert set(routes) == {0, 1, 2, 3}
+
+
+def test_sites_spread_over_shards():
+    ring = HashRing(4)
+    counts = [0] * 4
+    for site in SITES:
+        counts[ring.shard_for(site)] += 1
+    assert min(counts) > len(SITES) / 4 * 0.5
+
+
+def test_adding_a_shard_moves_few_sites():
+    before, after = HashRing(4), HashRing(5)
+    moved = sum(before.shard_for(site) != after.shard_for(site) for site in SITES)
+    # About 1/5 move to the new shard; modulo hashing would move about 4/5
+    assert moved < len(SITES) * 0.35
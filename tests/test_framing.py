@@ -0,0 +1,70 @@
+import gzip
+import pytest
+from core.framing import (
+    CODEC_GZIP,
+    CODEC_NONE,
+    FRAME_HEADER,
+    FrameError,
+    FrameReader,
+    LineReader,
+    decode_frame,
+    encode_frame,
+)
+
+
+def test_line_reader_splits_lines_across_chunks():
+    reader = LineReader()
+    assert reader.feed(b"one\ntw") == [b"one"]
+    assert reader.feed(b"o\nthr") == [b"two"]
+    assert reader.feed(b"ee\n\nfour\n") == [b"three", b"four"]
+    assert reader.feed(b"") == []
+
+
+def test_line_reader_drops_long_line_split_over_chunks():
+    reader = LineReader(max_line=8)
+    assert reader.feed(b"ok\n" + b"x" * 6) == [b"ok"]
+    assert reader.feed(b"x" * 6) == []
+    # The rest of the long line is skipped up to its newline
+    assert reader.feed(b"xxx\nnext\n") == [b"next"]
+    assert reader.dropped_lines == 1
+
+
+def test_line_reader_drops_long_line_within_one_chunk():
+    reader = LineReader(max_line=8)
+    assert reader.feed(b"a\n" + b"x" * 20 + b"\nb\n") == [b"a", b"b"]
+    assert reader.dropped_lines == 1
+
+
+def test_frame_reader_waits_for_whole_frames():
+    frame = encode_frame([b"a", b"b"], CODEC_NONE)
+    reader = FrameReader()
+    assert reader.feed(frame[:3]) == []
+    assert reader.feed(frame[3:] + frame[:1]) == [(CODEC_NONE, b"a\nb\n")]
+    assert reader.feed(frame[1:]) == [(CODEC_NONE, b"a\nb\n")]
+
+
+def test_frame_reader_rejects_bad_headers():
+    with pytest.raises(FrameError):
+        FrameReader().feed(FRAME_HEADER.pack(9, 1) + b"x")
+    with pytest.raises(FrameError):
+        FrameReader(max_frame=4).feed(FRAME_HEADER.pack(CODEC_NONE, 5))
+
+
+def test_decode_frame_round_trip():
+    lines = [b'{"n":%d}' % i for i in range(100)]
+    codec, payload = FrameReader().feed(encode_frame(lines, CODEC_GZIP))[0]
+    assert decode_frame(codec, payload) == lines
+
+
+def test_decode_frame_keeps_last_line_without_newline():
+    assert decode_frame(CODEC_GZIP, gzip.compress(b"a\nb")) == [b"a", b"b"]
+
+
+def test_decode_frame_drops_long_lines():
+    payload = gzip.compress(b"a\n" + b"x" * 50 + b"\nb\n")
+    assert decode_frame(CODEC_GZIP, payload, max_line=10) == [b"a", b"b"]
+
+
+def test_decode_frame_rejects_corrupt_payload():
+    with pytest.raises(FrameError):
+        decode_frame(CODEC_GZIP, gzip.compress(b"a\n" * 100)[:-10])
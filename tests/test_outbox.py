@@ -0,0 +1,86 @@
+import pytest
+from core.archive import export_site, export_source
+from core.outbox import Outbox
+
+TS = "1760000000"
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    box = Outbox(tmp_path / "state" / "outbox.db", base_delay=5.0, max_delay=60.0, max_attempts=3)
+    yield box
+    box.close()
+
+
+def recover(outbox, folder):
+    finalized = []
+    outbox.recover_orphans(str(folder), lambda path, site: finalized.append((path, site)))
+    queued = {item["path"]: item["site"] for _, item, _ in outbox.due(100)}
+    return finalized, queued
+
+
+@pytest.mark.parametrize(
+    "name, site",
+    [
+        (f"log_example.com_{TS}.db", "example.com"),
+        (f"log_my_site_{TS}.db", "my_site"),
+        (f"log_my_site_{TS}_2.db.gz", "my_site"),
+        (f"snapshot_a_b_{TS}.db.zst.003", "a_b"),
+        (f"log_app_2024_{TS}.db", "app_2024"),
+        ("log_x.db", None),  # A site's live DB, not an export
+        (f"log_x_{TS}.db.vacuum", None),
+        ("outbox.db", None),
+    ],
+)
+def test_export_site(name, site):
+    assert export_site(name) == site
+
+
+def test_export_source():
+    assert export_source(f"log_a_{TS}.db.gz.002") == f"log_a_{TS}.db"
+    assert export_source(f"log_a_{TS}.db") is None
+
+
+def test_recover_orphans_keeps_underscores_in_site(tmp_path, outbox):
+    (tmp_path / f"log_my_site_{TS}.db").write_bytes(b"db")
+    (tmp_path / f"log_my_site_{TS}_1.db.gz").write_bytes(b"gz")
+    finalized, queued = recover(outbox, tmp_path)
+    assert finalized == [(str(tmp_path / f"log_my_site_{TS}.db"), "my_site")]
+    assert queued == {str(tmp_path / f"log_my_site_{TS}_1.db.gz"): "my_site"}
+
+
+def test_recover_orphans_redoes_interrupted_exports(tmp_path, outbox):
+    source = tmp_path / f"log_a_{TS}.db"
+    source.write_bytes(b"db")
+    (tmp_path / f"log_a_{TS}.db.gz.001").write_bytes(b"part")
+    # Compression crashed after the source was replaced by its VACUUMed copy
+    (tmp_path / f"log_b_{TS}.db.vacuum").write_bytes(b"copy")
+    finalized, queued = recover(outbox, tmp_path)
+    assert sorted(finalized) == [(str(source), "a"), (str(tmp_path / f"log_b_{TS}.db"), "b")]
+    assert queued == {}
+    assert not (tmp_path / f"log_a_{TS}.db.gz.001").exists()
+
+
+def test_recover_orphans_skips_non_exports(tmp_path, outbox):
+    (tmp_path / "log_x.db").write_bytes(b"live")
+    (tmp_path / f"snapshot_x_{TS}.db").write_bytes(b"")  # Reserved, never written
+    (tmp_path / f"log_x_{TS}.db-wal").write_bytes(b"wal")
+    assert recover(outbox, tmp_path) == ([], {})
+
+
+def test_recover_orphans_skips_queued_files(tmp_path, outbox):
+    path = tmp_path / f"log_a_{TS}.db.gz"
+    path.write_bytes(b"gz")
+    outbox.add({"site": "a", "path": str(path)})
+    assert outbox.recover_orphans(str(tmp_path), lambda path, site: None) == 0
+    assert outbox.pending() == 1
+
+
+def test_mark_failed_backs_off_then_gives_up(outbox):
+    outbox.add({"site": "a", "path": "/tmp/a.db.gz"})
+    [(row_id, _, attempts)] = outbox.due(10)
+    assert outbox.mark_failed(row_id, attempts) == 5.0
+    assert outbox.due(10) == []
+    assert outbox.mark_failed(row_id, 1) == 10.0
+    assert outbox.mark_failed(row_id, 2) is None
+    assert outbox.pending() == 0
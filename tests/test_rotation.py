@@ -0,0 +1,37 @@
+import time
+from core.rotation import DeadlineHeap, RotationPolicy, estimate_row_bytes
+
+
+def test_with_defaults_fills_only_unset_limits():
+    default = RotationPolicy(max_rows=1000, max_bytes=10_000, max_age=3600, min_interval=60)
+    policy = RotationPolicy.from_dict({"max_rows": 50, "max_age": 0}).with_defaults(default)
+    assert (policy.max_rows, policy.max_bytes, policy.max_age, policy.min_interval) == (
+        50,
+        10_000,
+        0,  # 0 disables the default age limit
+        60,
+    )
+
+
+def test_size_reason():
+    policy = RotationPolicy(max_rows=10, max_bytes=1000)
+    assert policy.size_reason(9, 999) is None
+    assert policy.size_reason(10, 0) == "Limit Reached"
+    assert policy.size_reason(0, 1000) == "Size Limit Reached"
+    assert RotationPolicy().size_reason(10**9, 10**12) is None
+
+
+def test_estimate_row_bytes_counts_text():
+    rows = [("abc", 200, None, "de"), ("", 1.5)]
+    assert estimate_row_bytes(rows) == (40 + 5) + 40
+
+
+def test_deadline_heap_pops_due_timers_in_order():
+    heap = DeadlineHeap()
+    assert heap.next_in() is None
+    now = time.time()
+    heap.push(now + 3600, "later", 1, "Age Limit Reached")
+    heap.push(now - 5, "b", 2, "Age Limit Reached")
+    heap.push(now - 10, "a", 3, "Age Limit Reached")
+    assert list(heap.pop_due()) == [("a", 3, "Age Limit Reached"), ("b", 2, "Age Limit Reached")]
+    assert 3590 < heap.next_in() <= 3600